@@ -0,0 +1,17 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['mobile', 'is_verified', 'expires_at'], name='accounts_ot_mobile_e34221_idx'),
+        ),
+    ]
@@ -9,6 +9,7 @@ from .serializers import (
     UserProfileSerializer, AddressSerializer
 )
 from .models import Address
+from cart.guest import merge_into_user_cart
 
 User = get_user_model()
 
@@ -18,6 +19,7 @@ def register(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
+        merge_into_user_cart(request, user)
         refresh = RefreshToken.for_user(user)
         return Response({
             'success': True,
@@ -39,6 +41,7 @@ def login(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
+        merge_into_user_cart(request, user)
         refresh = RefreshToken.for_user(user)
         return Response({
             'success': True,
@@ -81,6 +84,7 @@ def verify_otp(request):
             user = User.objects.get(mobile=mobile)
             user.is_mobile_verified = True
             user.save()
+            merge_into_user_cart(request, user)
             
             refresh = RefreshToken.for_user(user)
             return Response({
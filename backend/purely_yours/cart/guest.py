@@ -0,0 +1,130 @@
+"""
+Carts for visitors who have not signed in, kept in the cache instead of the
+database so anonymous browsing never writes cart rows.
+
+A guest cart is addressed by a signed token that the client sends back in
+the X-Cart-Token header. It holds only (product_id, variant_id, quantity)
+lines and expires GUEST_CART_TIMEOUT seconds after its last change. At
+login the lines are merged into the user's Cart with one bulk write and the
+cache entry is dropped.
+"""
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+from orders.pricing import PriceSnapshot, PricingError, quote
+from products.models import Product
+from products.serializers import ProductListSerializer, ProductVariantSerializer
+from . import operations
+
+TOKEN_HEADER = 'HTTP_X_CART_TOKEN'
+KEY_PREFIX = 'cart:guest'
+signer = signing.Signer(salt='cart.guest')
+
+
+def get_cache():
+    return caches[settings.GUEST_CART_CACHE_ALIAS]
+
+
+def token_from(request):
+    return request.META.get(TOKEN_HEADER) or request.data.get('cart_token', '')
+
+
+class GuestCart:
+    def __init__(self, token, lines=None):
+        self.token = token
+        self.lines = lines or {}
+
+    @classmethod
+    def for_request(cls, request):
+        """The cart named by the request's token, or a new empty one if it has none or a bad one"""
+        token = token_from(request)
+        try:
+            cart_id = signer.unsign(token)
+        except signing.BadSignature:
+            return cls(signer.sign(uuid.uuid4().hex))
+        stored = get_cache().get(f'{KEY_PREFIX}:{cart_id}') or []
+        return cls(token, {(product_id, variant_id): quantity for product_id, variant_id, quantity in stored})
+
+    @property
+    def key(self):
+        return f'{KEY_PREFIX}:{signer.unsign(self.token)}'
+
+    def update(self, quantities, mode='add'):
+        for key, quantity in quantities.items():
+            quantity += self.lines.get(key, 0) if mode == 'add' else 0
+            if quantity:
+                self.lines[key] = quantity
+            else:
+                self.lines.pop(key, None)
+        self.save()
+
+    def save(self):
+        """Store the lines, restarting the expiry"""
+        lines = [[product_id, variant_id, quantity] for (product_id, variant_id), quantity in self.lines.items()]
+        get_cache().set(self.key, lines, settings.GUEST_CART_TIMEOUT)
+
+    def clear(self):
+        self.lines = {}
+        get_cache().delete(self.key)
+
+    def totals(self, snapshot=None):
+        """Item count and subtotal at current prices, skipping lines that can no longer be bought"""
+        if snapshot is None:
+            snapshot = self.snapshot()
+        lines = [(product_id, variant_id, quantity) for (product_id, variant_id), quantity in self.lines.items()]
+        return {
+            'total_items': sum(self.lines.values()),
+            'total_amount': quote(lines, snapshot).subtotal,
+        }
+
+    def snapshot(self):
+        """Prices for the lines, after dropping any that are no longer available"""
+        try:
+            products, variants = operations.validate(self.lines)
+        except PricingError as e:
+            for product_id, variant_id in list(self.lines):
+                if product_id in e.product_ids or variant_id in e.variant_ids:
+                    del self.lines[(product_id, variant_id)]
+            self.save()
+            products, variants = operations.validate(self.lines) if self.lines else ({}, {})
+        return PriceSnapshot(products.values(), variants.values())
+
+    def render(self, request):
+        """The cart in the shape CartSerializer uses, with the token in place of an id"""
+        snapshot = self.snapshot()
+        totals = self.totals(snapshot)
+        products = Product.objects.filter(pk__in=snapshot.products).for_listing()
+        products = {product.pk: product for product in products}
+        variants = snapshot.variants
+        context = {'request': request}
+        items = []
+        for (product_id, variant_id), quantity in self.lines.items():
+            variant = variants.get(variant_id)
+            unit_price = variant.price if variant else products[product_id].price
+            items.append({
+                'product': ProductListSerializer(products[product_id], context=context).data,
+                'variant': ProductVariantSerializer(variant).data if variant else None,
+                'quantity': quantity,
+                'total_price': unit_price * quantity,
+            })
+        return {'token': self.token, 'items': items, **totals}
+
+
+def merge_into_user_cart(request, user):
+    """
+    Add the request's guest cart, if any, to the user's cart and drop it.
+    Lines that can no longer be bought are left out. Returns how many
+    lines were merged.
+    """
+    guest = GuestCart.for_request(request)
+    if not guest.lines:
+        return 0
+    guest.snapshot()  # drops unavailable lines
+    merged = 0
+    if guest.lines:
+        _, merged = operations.apply(user, dict(guest.lines), 'add')
+    guest.clear()
+    return merged
@@ -1,30 +1,91 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
-from products.models import Product, ProductVariant
+from products.models import Product, ProductVariant, listing_prefetches
 
 User = get_user_model()
 
+TOTALS_FIELDS = ['totals_version', 'stored_totals_version', 'stored_total_items', 'stored_total_amount']
+
+
+def line_total():
+    """A cart line's price in SQL: the variant's price if it has one, else the product's"""
+    return models.ExpressionWrapper(
+        Coalesce('variant__price', 'product__price') * models.F('quantity'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+def invalidate_totals(cart_id):
+    """Mark a cart's stored totals stale, in the transaction that changes its items"""
+    Cart.objects.filter(pk=cart_id).invalidate_totals()
+
+class CartItemQuerySet(models.QuerySet):
+    def with_line_totals(self):
+        return self.annotate(line_total=line_total())
+
+class CartQuerySet(models.QuerySet):
+    def invalidate_totals(self):
+        return self.update(totals_version=models.F('totals_version') + 1)
+
+    def for_display(self):
+        """Carts with everything CartSerializer reads, in a fixed number of queries"""
+        return self.prefetch_related(
+            models.Prefetch(
+                'items',
+                queryset=CartItem.objects.with_line_totals().select_related('product', 'variant').prefetch_related(
+                    *listing_prefetches('product__')
+                )
+            )
+        )
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Totals as of stored_totals_version; anything that changes them bumps totals_version
+    totals_version = models.PositiveIntegerField(default=0)
+    stored_totals_version = models.PositiveIntegerField(blank=True, null=True)
+    stored_total_items = models.PositiveIntegerField(default=0)
+    stored_total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    objects = CartQuerySet.as_manager()
 
     def __str__(self):
         return f"Cart for {self.user.email}"
 
+    def totals(self, refresh=True):
+        """
+        Item count and subtotal of the lines checkout would accept, priced by
+        orders.pricing. They are stored on the cart row and recomputed only
+        after its items or the prices of its products change. refresh=False
+        trusts the totals fields as this instance loaded them.
+        """
+        if refresh:
+            self.refresh_from_db(fields=TOTALS_FIELDS)
+        if self.stored_totals_version != self.totals_version:
+            from orders.pricing import PriceSnapshot, quote
+            lines = list(self.items.values_list('product_id', 'variant_id', 'quantity'))
+            snapshot = PriceSnapshot.for_lines(lines)
+            lines = snapshot.available(lines)
+            self.stored_total_items = sum(quantity for _, _, quantity in lines)
+            self.stored_total_amount = quote(lines, snapshot).subtotal
+            self.stored_totals_version = self.totals_version
+            # Kept only if nothing changed the cart while it was being priced
+            Cart.objects.filter(pk=self.pk, totals_version=self.totals_version).update(
+                stored_totals_version=self.totals_version,
+                stored_total_items=self.stored_total_items,
+                stored_total_amount=self.stored_total_amount,
+            )
+        return {'total_items': self.stored_total_items, 'total_amount': self.stored_total_amount}
+
     @property
     def total_items(self):
-        return self.items.aggregate(total=models.Sum('quantity'))['total'] or 0
+        return self.totals(refresh=False)['total_items']
 
     @property
     def total_amount(self):
-        total = 0
-        for item in self.items.all():
-            if item.variant:
-                total += item.variant.price * item.quantity
-            else:
-                total += item.product.price * item.quantity
-        return total
+        return self.totals(refresh=False)['total_amount']
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -34,6 +95,8 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ['cart', 'product', 'variant']
 
@@ -42,7 +105,13 @@ class CartItem(models.Model):
         return f"{self.product.name}{variant_name} x {self.quantity}"
 
     @property
-    def total_price(self):
+    def unit_price(self):
         if self.variant:
-            return self.variant.price * self.quantity
-        return self.product.price * self.quantity
+            return self.variant.price
+        return self.product.price
+
+    @property
+    def total_price(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
+        return self.unit_price * self.quantity
@@ -0,0 +1,86 @@
+"""
+Validation and bulk application of {product_id, variant_id, quantity} cart
+operations, shared by the batch endpoint, guest carts and the merge at login.
+
+Quantities are keyed by (product_id, variant_id). In 'add' mode they are
+added to what the cart holds; in 'set' mode they replace it and 0 removes
+the line.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from orders.pricing import PricingError
+from products.models import Product, ProductVariant
+from .models import Cart, CartItem, invalidate_totals
+
+MODES = ['add', 'set']
+
+
+def collect(operations, mode='add'):
+    """Key operations by (product_id, variant_id); repeats add up, or the last wins in 'set' mode"""
+    quantities = {}
+    for operation in operations:
+        key = (operation['product_id'], operation.get('variant_id') or None)
+        quantities[key] = operation['quantity'] + (quantities.get(key, 0) if mode == 'add' else 0)
+    return quantities
+
+
+def validate(quantities):
+    """
+    Check every line against active products and variants in two queries.
+    Raises PricingError naming the unavailable ids.
+    """
+    product_ids = {product_id for product_id, _ in quantities}
+    variant_ids = {variant_id for _, variant_id in quantities if variant_id}
+    products = Product.objects.filter(is_active=True).in_bulk(product_ids)
+    variants = ProductVariant.objects.filter(is_active=True).in_bulk(variant_ids) if variant_ids else {}
+    missing_products = product_ids - set(products)
+    missing_variants = {
+        variant_id for product_id, variant_id in quantities
+        if variant_id and (variant_id not in variants or variants[variant_id].product_id != product_id)
+    }
+    if missing_products or missing_variants:
+        raise PricingError('Some items are no longer available', missing_products, missing_variants)
+    return products, variants
+
+
+def apply(user, quantities, mode='add'):
+    """
+    Write validated quantities to the user's cart in one transaction and
+    return (cart, number of lines changed).
+    """
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        existing = {}
+        if not created:
+            # unique_together cannot upsert lines without a variant (NULLs never conflict),
+            # so read the affected lines once and write the changes in bulk
+            product_ids = {product_id for product_id, _ in quantities}
+            for item in cart.items.select_for_update().filter(product_id__in=product_ids):
+                existing[(item.product_id, item.variant_id)] = item
+
+        now = timezone.now()
+        to_create, to_update, to_delete = [], [], []
+        for (product_id, variant_id), quantity in quantities.items():
+            item = existing.get((product_id, variant_id))
+            if item is None:
+                if quantity:
+                    to_create.append(CartItem(
+                        cart=cart, product_id=product_id, variant_id=variant_id, quantity=quantity
+                    ))
+            elif mode == 'set' and quantity == 0:
+                to_delete.append(item.pk)
+            elif quantity or mode == 'set':
+                item.quantity = item.quantity + quantity if mode == 'add' else quantity
+                item.updated_at = now
+                to_update.append(item)
+
+        CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity', 'updated_at'])
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        # Bulk writes send no signals
+        invalidate_totals(cart.pk)
+
+    return cart, len(to_create) + len(to_update) + len(to_delete)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Cart, CartItem
+from . import operations
 from products.serializers import ProductListSerializer, ProductVariantSerializer
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -11,6 +12,17 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'product', 'variant', 'quantity', 'total_price', 'created_at']
 
+class CartLineSerializer(serializers.ModelSerializer):
+    """The changed line in compact mutation responses: ids, quantity and prices"""
+    product_id = serializers.ReadOnlyField()
+    variant_id = serializers.ReadOnlyField()
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product_id', 'variant_id', 'quantity', 'unit_price', 'total_price']
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.ReadOnlyField()
@@ -27,3 +39,12 @@ class AddToCartSerializer(serializers.Serializer):
 
 class UpdateCartItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=0)
+
+class CartOperationSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    variant_id = serializers.IntegerField(required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=0)
+
+class BatchCartSerializer(serializers.Serializer):
+    items = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+    mode = serializers.ChoiceField(choices=operations.MODES, default='add')
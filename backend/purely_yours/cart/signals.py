@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products.models import Product, ProductVariant
+from .models import Cart, CartItem, invalidate_totals
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_totals(sender, instance, **kwargs):
+    invalidate_totals(instance.cart_id)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_cart_totals(sender, instance, **kwargs):
+    # Deleting a product deletes its cart lines, which invalidates through CartItem
+    Cart.objects.filter(items__product=instance).invalidate_totals()
+
+
+@receiver(post_save, sender=ProductVariant)
+def invalidate_variant_cart_totals(sender, instance, **kwargs):
+    Cart.objects.filter(items__variant=instance).invalidate_totals()
@@ -1,3 +1,262 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from orders import pricing
+from products.models import Product, ProductImage, ProductTag, ProductTagAssignment, ProductVariant
+from products.testing import make_product
+from .models import Cart, CartItem, invalidate_totals
+
+User = get_user_model()
+
+
+class CartResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pricing.get_rules()
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        tag = ProductTag.objects.create(name='Vegan', slug='vegan')
+        self.products = []
+        for i in range(12):
+            product = make_product(f'product-{i}')
+            ProductImage.objects.create(product=product, image=f'products/product-{i}.webp', is_primary=True)
+            ProductTagAssignment.objects.create(product=product, tag=tag)
+            ProductVariant.objects.create(id=i + 1, product=product, name='Large', sku=f'SKU-{i}-L', price=150)
+            self.products.append(product)
+
+    def fill_cart(self, count, start=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, product in enumerate(self.products[start:count], start):
+                CartItem.objects.create(cart=self.cart, product=product, variant_id=i + 1 if i % 2 else None)
+
+    def count_queries(self, method, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_full_cart_query_count_is_constant(self):
+        self.fill_cart(2)
+        small, _ = self.count_queries('get', '/api/cart/')
+        self.fill_cart(12, start=2)
+        large, response = self.count_queries('get', '/api/cart/')
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data['items']), 12)
+        self.assertEqual(response.data['total_items'], 12)
+        self.assertEqual(response.data['total_amount'], 6 * 100 + 6 * 150)
+        self.assertEqual(response.data['items'][0]['product']['tags'][0]['slug'], 'vegan')
+
+    def test_compact_add_returns_the_line_and_totals(self):
+        self.fill_cart(10)
+        payload = {'product_id': self.products[11].id, 'variant_id': 12, 'quantity': 2}
+        queries, response = self.count_queries('post', '/api/cart/add/?response=compact', payload)
+
+        self.assertNotIn('cart', response.data)
+        self.assertEqual(response.data['item']['variant_id'], 12)
+        self.assertEqual(response.data['item']['total_price'], '300.00')
+        self.assertEqual(response.data['totals'], {'total_items': 12, 'total_amount': 1550})
+        self.assertLessEqual(queries, 13)
+
+    def test_compact_update_and_remove(self):
+        self.fill_cart(3)
+        item = CartItem.objects.get(product=self.products[0])
+
+        _, response = self.count_queries('put', f'/api/cart/update/{item.id}/?response=compact', {'quantity': 4})
+        self.assertEqual(response.data['item']['quantity'], 4)
+        self.assertEqual(response.data['totals']['total_items'], 6)
+
+        _, response = self.count_queries('put', f'/api/cart/update/{item.id}/?response=compact', {'quantity': 0})
+        self.assertIsNone(response.data['item'])
+        self.assertEqual(response.data['removed_item_id'], item.id)
+
+        other = CartItem.objects.get(product=self.products[1])
+        _, response = self.count_queries('delete', f'/api/cart/remove/{other.id}/?response=compact')
+        self.assertEqual(response.data['removed_item_id'], other.id)
+        self.assertEqual(response.data['totals'], {'total_items': 1, 'total_amount': 100})
+
+    def test_mutations_still_return_the_full_cart_by_default(self):
+        self.fill_cart(1)
+        _, response = self.count_queries('delete', '/api/cart/clear/')
+        self.assertEqual(response.data['cart']['items'], [])
+        self.assertEqual(response.data['cart']['total_amount'], 0)
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pricing.get_rules()
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.product = make_product()
+        self.variant = ProductVariant.objects.create(id=1, product=self.product, name='Large', sku='OIL-L', price=250)
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+            CartItem.objects.create(cart=self.cart, product=self.product, variant=self.variant, quantity=1)
+
+    def test_totals_are_priced_once_then_stored_on_the_cart(self):
+        # the row, the lines, the product and variant prices, then storing the totals
+        with self.assertNumQueries(5):
+            self.assertEqual(self.cart.totals(), {'total_items': 3, 'total_amount': Decimal('450.00')})
+        with self.assertNumQueries(1):
+            self.assertEqual(Cart.objects.get(pk=self.cart.pk).totals(refresh=False)['total_items'], 3)
+
+    def test_stored_totals_are_shared_between_processes(self):
+        self.cart.totals()
+        # Another process has its own cache but the same database
+        Cart.objects.filter(pk=self.cart.pk).update(stored_total_items=9)
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).totals()['total_items'], 9)
+
+    def test_totals_priced_while_the_cart_changed_are_not_stored(self):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        # Another request changes the cart after this one read its version
+        CartItem.objects.filter(variant=self.variant).update(quantity=4)
+        invalidate_totals(self.cart.pk)
+        cart.totals(refresh=False)
+        self.assertIsNone(Cart.objects.get(pk=self.cart.pk).stored_totals_version)
+        self.assertEqual(self.cart.totals()['total_items'], 6)
+
+    def test_totals_leave_out_what_checkout_would_reject(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.is_active = False
+            self.variant.save()
+        self.assertEqual(self.cart.totals(), {'total_items': 2, 'total_amount': Decimal('200.00')})
+
+    def test_summary_badge(self):
+        self.cart.totals()
+        with self.assertNumQueries(1):  # only the cart lookup
+            response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.data['totals']['total_items'], 3)
+
+    def test_item_and_price_changes_invalidate(self):
+        self.cart.totals()
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.filter(variant=self.variant).get().delete()
+        self.assertEqual(self.cart.totals()['total_items'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 120
+            self.product.save()
+        self.assertEqual(self.cart.totals()['total_amount'], Decimal('240.00'))
+
+
+class BatchCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pricing.get_rules()
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = []
+        for i in range(20):
+            product = make_product(f'product-{i}')
+            ProductVariant.objects.create(id=i + 1, product=product, name='Large', sku=f'SKU-{i}-L', price=150)
+            self.products.append(product)
+
+    def batch(self, items, mode='add', compact=True):
+        url = '/api/cart/batch/?response=compact' if compact else '/api/cart/batch/'
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'items': items, 'mode': mode}, format='json')
+        return response, len(ctx.captured_queries)
+
+    def operations(self, count, quantity=1):
+        return [
+            {'product_id': product.id, 'variant_id': i + 1 if i % 2 else None, 'quantity': quantity}
+            for i, product in enumerate(self.products[:count])
+        ]
+
+    def test_query_count_does_not_grow_with_items(self):
+        Cart.objects.create(user=self.user)
+        _, small = self.batch(self.operations(2))
+        CartItem.objects.all().delete()
+        response, large = self.batch(self.operations(20))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['totals'], {'total_items': 20, 'total_amount': 2500})
+
+    def test_add_merges_and_set_replaces(self):
+        self.batch(self.operations(3))
+        response, _ = self.batch(self.operations(3) + self.operations(1), compact=False)
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['cart']['items']}
+        self.assertEqual(quantities, {self.products[0].id: 3, self.products[1].id: 2, self.products[2].id: 2})
+
+        operations = self.operations(2, quantity=5)
+        operations[1]['quantity'] = 0
+        response, _ = self.batch(operations, mode='set')
+        self.assertEqual(response.data['totals']['total_items'], 7)
+        self.assertFalse(CartItem.objects.filter(product=self.products[1]).exists())
+
+    def test_invalid_lines_reject_the_whole_batch(self):
+        Product.objects.filter(pk=self.products[1].pk).update(is_active=False)
+        operations = self.operations(3)
+        operations[2]['variant_id'] = 1  # belongs to product 0
+        response, _ = self.batch(operations)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['errors'], {'product_ids': [self.products[1].id], 'variant_ids': [1]})
+        self.assertFalse(CartItem.objects.exists())
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = make_product()
+        self.variant = ProductVariant.objects.create(id=1, product=self.product, name='Large', sku='OIL-L', price=250)
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+
+    def add(self, token, items, mode='add'):
+        return self.client.post(
+            '/api/cart/guest/items/', {'items': items, 'mode': mode}, format='json', HTTP_X_CART_TOKEN=token
+        )
+
+    def test_guest_cart_lives_in_the_cache(self):
+        token = self.client.get('/api/cart/guest/').data['cart']['token']
+        with self.assertNumQueries(4):  # validation and pricing reads, no writes
+            response = self.client.post(
+                '/api/cart/guest/items/?response=compact',
+                {'items': [{'product_id': self.product.id, 'quantity': 2},
+                           {'product_id': self.product.id, 'variant_id': 1, 'quantity': 1}]},
+                format='json', HTTP_X_CART_TOKEN=token
+            )
+        self.assertEqual(response.data['cart']['total_amount'], 450)
+        self.assertFalse(Cart.objects.exists())
+
+        cart = self.client.get('/api/cart/guest/', HTTP_X_CART_TOKEN=token).data['cart']
+        self.assertEqual(cart['token'], token)
+        self.assertEqual(len(cart['items']), 2)
+        self.assertEqual(cart['total_items'], 3)
+
+    def test_tampered_tokens_get_a_fresh_cart(self):
+        token = self.client.get('/api/cart/guest/').data['cart']['token']
+        self.add(token, [{'product_id': self.product.id, 'quantity': 1}])
+
+        cart = self.client.get('/api/cart/guest/', HTTP_X_CART_TOKEN=token[:-1] + 'x').data['cart']
+        self.assertNotEqual(cart['token'], token)
+        self.assertEqual(cart['items'], [])
+
+    def test_login_merges_the_guest_cart(self):
+        token = self.client.get('/api/cart/guest/').data['cart']['token']
+        self.add(token, [{'product_id': self.product.id, 'quantity': 2},
+                         {'product_id': self.product.id, 'variant_id': 1, 'quantity': 1}])
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=self.product, quantity=1)
+        ProductVariant.objects.filter(pk=1).update(is_active=False)
+
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass'},
+            format='json', HTTP_X_CART_TOKEN=token
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(CartItem.objects.values_list('variant', 'quantity')), [(None, 3)])
+        self.assertEqual(self.client.get('/api/cart/guest/', HTTP_X_CART_TOKEN=token).data['cart']['items'], [])
@@ -3,7 +3,12 @@ from . import views
 
 urlpatterns = [
     path('', views.CartView.as_view(), name='cart'),
+    path('summary/', views.cart_summary, name='cart_summary'),
     path('add/', views.add_to_cart, name='add_to_cart'),
+    path('batch/', views.batch_update_cart, name='batch_update_cart'),
+    path('guest/', views.guest_cart, name='guest_cart'),
+    path('guest/items/', views.update_guest_cart, name='update_guest_cart'),
+    path('merge/', views.merge_guest_cart, name='merge_guest_cart'),
     path('update/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
     path('remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('clear/', views.clear_cart, name='clear_cart'),
@@ -2,18 +2,57 @@ from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from .models import Cart, CartItem
-from .serializers import CartSerializer, AddToCartSerializer, UpdateCartItemSerializer
+from .models import TOTALS_FIELDS, Cart, CartItem
+from . import operations
+from .guest import GuestCart, merge_into_user_cart
+from .serializers import (
+    CartSerializer, CartLineSerializer, AddToCartSerializer, BatchCartSerializer, UpdateCartItemSerializer
+)
 from products.models import Product, ProductVariant
+from orders.pricing import PricingError
+
+def cart_response(request, cart, message, item=None, removed_item_id=None):
+    """
+    The whole cart by default. With ?response=compact, only the changed line
+    (or the id of the removed one) and the recomputed totals.
+    """
+    if request.query_params.get('response') == 'compact':
+        data = {
+            'success': True,
+            'message': message,
+            'item': CartLineSerializer(item).data if item is not None else None,
+            'totals': cart.totals(),
+        }
+        if removed_item_id is not None:
+            data['removed_item_id'] = removed_item_id
+        return Response(data)
+
+    cart = Cart.objects.for_display().get(pk=cart.pk)
+    return Response({
+        'success': True,
+        'message': message,
+        'cart': CartSerializer(cart, context={'request': request}).data
+    })
 
 class CartView(generics.RetrieveAPIView):
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
+        cart, created = Cart.objects.for_display().get_or_create(user=self.request.user)
         return cart
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def cart_summary(request):
+    """Item count and subtotal for the header badge, served from the totals stored on the cart"""
+    cart = Cart.objects.filter(user=request.user).only('pk', *TOTALS_FIELDS).first()
+    totals = cart.totals(refresh=False) if cart else {'total_items': 0, 'total_amount': 0}
+    return Response({
+        'success': True,
+        'totals': totals
+    })
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def add_to_cart(request):
@@ -41,17 +80,43 @@ def add_to_cart(request):
             cart_item.quantity += quantity
             cart_item.save()
 
-        return Response({
-            'success': True,
-            'message': 'Item added to cart successfully',
-            'cart': CartSerializer(cart, context={'request': request}).data
-        })
+        return cart_response(request, cart, 'Item added to cart successfully', item=cart_item)
     
     return Response({
         'success': False,
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_update_cart(request):
+    """
+    Apply many {product_id, variant_id, quantity} operations at once, e.g.
+    when syncing a guest cart after login. In 'add' mode quantities are
+    added to what is already in the cart; in 'set' mode they replace it and
+    0 removes the line. Everything is validated before anything is written.
+    """
+    serializer = BatchCartSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    mode = serializer.validated_data['mode']
+    quantities = operations.collect(serializer.validated_data['items'], mode)
+    try:
+        operations.validate(quantities)
+    except PricingError as e:
+        return Response({
+            'success': False,
+            'message': str(e),
+            'errors': {'product_ids': e.product_ids, 'variant_ids': e.variant_ids}
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    cart, changed = operations.apply(request.user, quantities, mode)
+    return cart_response(request, cart, f'{changed} cart items updated')
+
 @api_view(['PUT'])
 @permission_classes([permissions.IsAuthenticated])
 def update_cart_item(request, item_id):
@@ -60,25 +125,18 @@ def update_cart_item(request, item_id):
         quantity = serializer.validated_data['quantity']
         
         try:
-            cart_item = CartItem.objects.get(
+            cart_item = CartItem.objects.select_related('cart', 'product', 'variant').get(
                 id=item_id,
                 cart__user=request.user
             )
             
             if quantity == 0:
                 cart_item.delete()
-                message = 'Item removed from cart'
-            else:
-                cart_item.quantity = quantity
-                cart_item.save()
-                message = 'Cart item updated successfully'
-            
-            cart = Cart.objects.get(user=request.user)
-            return Response({
-                'success': True,
-                'message': message,
-                'cart': CartSerializer(cart, context={'request': request}).data
-            })
+                return cart_response(request, cart_item.cart, 'Item removed from cart', removed_item_id=item_id)
+
+            cart_item.quantity = quantity
+            cart_item.save()
+            return cart_response(request, cart_item.cart, 'Cart item updated successfully', item=cart_item)
             
         except CartItem.DoesNotExist:
             return Response({
@@ -95,18 +153,13 @@ def update_cart_item(request, item_id):
 @permission_classes([permissions.IsAuthenticated])
 def remove_from_cart(request, item_id):
     try:
-        cart_item = CartItem.objects.get(
+        cart_item = CartItem.objects.select_related('cart').get(
             id=item_id,
             cart__user=request.user
         )
         cart_item.delete()
         
-        cart = Cart.objects.get(user=request.user)
-        return Response({
-            'success': True,
-            'message': 'Item removed from cart',
-            'cart': CartSerializer(cart, context={'request': request}).data
-        })
+        return cart_response(request, cart_item.cart, 'Item removed from cart', removed_item_id=item_id)
         
     except CartItem.DoesNotExist:
         return Response({
@@ -121,11 +174,7 @@ def clear_cart(request):
         cart = Cart.objects.get(user=request.user)
         cart.items.all().delete()
         
-        return Response({
-            'success': True,
-            'message': 'Cart cleared successfully',
-            'cart': CartSerializer(cart, context={'request': request}).data
-        })
+        return cart_response(request, cart, 'Cart cleared successfully')
         
     except Cart.DoesNotExist:
         return Response({
@@ -133,3 +182,63 @@ def clear_cart(request):
             'message': 'Cart is already empty'
         })
 
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([permissions.AllowAny])
+def guest_cart(request):
+    """
+    The cart of a visitor who is not signed in, named by the X-Cart-Token
+    header. A request without a valid token gets a new empty cart and token.
+    """
+    cart = GuestCart.for_request(request)
+    if request.method == 'DELETE':
+        cart.clear()
+        message = 'Cart cleared successfully'
+    else:
+        message = 'Cart retrieved successfully'
+    return Response({
+        'success': True,
+        'message': message,
+        'cart': cart.render(request)
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def update_guest_cart(request):
+    """Apply {product_id, variant_id, quantity} operations to a guest cart, as the batch endpoint does"""
+    serializer = BatchCartSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    mode = serializer.validated_data['mode']
+    quantities = operations.collect(serializer.validated_data['items'], mode)
+    try:
+        operations.validate(quantities)
+    except PricingError as e:
+        return Response({
+            'success': False,
+            'message': str(e),
+            'errors': {'product_ids': e.product_ids, 'variant_ids': e.variant_ids}
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    cart = GuestCart.for_request(request)
+    cart.update(quantities, mode)
+    if request.query_params.get('response') == 'compact':
+        data = {'token': cart.token, **cart.totals()}
+    else:
+        data = cart.render(request)
+    return Response({
+        'success': True,
+        'message': 'Cart updated successfully',
+        'cart': data
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def merge_guest_cart(request):
+    """Move a guest cart into the signed-in user's cart; login does this automatically"""
+    merged = merge_into_user_cart(request, request.user)
+    return cart_response(request, Cart.objects.get_or_create(user=request.user)[0], f'{merged} cart items merged')
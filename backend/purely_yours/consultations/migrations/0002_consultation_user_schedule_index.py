@@ -0,0 +1,19 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultations', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['user', '-scheduled_date', '-scheduled_time'], name='consultatio_user_id_6bd77a_idx'),
+        ),
+    ]
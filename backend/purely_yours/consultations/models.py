@@ -104,6 +104,9 @@ class Consultation(models.Model):
 
     class Meta:
         ordering = ['-scheduled_date', '-scheduled_time']
+        indexes = [
+            models.Index(fields=['user', '-scheduled_date', '-scheduled_time']),
+        ]
 
     def __str__(self):
         return f"Consultation with Dr. {self.doctor.name} on {self.scheduled_date}"
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, OrderStatusHistory
+from .models import Order, OrderItem, OrderStatusHistory, ShippingRule, StockReservation, TaxRule
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -9,12 +9,18 @@ class OrderStatusHistoryInline(admin.TabularInline):
     model = OrderStatusHistory
     extra = 0
 
+class StockReservationInline(admin.TabularInline):
+    model = StockReservation
+    extra = 0
+    can_delete = False
+    readonly_fields = ('product', 'variant', 'quantity', 'status', 'expires_at', 'created_at', 'released_at')
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('order_number', 'user', 'status', 'payment_status', 'total_amount', 'created_at')
     list_filter = ('status', 'payment_status', 'payment_method', 'created_at')
     search_fields = ('order_number', 'user__email', 'shipping_name')
-    inlines = [OrderItemInline, OrderStatusHistoryInline]
+    inlines = [OrderItemInline, OrderStatusHistoryInline, StockReservationInline]
     readonly_fields = ('order_number', 'created_at', 'updated_at')
 
 @admin.register(OrderItem)
@@ -28,3 +34,13 @@ class OrderStatusHistoryAdmin(admin.ModelAdmin):
     list_display = ('order', 'status', 'created_at', 'created_by')
     list_filter = ('status', 'created_at')
     search_fields = ('order__order_number',)
+
+@admin.register(ShippingRule)
+class ShippingRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'min_subtotal', 'max_subtotal', 'charge', 'is_active')
+    list_filter = ('is_active',)
+
+@admin.register(TaxRule)
+class TaxRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'rate', 'is_active')
+    list_filter = ('is_active',)
@@ -0,0 +1,241 @@
+"""
+Stock reservations for orders.
+
+Stock is taken with one conditional UPDATE per table (stock_quantity - n
+WHERE stock_quantity >= n for every row), so two checkouts racing for the
+last unit cannot both succeed on any backend: the database applies the
+updates one at a time and the loser's statement misses the row. Backends
+with SELECT ... FOR UPDATE lock the rows in primary key order first, so
+concurrent orders for overlapping items cannot deadlock. A reservation
+changes status with a conditional UPDATE too, so stock is returned at most
+once however many cancellations, webhooks and expiry runs race for it.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from products import cache as catalog_cache
+from products.models import Product, ProductVariant
+from .models import Order, OrderStatusHistory, StockReservation
+
+
+class OutOfStock(Exception):
+    """Raised when some lines ask for more than is left in stock"""
+
+    def __init__(self, message, product_ids=(), variant_ids=()):
+        super().__init__(message)
+        self.product_ids = sorted(product_ids)
+        self.variant_ids = sorted(variant_ids)
+
+
+def stock_quantities(lines):
+    """
+    Total quantity per product (lines without a variant) and per variant
+    for (product_id, variant_id, quantity, ...) lines, plus each variant's
+    product
+    """
+    products = Counter()
+    variants = Counter()
+    variant_products = {}
+    for product_id, variant_id, quantity, *_ in lines:
+        if variant_id:
+            variants[variant_id] += quantity
+            variant_products[variant_id] = product_id
+        else:
+            products[product_id] += quantity
+    return products, variants, variant_products
+
+
+def take_stock(model, quantities):
+    """Decrement stock for {pk: quantity} in one statement; returns whether every row had enough"""
+    if not quantities:
+        return True
+    if connection.features.has_select_for_update:
+        list(model.objects.select_for_update().filter(pk__in=quantities).order_by('pk').values_list('pk'))
+    wanted = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=PositiveIntegerField()
+    )
+    # Touch updated_at so cached product versions move with the stock
+    changed = model.objects.filter(pk__in=quantities, stock_quantity__gte=wanted).update(
+        stock_quantity=F('stock_quantity') - wanted, updated_at=timezone.now()
+    )
+    return changed == len(quantities)
+
+
+def return_stock(model, pk, quantity):
+    model.objects.filter(pk=pk).update(stock_quantity=F('stock_quantity') + quantity, updated_at=timezone.now())
+
+
+def return_stock_bulk(model, quantities):
+    """Increment stock for {pk: quantity} in one statement"""
+    if not quantities:
+        return
+    returned = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=PositiveIntegerField()
+    )
+    model.objects.filter(pk__in=quantities).update(
+        stock_quantity=F('stock_quantity') + returned, updated_at=timezone.now()
+    )
+
+
+def short_lines(model, quantities):
+    """The pks in {pk: quantity} that do not have enough stock left"""
+    available = dict(model.objects.filter(pk__in=quantities).values_list('pk', 'stock_quantity'))
+    return {pk for pk, quantity in quantities.items() if available.get(pk, 0) < quantity}
+
+
+def order_lines(order):
+    return order.items.values_list('product_id', 'variant_id', 'quantity')
+
+
+def reserve(order, lines, hold=True):
+    """
+    Take stock for the order's lines. Held reservations expire after
+    STOCK_RESERVATION_TIMEOUT seconds unless committed; pass hold=False for
+    orders that need no payment first. Raises OutOfStock naming the short
+    lines and leaves stock untouched.
+    """
+    products, variants, variant_products = stock_quantities(lines)
+    status = 'held' if hold else 'committed'
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TIMEOUT) if hold else None
+    reservations = [
+        StockReservation(order=order, product_id=product_id, quantity=quantity,
+                         status=status, expires_at=expires_at)
+        for product_id, quantity in products.items()
+    ] + [
+        StockReservation(order=order, product_id=variant_products[variant_id], variant_id=variant_id,
+                         quantity=quantity, status=status, expires_at=expires_at)
+        for variant_id, quantity in variants.items()
+    ]
+
+    try:
+        with transaction.atomic():
+            if not (take_stock(Product, products) and take_stock(ProductVariant, variants)):
+                # Leaving the block with an exception undoes any decrement above
+                raise OutOfStock('Some items are out of stock')
+            StockReservation.objects.bulk_create(reservations)
+    except OutOfStock as e:
+        raise OutOfStock(str(e), short_lines(Product, products), short_lines(ProductVariant, variants))
+
+    catalog_cache.invalidate_products({reservation.product_id for reservation in reservations})
+    return reservations
+
+
+def ensure_reserved(order):
+    """Reserve stock again for an order whose hold expired or was released"""
+    with transaction.atomic():
+        active = order.reservations.filter(status__in=['held', 'committed'])
+        if active.exists():
+            return list(active)
+        return reserve(order, order_lines(order))
+
+
+def commit(order):
+    """
+    Keep the order's stock for good once it is paid. A payment that arrives
+    after the hold expired takes the stock again if it can; otherwise the
+    shortage is recorded on the order for follow-up. Returns whether the
+    order has its stock.
+    """
+    with transaction.atomic():
+        if order.reservations.filter(status='held').update(status='committed', expires_at=None):
+            return True
+        if order.reservations.filter(status='committed').exists():
+            return True
+        try:
+            reserve(order, order_lines(order), hold=False)
+        except OutOfStock:
+            OrderStatusHistory.objects.create(
+                order=order,
+                status=order.status,
+                notes='Paid after the stock reservation expired; some items are out of stock'
+            )
+            return False
+        return True
+
+
+def release(order, statuses=('held', 'committed')):
+    """Return the order's reserved stock. Safe to call repeatedly or concurrently."""
+    released = []
+    now = timezone.now()
+    with transaction.atomic():
+        # Row locks where the backend has them; the conditional update below
+        # is what guarantees a reservation is only returned once
+        reservations = order.reservations.select_for_update().filter(status__in=statuses)
+        # Products before variants, as reserve() takes them
+        for reservation in reservations.order_by(F('variant').asc(nulls_first=True), 'product'):
+            flipped = StockReservation.objects.filter(
+                pk=reservation.pk, status=reservation.status
+            ).update(status='released', released_at=now)
+            if flipped:
+                if reservation.variant_id:
+                    return_stock(ProductVariant, reservation.variant_id, reservation.quantity)
+                else:
+                    return_stock(Product, reservation.product_id, reservation.quantity)
+                released.append(reservation)
+
+    catalog_cache.invalidate_products({reservation.product_id for reservation in released})
+    return released
+
+
+class ReleaseRaced(Exception):
+    """Some reservations changed status between being read and released"""
+
+
+def commit_orders(orders):
+    """commit() for many paid orders, with one UPDATE for those still holding their stock"""
+    with transaction.atomic():
+        StockReservation.objects.filter(order__in=orders, status='held').update(status='committed', expires_at=None)
+        covered = set(
+            StockReservation.objects.filter(order__in=orders, status='committed').values_list('order', flat=True)
+        )
+        for order in orders:
+            if order.pk not in covered:
+                commit(order)
+
+
+def release_orders(orders, statuses=('held', 'committed')):
+    """
+    release() for many orders: one UPDATE flips every reservation and one
+    per table returns the stock. If another release got to some of the
+    reservations first, the orders are released one by one instead.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            released = list(StockReservation.objects.select_for_update().filter(order__in=orders, status__in=statuses))
+            flipped = StockReservation.objects.filter(
+                pk__in=[reservation.pk for reservation in released], status__in=statuses
+            ).update(status='released', released_at=now)
+            if flipped != len(released):
+                raise ReleaseRaced()
+            products, variants, _ = stock_quantities(
+                (reservation.product_id, reservation.variant_id, reservation.quantity) for reservation in released
+            )
+            return_stock_bulk(Product, products)
+            return_stock_bulk(ProductVariant, variants)
+    except ReleaseRaced:
+        released = [reservation for order in orders for reservation in release(order, statuses)]
+        return released
+
+    catalog_cache.invalidate_products({reservation.product_id for reservation in released})
+    return released
+
+
+def release_expired(now=None):
+    """Release held reservations past their expiry; returns how many were released"""
+    now = now or timezone.now()
+    expired_orders = (
+        StockReservation.objects.filter(status='held', expires_at__lte=now)
+        .values_list('order', flat=True).distinct()
+    )
+    count = 0
+    for order in Order.objects.filter(pk__in=list(expired_orders)):
+        count += len(release(order, statuses=('held',)))
+    return count
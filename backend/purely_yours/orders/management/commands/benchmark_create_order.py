@@ -0,0 +1,75 @@
+from contextlib import redirect_stdout
+from io import StringIO
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from purely_yours.benchmark import benchmark_database, format_stats, measure
+
+SIZES = [1, 10, 100]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order creation through the API with 1, 10 and 100 line items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        from rest_framework.test import APIClient
+
+        with benchmark_database():
+            user, address, items = self.generate_catalog(max(SIZES))
+            client = APIClient()
+            client.force_authenticate(user)
+
+            for size in SIZES:
+                payload = {'address_id': address.id, 'payment_method': 'cod', 'items': items[:size]}
+
+                def place_order():
+                    response = client.post('/api/orders/create/', payload, format='json')
+                    assert response.status_code == 200, response.data
+
+                # The view prints its request payload; keep it out of the report
+                with redirect_stdout(StringIO()):
+                    # Requests reset the query log when they start, so begin from an empty one
+                    reset_queries()
+                    with CaptureQueriesContext(connection) as ctx:
+                        place_order()
+                    stats = measure(place_order, options['repeat'])
+                self.stdout.write(format_stats(
+                    f'{size:>3} items ({len(ctx.captured_queries)} queries)', stats
+                ))
+
+    def generate_catalog(self, count):
+        from django.contrib.auth import get_user_model
+        from accounts.models import Address
+        from products.models import Product, ProductImage, ProductVariant
+
+        user = get_user_model().objects.create_user(
+            email='benchmark@example.com', username='benchmark', password='benchmark'
+        )
+        address = Address.objects.create(
+            user=user, name='Benchmark', mobile='9999999999', address_line_1='Street',
+            city='Pune', state='MH', pincode='411001',
+        )
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', slug=f'product-{i}', description='', sku=f'SKU-{i}', price=100 + i,
+                    stock_quantity=1_000_000)
+            for i in range(count)
+        ])
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'products/product-{i}.webp', is_primary=True)
+            for i, product in enumerate(products)
+        ])
+        variants = ProductVariant.objects.bulk_create([
+            ProductVariant(id=i + 1, product=product, name='Large', sku=f'SKU-{i}-L', price=150 + i,
+                           stock_quantity=1_000_000)
+            for i, product in enumerate(products)
+        ])
+        items = [
+            {'product_id': product.id, 'variant_id': variant.id, 'quantity': 2, 'price': str(variant.price)}
+            for product, variant in zip(products, variants)
+        ]
+        return user, address, items
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from orders.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by unpaid orders whose reservation has expired; run it every few minutes'
+
+    def handle(self, *args, **options):
+        count = release_expired()
+        self.stdout.write(f'Released {count} expired stock reservation(s)')
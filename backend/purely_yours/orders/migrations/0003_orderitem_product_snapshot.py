@@ -0,0 +1,53 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+def backfill_product_snapshots(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    ProductImage = apps.get_model('products', 'ProductImage')
+
+    items = list(OrderItem.objects.filter(product_name='').select_related('product', 'variant'))
+    images = dict(
+        ProductImage.objects.filter(product_id__in={item.product_id for item in items}, is_primary=True)
+        .order_by('order').values_list('product_id', 'image')
+    )
+    for item in items:
+        item.product_name = item.product.name
+        item.product_slug = item.product.slug
+        item.product_image = images.get(item.product_id, '')
+        item.variant_name = item.variant.name if item.variant else ''
+    OrderItem.objects.bulk_update(
+        items, ['product_name', 'product_slug', 'product_image', 'variant_name'], batch_size=500
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_user_created_at_index'),
+        ('products', '0012_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_slug',
+            field=models.SlugField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(backfill_product_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:26
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def seed_pricing_rules(apps, schema_editor):
+    # The charges create_order used to hard-code
+    ShippingRule = apps.get_model('orders', 'ShippingRule')
+    TaxRule = apps.get_model('orders', 'TaxRule')
+    ShippingRule.objects.bulk_create([
+        ShippingRule(name='Standard shipping', min_subtotal=Decimal('0'), max_subtotal=Decimal('500'), charge=Decimal('50')),
+        ShippingRule(name='Free shipping', min_subtotal=Decimal('500'), charge=Decimal('0')),
+    ])
+    TaxRule.objects.create(name='GST', rate=Decimal('0.18'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_orderitem_product_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('min_subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('max_subtotal', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('charge', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['min_subtotal'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TaxRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RunPython(seed_pricing_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('allocated_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.10 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+def backfill_variant_original_prices(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    items = list(OrderItem.objects.filter(variant__isnull=False).select_related('variant'))
+    for item in items:
+        item.variant_original_price = item.variant.original_price
+    OrderItem.objects.bulk_update(items, ['variant_original_price'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_pricing_rule_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant_original_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_variant_original_prices, migrations.RunPython.noop),
+    ]
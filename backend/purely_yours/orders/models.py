@@ -1,10 +1,19 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from products.models import Product, ProductVariant
+from .numbering import next_order_number
 import uuid
 
 User = get_user_model()
 
+class OrderQuerySet(models.QuerySet):
+    def with_details(self):
+        """Orders with everything OrderSerializer reads, in a fixed number of queries"""
+        return self.prefetch_related(
+            'items',
+            'status_history',
+        )
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -66,19 +75,33 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"Order {self.order_number}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate order number
-            import random
-            self.order_number = f"PY{random.randint(100000, 999999)}"
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
+class OrderNumberBlock(models.Model):
+    """
+    One row per block of ORDER_NUMBER_BLOCK_SIZE order numbers. The
+    database hands out the primary keys, so blocks never overlap across
+    processes.
+    """
+    allocated_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Order number block {self.pk}"
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -87,10 +110,33 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at time of order
     total = models.DecimalField(max_digits=10, decimal_places=2)
 
+    # Product details at time of order, so listing orders needs no product queries
+    product_name = models.CharField(max_length=255, blank=True)
+    product_slug = models.SlugField(blank=True)
+    product_image = models.CharField(max_length=255, blank=True)  # Storage name of the primary image
+    variant_name = models.CharField(max_length=100, blank=True)
+    variant_original_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+
     def save(self, *args, **kwargs):
         self.total = self.price * self.quantity
+        if not self.product_name:
+            self.capture_snapshot()
         super().save(*args, **kwargs)
 
+    def capture_snapshot(self, image_name=None):
+        """
+        Copy the product details shown with the order. Pass the primary
+        image's storage name ('' for none) to skip looking it up.
+        """
+        if image_name is None:
+            primary_image = self.product.images.filter(is_primary=True).first()
+            image_name = primary_image.image.name if primary_image else ''
+        self.product_name = self.product.name
+        self.product_slug = self.product.slug
+        self.product_image = image_name
+        self.variant_name = self.variant.name if self.variant else ''
+        self.variant_original_price = self.variant.original_price if self.variant else None
+
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
@@ -107,3 +153,64 @@ class OrderStatusHistory(models.Model):
 
     def __str__(self):
         return f"{self.order.order_number} - {self.status}"
+
+class ShippingRule(models.Model):
+    """Flat shipping charge for order subtotals in [min_subtotal, max_subtotal)"""
+    name = models.CharField(max_length=100)
+    min_subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    max_subtotal = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    charge = models.DecimalField(max_digits=10, decimal_places=2)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['min_subtotal']
+
+    def __str__(self):
+        upper = f"₹{self.max_subtotal}" if self.max_subtotal is not None else "above"
+        return f"{self.name}: ₹{self.min_subtotal} - {upper} → ₹{self.charge}"
+
+    def applies_to(self, subtotal):
+        return subtotal >= self.min_subtotal and (self.max_subtotal is None or subtotal < self.max_subtotal)
+
+class TaxRule(models.Model):
+    """Tax charged on the order subtotal, e.g. GST at 0.18"""
+    name = models.CharField(max_length=100)
+    rate = models.DecimalField(max_digits=5, decimal_places=4)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.rate * 100:.2f}%)"
+
+class StockReservation(models.Model):
+    """
+    Stock taken from a product or variant for one order line. Held
+    reservations return to stock when they expire unpaid; committed ones
+    only when the order is cancelled.
+    """
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, blank=True, null=True)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.order.order_number} - {self.quantity} ({self.status})"
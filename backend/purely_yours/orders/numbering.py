@@ -0,0 +1,46 @@
+"""
+Order numbers of the form PY<yymmdd><sequence>, e.g. PY2610180000421.
+
+Each process reserves a block of sequence numbers by inserting one
+OrderNumberBlock row and hands them out from memory, so most orders cost no
+extra query and two processes can never issue the same number. The date
+prefix keeps numbers sortable by day.
+
+A block allocated inside a transaction is only kept for later orders once
+that transaction commits. If it rolls back, the database may hand the same
+block to another process, and the one number already used went with the
+rolled-back order.
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+_lock = threading.Lock()
+_block = {'day': None, 'next': 0, 'end': 0}
+
+
+def format_order_number(day, sequence):
+    return f"PY{day:%y%m%d}{sequence:07d}"
+
+
+def next_order_number():
+    from .models import OrderNumberBlock
+
+    day = timezone.localdate()
+    with _lock:
+        if _block['day'] == day and _block['next'] < _block['end']:
+            sequence = _block['next']
+            _block['next'] += 1
+            return format_order_number(day, sequence)
+
+    size = settings.ORDER_NUMBER_BLOCK_SIZE
+    start = OrderNumberBlock.objects.create().pk * size
+
+    def keep_rest():
+        with _lock:
+            _block.update(day=day, next=start + 1, end=start + size)
+
+    transaction.on_commit(keep_rest)
+    return format_order_number(day, start)
@@ -0,0 +1,195 @@
+"""
+Server-side pricing for carts, orders and payment sessions.
+
+A PriceSnapshot reads the current product and variant prices a request
+needs in at most two queries. quote() prices lines against it and applies
+the active shipping and tax rules in a single pass.
+
+The rules are cached in process memory under a version that saving or
+deleting a rule bumps once the change commits. With a shared cache every
+process sees the bump on its next quote; without one, a process also
+reloads its copy once it is PRICING_RULES_MAX_AGE seconds old.
+"""
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from products.models import Product, ProductVariant
+
+CENT = Decimal('0.01')
+RULES_GENERATION_KEY = 'pricing:rules:generation'
+
+_rules = {'generation': None, 'loaded_at': 0, 'shipping': [], 'tax': []}
+
+
+class PricingError(ValueError):
+    """Raised when lines reference products or variants that cannot be sold"""
+
+    def __init__(self, message, product_ids=(), variant_ids=()):
+        super().__init__(message)
+        self.product_ids = sorted(product_ids)
+        self.variant_ids = sorted(variant_ids)
+
+
+def money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def generation(key):
+    """
+    The time of the last bump. A key evicted from the cache restarts at the
+    current time rather than a fixed value, so entries cached under an
+    older generation are never read again.
+    """
+    return cache.get_or_set(key, time.time_ns(), timeout=None)
+
+
+def bump_generation(key):
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_rules():
+    """Active (shipping, tax) rules, reloaded only after a change or once the copy is too old"""
+    current = generation(RULES_GENERATION_KEY)
+    max_age = settings.PRICING_RULES_MAX_AGE
+    if _rules['generation'] != current or (
+        max_age is not None and time.monotonic() - _rules['loaded_at'] >= max_age
+    ):
+        from .models import ShippingRule, TaxRule
+        _rules['shipping'] = list(ShippingRule.objects.filter(is_active=True))
+        _rules['tax'] = list(TaxRule.objects.filter(is_active=True))
+        _rules['generation'] = current
+        _rules['loaded_at'] = time.monotonic()
+    return _rules['shipping'], _rules['tax']
+
+
+def invalidate_rules():
+    transaction.on_commit(lambda: bump_generation(RULES_GENERATION_KEY))
+
+
+class PriceSnapshot:
+    """The prices of a fixed set of products and variants at one moment"""
+
+    def __init__(self, products, variants=()):
+        self.products = {product.pk: product for product in products}
+        self.variants = {variant.pk: variant for variant in variants}
+
+    @classmethod
+    def for_lines(cls, lines):
+        """Load everything the (product_id, variant_id, quantity) lines reference"""
+        lines = list(lines)
+        product_ids = {product_id for product_id, _, _ in lines}
+        variant_ids = {variant_id for _, variant_id, _ in lines if variant_id}
+        products = Product.objects.filter(is_active=True).in_bulk(product_ids).values()
+        variants = ProductVariant.objects.filter(is_active=True).in_bulk(variant_ids).values() if variant_ids else ()
+        return cls(products, variants)
+
+    def sells_variant(self, product_id, variant_id):
+        return variant_id in self.variants and self.variants[variant_id].product_id == product_id
+
+    def available(self, lines):
+        """The (product_id, variant_id, quantity) lines that validate() would accept"""
+        return [(product_id, variant_id, quantity) for product_id, variant_id, quantity in lines
+                if product_id in self.products and (not variant_id or self.sells_variant(product_id, variant_id))]
+
+    def unit_price(self, product_id, variant_id=None):
+        if variant_id:
+            return self.variants[variant_id].price
+        return self.products[product_id].price
+
+    def validate(self, lines):
+        missing_products = set()
+        missing_variants = set()
+        for product_id, variant_id, _ in lines:
+            if product_id not in self.products:
+                missing_products.add(product_id)
+            if variant_id and not self.sells_variant(product_id, variant_id):
+                missing_variants.add(variant_id)
+        if missing_products or missing_variants:
+            raise PricingError('Some items are no longer available', missing_products, missing_variants)
+
+
+class Quote:
+    """A priced set of lines with shipping, tax and discount"""
+
+    def __init__(self, lines, subtotal, shipping_cost, taxes, discount_amount=Decimal('0')):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.shipping_cost = shipping_cost
+        self.taxes = taxes
+        self.tax_amount = sum((amount for _, _, amount in taxes), Decimal('0'))
+        self.discount_amount = discount_amount
+        self.total_amount = subtotal + shipping_cost + self.tax_amount - discount_amount
+
+    def as_dict(self):
+        return {
+            'lines': [
+                {
+                    'product_id': product_id,
+                    'variant_id': variant_id,
+                    'quantity': quantity,
+                    'unit_price': str(unit_price),
+                    'total': str(total),
+                }
+                for product_id, variant_id, quantity, unit_price, total in self.lines
+            ],
+            'subtotal': str(self.subtotal),
+            'shipping_cost': str(self.shipping_cost),
+            'taxes': [
+                {'name': name, 'rate': str(rate) if rate is not None else None, 'amount': str(amount)}
+                for name, rate, amount in self.taxes
+            ],
+            'tax_amount': str(self.tax_amount),
+            'discount_amount': str(self.discount_amount),
+            'total_amount': str(self.total_amount),
+        }
+
+
+def price_lines(lines, shipping_cost=None, taxes=None, discount_amount=Decimal('0')):
+    """
+    Total (product_id, variant_id, quantity, unit_price) lines in one pass.
+    Shipping and tax come from the active rules unless given.
+    """
+    priced = []
+    subtotal = Decimal('0')
+    for product_id, variant_id, quantity, unit_price in lines:
+        total = unit_price * quantity
+        priced.append((product_id, variant_id, quantity, unit_price, total))
+        subtotal += total
+
+    if shipping_cost is None or taxes is None:
+        shipping_rules, tax_rules = get_rules()
+        if shipping_cost is None:
+            rule = next((rule for rule in shipping_rules if rule.applies_to(subtotal)), None)
+            shipping_cost = rule.charge if rule else Decimal('0')
+        if taxes is None:
+            taxes = [(rule.name, rule.rate, money(subtotal * rule.rate)) for rule in tax_rules]
+    return Quote(priced, money(subtotal), money(shipping_cost), taxes, discount_amount)
+
+
+def quote(lines, snapshot=None):
+    """Price (product_id, variant_id, quantity) lines at current prices"""
+    lines = list(lines)
+    if snapshot is None:
+        snapshot = PriceSnapshot.for_lines(lines)
+    snapshot.validate(lines)
+    return price_lines(
+        (product_id, variant_id, quantity, snapshot.unit_price(product_id, variant_id))
+        for product_id, variant_id, quantity in lines
+    )
+
+
+def quote_order(order):
+    """
+    Re-price a placed order from the unit prices and charges it recorded,
+    so the amount charged always matches what the customer was shown.
+    """
+    return price_lines(
+        [(item.product_id, item.variant_id, item.quantity, item.price) for item in order.items.all()],
+        shipping_cost=order.shipping_cost,
+        taxes=[('Tax', None, order.tax_amount)],
+        discount_amount=order.discount_amount,
+    )
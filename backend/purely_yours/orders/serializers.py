@@ -1,22 +1,48 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import Order, OrderItem, OrderStatusHistory
-from products.serializers import ProductListSerializer, ProductVariantSerializer
 from accounts.serializers import AddressSerializer
 
 class OrderItemCreateSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     variant_id = serializers.IntegerField(required=False, allow_null=True)
     quantity = serializers.IntegerField(min_value=1)
-    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    # Accepted for older clients but ignored; orders are priced server-side
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductListSerializer(read_only=True)
-    variant = ProductVariantSerializer(read_only=True)
+    """
+    Renders products and variants from the snapshot taken at order time, so
+    later catalogue edits do not change past orders.
+    """
+    product = serializers.SerializerMethodField()
+    variant = serializers.SerializerMethodField()
 
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'variant', 'quantity', 'price', 'total']
 
+    def get_product(self, obj):
+        primary_image = None
+        if obj.product_image:
+            primary_image = self.context['request'].build_absolute_uri(default_storage.url(obj.product_image))
+        return {
+            'id': obj.product_id,
+            'name': obj.product_name,
+            'slug': obj.product_slug,
+            'primary_image': primary_image,
+        }
+
+    def get_variant(self, obj):
+        if not obj.variant_id:
+            return None
+        return {
+            'id': obj.variant_id,
+            'name': obj.variant_name,
+            'price': str(obj.price),
+            'original_price': str(obj.variant_original_price) if obj.variant_original_price is not None else None,
+        }
+
 class OrderStatusHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderStatusHistory
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import pricing
+from .models import ShippingRule, TaxRule
+
+
+@receiver(post_save, sender=ShippingRule)
+@receiver(post_delete, sender=ShippingRule)
+@receiver(post_save, sender=TaxRule)
+@receiver(post_delete, sender=TaxRule)
+def invalidate_pricing_rules(sender, **kwargs):
+    pricing.invalidate_rules()
@@ -1,3 +1,471 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db import models
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Address
+from products.models import Product, ProductImage, ProductVariant
+from products.testing import make_product
+from payments import webhooks
+from payments.models import PaymentSession
+from . import inventory, numbering, pricing
+from .models import Order, OrderItem, OrderNumberBlock, OrderStatusHistory, ShippingRule, StockReservation, TaxRule
+
+User = get_user_model()
+
+
+class OrderSerializationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = make_product('hair-oil', sku='OIL')
+        ProductImage.objects.create(product=self.product, image='products/hair-oil.webp', is_primary=True)
+        self.variant = ProductVariant.objects.create(
+            id=1, product=self.product, name='200ml', sku='OIL-200', price=180, original_price=200
+        )
+
+    def make_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, subtotal=280, total_amount=280, shipping_name='Buyer',
+                shipping_mobile='9999999999', shipping_address_line_1='Street', shipping_city='Pune',
+                shipping_state='MH', shipping_pincode='411001',
+            )
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price=100)
+            OrderItem.objects.create(order=order, product=self.product, variant=self.variant, quantity=1, price=180)
+            OrderStatusHistory.objects.create(order=order, status='pending', created_by=self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_order_list_query_count_is_constant(self):
+        self.make_orders(2)
+        small, _ = self.count_queries('/api/orders/')
+        self.make_orders(10)
+        large, response = self.count_queries('/api/orders/')
+
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 5)
+
+    def test_items_render_the_snapshot_taken_at_order_time(self):
+        self.make_orders(1)
+        self.product.name = 'Renamed Oil'
+        self.product.save()
+        self.variant.price = 220
+        self.variant.original_price = 250
+        self.variant.save()
+
+        items = self.client.get('/api/orders/').data['results'][0]['items']
+        plain, with_variant = sorted(items, key=lambda item: item['variant'] is not None)
+        self.assertEqual(plain['product']['name'], 'Hair Oil')
+        self.assertEqual(plain['product']['slug'], 'hair-oil')
+        self.assertTrue(plain['product']['primary_image'].endswith('/media/products/hair-oil.webp'))
+        self.assertIsNone(plain['variant'])
+        self.assertEqual(with_variant['variant']['name'], '200ml')
+        self.assertEqual(with_variant['variant']['price'], '180.00')
+        self.assertEqual(with_variant['variant']['original_price'], '200.00')
+
+
+class OrderListPaginationTests(TestCase):
+    """The order list pages by (-created_at, -id), where the id is a UUID"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        now = timezone.now()
+        for i, user in enumerate([self.user] * 7 + [other]):
+            order = Order.objects.create(
+                user=user, subtotal=100, total_amount=100, shipping_name='Buyer',
+                shipping_mobile='9999999999', shipping_address_line_1='Street', shipping_city='Pune',
+                shipping_state='MH', shipping_pincode='411001',
+            )
+            # Pairs of orders share a created_at so the UUID tiebreaker matters
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=i // 2))
+        orders = Order.objects.filter(user=self.user).order_by('-created_at', '-id')
+        self.expected = [str(pk) for pk in orders.values_list('pk', flat=True)]
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.data['results']]
+
+    def test_cursor_walks_every_order_once_in_both_directions(self):
+        response = self.client.get('/api/orders/', {'page_size': 3})
+        self.assertEqual(response.data['count'], 7)
+        pages = [response]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response)
+        self.assertEqual(sum((self.ids(page) for page in pages), []), self.expected)
+        self.assertEqual(len(pages), 3)
+
+        back = self.client.get(pages[-1].data['previous'])
+        self.assertEqual(self.ids(back), self.ids(pages[1]))
+        back = self.client.get(back.data['previous'])
+        self.assertEqual(self.ids(back), self.ids(pages[0]))
+        self.assertIsNone(back.data['previous'])
+
+    def test_count_can_be_skipped(self):
+        with CaptureQueriesContext(connection) as counted:
+            self.client.get('/api/orders/')
+        with CaptureQueriesContext(connection) as uncounted:
+            response = self.client.get('/api/orders/', {'count': 'false', 'page_size': 4})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(self.ids(response), self.expected[:4])
+        self.assertEqual(len(uncounted), len(counted) - 1)
+
+        response = self.client.get(response.data['next'])
+        self.assertNotIn('count', response.data)
+        self.assertEqual(self.ids(response), self.expected[4:])
+
+    def test_page_numbers_still_work(self):
+        response = self.client.get('/api/orders/', {'page': 2, 'page_size': 3})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(self.ids(response), self.expected[3:6])
+        self.assertIn('page=3', response.data['next'])
+
+
+class CreateOrderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.address = Address.objects.create(
+            user=self.user, name='Buyer', mobile='9999999999', address_line_1='Street',
+            city='Pune', state='MH', pincode='411001',
+        )
+        self.products = []
+        for i in range(30):
+            product = make_product(f'product-{i}', stock_quantity=10)
+            ProductImage.objects.create(product=product, image=f'products/product-{i}.webp', is_primary=True)
+            ProductVariant.objects.create(
+                id=i + 1, product=product, name='Large', sku=f'SKU-{i}-L', price=150, stock_quantity=10
+            )
+            self.products.append(product)
+
+    def place_order(self, items):
+        payload = {'address_id': self.address.id, 'payment_method': 'cod', 'items': items}
+        with redirect_stdout(StringIO()), CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/orders/create/', payload, format='json')
+        return response, len(ctx.captured_queries)
+
+    def items(self, count):
+        return [
+            {'product_id': product.id, 'variant_id': i + 1 if i % 2 else None, 'quantity': 2, 'price': '100.00'}
+            for i, product in enumerate(self.products[:count])
+        ]
+
+    def test_query_count_does_not_grow_with_items(self):
+        pricing.get_rules()  # rules are loaded once per process, not per order
+        small, small_queries = self.place_order(self.items(3))
+        large, large_queries = self.place_order(self.items(30))
+
+        self.assertEqual(large.status_code, 200)
+        self.assertEqual(small_queries, large_queries)
+        order = Order.objects.get(pk=large.data['order']['id'])
+        self.assertEqual(order.items.count(), 30)
+        item = order.items.get(product=self.products[1])
+        self.assertEqual(item.price, 150)  # the variant's price, not the client's
+        self.assertEqual(item.total, 300)
+        self.assertEqual(item.variant_name, 'Large')
+        self.assertEqual(item.product_image, 'products/product-1.webp')
+
+    def test_unknown_products_are_rejected_before_writing(self):
+        items = self.items(2) + [{'product_id': 999, 'variant_id': 998, 'quantity': 1, 'price': '10.00'}]
+        response, _ = self.place_order(items)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['errors'], {'product_ids': [999], 'variant_ids': [998]})
+        self.assertFalse(Order.objects.exists())
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+        self.variant = ProductVariant.objects.create(id=7, product=self.product, name='Large', sku='OIL-L', price=250)
+
+    def test_quote_applies_shipping_and_tax_rules(self):
+        small = pricing.quote([(self.product.id, None, 2)])
+        self.assertEqual(small.subtotal, 200)
+        self.assertEqual(small.shipping_cost, 50)
+        self.assertEqual(small.tax_amount, 36)
+        self.assertEqual(small.total_amount, 286)
+        self.assertEqual(small.as_dict()['lines'][0]['unit_price'], '100.00')
+
+        large = pricing.quote([(self.product.id, None, 1), (self.product.id, self.variant.id, 2)])
+        self.assertEqual(large.subtotal, 600)
+        self.assertEqual(large.shipping_cost, 0)
+        self.assertEqual(large.total_amount, 708)
+
+    def test_unknown_or_mismatched_variants_are_rejected(self):
+        other = make_product('tea', price=80)
+        with self.assertRaises(pricing.PricingError) as ctx:
+            pricing.quote([(other.id, self.variant.id, 1), (999, None, 1)])
+        self.assertEqual(ctx.exception.product_ids, [999])
+        self.assertEqual(ctx.exception.variant_ids, [self.variant.id])
+
+    def test_rule_changes_reach_the_cached_rules(self):
+        pricing.get_rules()
+        with self.captureOnCommitCallbacks(execute=True):
+            TaxRule.objects.update(is_active=False)
+            TaxRule.objects.create(name='IGST', rate='0.05')
+            ShippingRule.objects.filter(charge=50).update(charge=80)
+            ShippingRule.objects.first().save()
+
+        quote = pricing.quote([(self.product.id, None, 1)])
+        self.assertEqual(quote.shipping_cost, 80)
+        self.assertEqual([name for name, _, _ in quote.taxes], ['IGST'])
+        self.assertEqual(quote.tax_amount, 5)
+
+    def test_rule_changes_from_another_process_reach_an_old_copy(self):
+        pricing.get_rules()
+        # A queryset update sends no signals, like a change made by a process with its own cache
+        TaxRule.objects.update(rate='0.05', updated_at=timezone.now())
+        ShippingRule.objects.filter(charge=50).delete()
+        self.assertEqual(pricing.quote([(self.product.id, None, 1)]).tax_amount, 18)
+
+        with override_settings(PRICING_RULES_MAX_AGE=0):
+            quote = pricing.quote([(self.product.id, None, 1)])
+        self.assertEqual(quote.shipping_cost, 0)
+        self.assertEqual(quote.tax_amount, 5)
+
+    def test_unchanged_rules_cost_no_queries(self):
+        pricing.get_rules()
+        with self.assertNumQueries(0):
+            pricing.get_rules()
+
+    def test_inactive_products_and_variants_are_rejected(self):
+        Product.objects.filter(pk=self.product.pk).update(is_active=False)
+        other = make_product('tea', price=80)
+        ProductVariant.objects.create(id=8, product=other, name='Small', sku='TEA-S', price=60, is_active=False)
+        with self.assertRaises(pricing.PricingError) as ctx:
+            pricing.quote([(self.product.id, None, 1), (other.id, 8, 1)])
+        self.assertEqual(ctx.exception.product_ids, [self.product.id])
+        self.assertEqual(ctx.exception.variant_ids, [8])
+
+    def test_cart_total_uses_current_prices(self):
+        from cart.models import Cart, CartItem
+        cache.clear()
+        user = User.objects.create_user(email='cart@example.com', username='cart', password='pass')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        CartItem.objects.create(cart=cart, product=self.product, variant=self.variant, quantity=2)
+        self.assertEqual(cart.total_amount, 600)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.address = Address.objects.create(
+            user=self.user, name='Buyer', mobile='9999999999', address_line_1='Street',
+            city='Pune', state='MH', pincode='411001',
+        )
+        self.product = make_product(stock_quantity=5)
+        self.variant = ProductVariant.objects.create(
+            id=1, product=self.product, name='Large', sku='OIL-L', price=250, stock_quantity=3
+        )
+
+    def place_order(self, items, payment_method='online'):
+        payload = {'address_id': self.address.id, 'payment_method': payment_method, 'items': items}
+        with redirect_stdout(StringIO()):
+            return self.client.post('/api/orders/create/', payload, format='json')
+
+    def stock(self):
+        self.product.refresh_from_db()
+        self.variant.refresh_from_db()
+        return self.product.stock_quantity, self.variant.stock_quantity
+
+    def test_orders_take_stock_and_shortages_write_nothing(self):
+        response = self.place_order([
+            {'product_id': self.product.id, 'quantity': 2},
+            {'product_id': self.product.id, 'variant_id': self.variant.id, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), (3, 0))
+        reservation = StockReservation.objects.get(variant=self.variant)
+        self.assertEqual((reservation.status, reservation.quantity), ('held', 3))
+        self.assertIsNotNone(reservation.expires_at)
+
+        response = self.place_order([
+            {'product_id': self.product.id, 'quantity': 1},
+            {'product_id': self.product.id, 'variant_id': self.variant.id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['errors'], {'product_ids': [], 'variant_ids': [self.variant.id]})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.stock(), (3, 0))
+
+    def test_cash_on_delivery_commits_immediately(self):
+        self.place_order([{'product_id': self.product.id, 'quantity': 1}], payment_method='cod')
+        reservation = StockReservation.objects.get()
+        self.assertEqual(reservation.status, 'committed')
+        self.assertIsNone(reservation.expires_at)
+
+    def test_cancelling_returns_stock_once(self):
+        order_id = self.place_order([{'product_id': self.product.id, 'quantity': 4}]).data['order']['id']
+        self.assertEqual(self.stock()[0], 1)
+
+        self.client.post(f'/api/orders/{order_id}/cancel/')
+        self.client.post(f'/api/orders/{order_id}/cancel/')
+        self.assertEqual(self.stock()[0], 5)
+        self.assertEqual(StockReservation.objects.get().status, 'released')
+
+    def test_failed_payment_webhook_releases_the_hold(self):
+        order = Order.objects.get(pk=self.place_order(
+            [{'product_id': self.product.id, 'variant_id': self.variant.id, 'quantity': 2}]
+        ).data['order']['id'])
+        PaymentSession.objects.create(order=order, cashfree_order_id='cf_1', payment_session_id='session_1')
+
+        body = json.dumps({'type': 'PAYMENT_FAILED_WEBHOOK', 'data': {'order': {'order_id': 'cf_1'}}}).encode()
+        response = self.client.post(
+            '/api/payments/webhook/', body, content_type='application/json',
+            HTTP_X_WEBHOOK_TIMESTAMP='1', HTTP_X_WEBHOOK_SIGNATURE=webhooks.sign('1', body)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), (5, 1))  # stored, not yet applied
+
+        call_command('process_payment_webhooks', stdout=StringIO())
+        self.assertEqual(self.stock(), (5, 3))
+
+    def test_expired_holds_are_released_and_retaken_on_payment(self):
+        order = Order.objects.get(pk=self.place_order(
+            [{'product_id': self.product.id, 'quantity': 5}]
+        ).data['order']['id'])
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Released 1', out.getvalue())
+        self.assertEqual(self.stock()[0], 5)
+
+        self.assertTrue(inventory.commit(order))
+        self.assertEqual(self.stock()[0], 0)
+        self.assertEqual(order.reservations.filter(status='committed').count(), 1)
+
+    def test_late_payment_without_stock_is_flagged(self):
+        order = Order.objects.get(pk=self.place_order(
+            [{'product_id': self.product.id, 'quantity': 5}]
+        ).data['order']['id'])
+        inventory.release(order)
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=0)
+
+        self.assertFalse(inventory.commit(order))
+        self.assertIn('out of stock', order.status_history.first().notes)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Many buyers racing for the same SKU, each on its own connection"""
+    buyers = 20
+    stock = 5
+
+    def setUp(self):
+        self.product = make_product(stock_quantity=self.stock)
+        self.users = []
+        for i in range(self.buyers):
+            user = User.objects.create_user(email=f'buyer{i}@example.com', username=f'buyer{i}', password='pass')
+            address = Address.objects.create(
+                user=user, name='Buyer', mobile='9999999999', address_line_1='Street',
+                city='Pune', state='MH', pincode='411001',
+            )
+            self.users.append((user, address))
+
+    def test_parallel_checkouts_never_oversell(self):
+        barrier = threading.Barrier(self.buyers)
+        statuses = []
+
+        def checkout(user, address):
+            client = APIClient()
+            client.force_authenticate(user)
+            payload = {
+                'address_id': address.id, 'payment_method': 'cod',
+                'items': [{'product_id': self.product.id, 'quantity': 1}],
+            }
+            try:
+                barrier.wait()
+                for _ in range(100):
+                    response = client.post('/api/orders/create/', payload, format='json')
+                    # In-memory SQLite fails lock waits at once instead of blocking; retry those
+                    if response.status_code != 500 or 'locked' not in response.data['message']:
+                        break
+                    time.sleep(random.random() / 100)
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=buyer) for buyer in self.users]
+        with redirect_stdout(StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.product.refresh_from_db()
+        sold = StockReservation.objects.aggregate(total=models.Sum('quantity'))['total']
+        # A request can commit and then fail its next read on a lock; its retry
+        # answers 409, so every winner may have done so. Count sales in the database.
+        self.assertLessEqual(set(statuses), {200, 409})
+        self.assertIn(409, statuses)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(sold, self.stock)
+        self.assertEqual(self.product.stock_quantity, 0)
+
+
+@override_settings(ORDER_NUMBER_BLOCK_SIZE=5)
+class OrderNumberTests(TestCase):
+    def setUp(self):
+        numbering._block.update(day=None, next=0, end=0)
+
+    def next_number(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return numbering.next_order_number()
+
+    def test_numbers_come_from_blocks_in_order(self):
+        with CaptureQueriesContext(connection) as ctx:
+            numbers = [self.next_number() for _ in range(12)]
+
+        self.assertEqual(len(ctx.captured_queries), 3)  # one insert per block of 5
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(len(set(numbers)), 12)
+        today = timezone.localdate().strftime('%y%m%d')
+        self.assertRegex(numbers[0], rf'^PY{today}\d{{7}}$')
+
+    def test_processes_never_share_a_block(self):
+        first = [self.next_number() for _ in range(3)]
+        other_process = dict(numbering._block)
+        numbering._block.update(day=None, next=0, end=0)
+        second = [self.next_number() for _ in range(3)]
+        numbering._block.update(other_process)
+        first += [self.next_number() for _ in range(3)]
+
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(OrderNumberBlock.objects.count(), 3)
+
+    def test_rolled_back_blocks_are_not_kept(self):
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                numbering.next_order_number()
+                raise RuntimeError
+        self.assertIsNone(numbering._block['day'])
+        self.next_number()
+        self.assertEqual(numbering._block['end'] - numbering._block['next'], 4)
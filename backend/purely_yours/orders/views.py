@@ -7,22 +7,25 @@ from .models import Order, OrderItem, OrderStatusHistory
 from .serializers import OrderSerializer, CreateOrderSerializer
 from cart.models import Cart
 from accounts.models import Address
-from decimal import Decimal
+from products.models import ProductImage
+from . import inventory, pricing
+from purely_yours.pagination import KeysetPagination
 
 
 class OrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).with_details()
 
 class OrderDetailView(generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).with_details()
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -47,65 +50,84 @@ def create_order(request):
             # Get shipping address
             address = get_object_or_404(Address, id=address_id, user=request.user)
 
-            with transaction.atomic():
-                # Calculate totals from provided items
-                subtotal = Decimal('0')
-                for item_data in items_data:
-                    item_total = Decimal(str(item_data['price'])) * item_data['quantity']
-                    subtotal += item_total
-
-                shipping_cost = Decimal('50') if subtotal < Decimal('500') else Decimal('0')
-                tax_amount = subtotal * Decimal('0.18')  # 18% GST
-                total_amount = subtotal + shipping_cost + tax_amount
-
-                # Create order
-                order = Order.objects.create(
-                    user=request.user,
-                    status='pending',
-                    payment_method=payment_method,
-                    subtotal=subtotal,
-                    shipping_cost=shipping_cost,
-                    tax_amount=tax_amount,
-                    total_amount=total_amount,
-                    shipping_name=address.name,
-                    shipping_mobile=address.mobile,
-                    shipping_address_line_1=address.address_line_1,
-                    shipping_address_line_2=address.address_line_2,
-                    shipping_city=address.city,
-                    shipping_state=address.state,
-                    shipping_pincode=address.pincode,
-                    notes=notes
-                )
-                
-                # Create order items from provided data
-                from products.models import Product, ProductVariant
-                for item_data in items_data:
-                    product = get_object_or_404(Product, id=item_data['product_id'])
-                    variant = None
-                    if item_data.get('variant_id'):
-                        variant = get_object_or_404(ProductVariant, id=item_data['variant_id'])
-                    
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        variant=variant,
-                        quantity=item_data['quantity'],
-                        price=Decimal(str(item_data['price']))
+            # Price every line from the current catalog; client prices are ignored
+            lines = [
+                (item['product_id'], item.get('variant_id') or None, item['quantity']) for item in items_data
+            ]
+            snapshot = pricing.PriceSnapshot.for_lines(lines)
+            try:
+                quote = pricing.quote(lines, snapshot)
+            except pricing.PricingError as e:
+                return Response({
+                    'success': False,
+                    'message': str(e),
+                    'errors': {'product_ids': e.product_ids, 'variant_ids': e.variant_ids}
+                }, status=status.HTTP_404_NOT_FOUND)
+            primary_images = dict(
+                ProductImage.objects.filter(product_id__in=snapshot.products, is_primary=True)
+                .order_by('order').values_list('product_id', 'image')
+            )
+
+            try:
+                with transaction.atomic():
+                    # Create order
+                    order = Order.objects.create(
+                        user=request.user,
+                        status='pending',
+                        payment_method=payment_method,
+                        subtotal=quote.subtotal,
+                        shipping_cost=quote.shipping_cost,
+                        tax_amount=quote.tax_amount,
+                        total_amount=quote.total_amount,
+                        shipping_name=address.name,
+                        shipping_mobile=address.mobile,
+                        shipping_address_line_1=address.address_line_1,
+                        shipping_address_line_2=address.address_line_2,
+                        shipping_city=address.city,
+                        shipping_state=address.state,
+                        shipping_pincode=address.pincode,
+                        notes=notes
                     )
 
-                # Create initial status history
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='pending',
-                    notes='Order created',
-                    created_by=request.user
-                )
-
+                    # Take the stock before writing the items; a shortage rolls the order back
+                    inventory.reserve(order, quote.lines, hold=payment_method != 'cod')
+
+                    # Create order items in one insert; bulk_create skips save(),
+                    # so the total and the product snapshot are filled in here
+                    order_items = []
+                    for product_id, variant_id, quantity, unit_price, total in quote.lines:
+                        order_item = OrderItem(
+                            order=order,
+                            product=snapshot.products[product_id],
+                            variant=snapshot.variants.get(variant_id),
+                            quantity=quantity,
+                            price=unit_price,
+                            total=total
+                        )
+                        order_item.capture_snapshot(primary_images.get(product_id, ''))
+                        order_items.append(order_item)
+                    OrderItem.objects.bulk_create(order_items)
+
+                    # Create initial status history
+                    OrderStatusHistory.objects.create(
+                        order=order,
+                        status='pending',
+                        notes='Order created',
+                        created_by=request.user
+                    )
+            except inventory.OutOfStock as e:
                 return Response({
-                    'success': True,
-                    'message': 'Order created successfully',
-                    'order': OrderSerializer(order, context={'request': request}).data
-                })
+                    'success': False,
+                    'message': str(e),
+                    'errors': {'product_ids': e.product_ids, 'variant_ids': e.variant_ids}
+                }, status=status.HTTP_409_CONFLICT)
+
+            order = Order.objects.with_details().get(pk=order.pk)
+            return Response({
+                'success': True,
+                'message': 'Order created successfully',
+                'order': OrderSerializer(order, context={'request': request}).data
+            })
 
         except Exception as e:
             return Response({
@@ -131,16 +153,20 @@ def cancel_order(request, order_id):
                 'message': 'Cannot cancel order that has been shipped or delivered'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        order.status = 'cancelled'
-        order.save()
+        with transaction.atomic():
+            order.status = 'cancelled'
+            order.save()
+
+            # Put the order's items back in stock
+            inventory.release(order)
 
-        # Create status history
-        OrderStatusHistory.objects.create(
-            order=order,
-            status='cancelled',
-            notes='Order cancelled by customer',
-            created_by=request.user
-        )
+            # Create status history
+            OrderStatusHistory.objects.create(
+                order=order,
+                status='cancelled',
+                notes='Order cancelled by customer',
+                created_by=request.user
+            )
 
         return Response({
             'success': True,
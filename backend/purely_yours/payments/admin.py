@@ -10,7 +10,7 @@ class PaymentSessionAdmin(admin.ModelAdmin):
 
 @admin.register(PaymentWebhook)
 class PaymentWebhookAdmin(admin.ModelAdmin):
-    list_display = ['cashfree_order_id', 'event_type', 'processed', 'created_at']
+    list_display = ['cashfree_order_id', 'event_type', 'processed', 'attempts', 'created_at']
     list_filter = ['event_type', 'processed', 'created_at']
-    search_fields = ['cashfree_order_id']
-    readonly_fields = ['created_at']
+    search_fields = ['cashfree_order_id', 'event_key']
+    readonly_fields = ['created_at', 'processed_at']
@@ -0,0 +1,340 @@
+"""
+Async versions of the payment views that wait on Cashfree, routed under
+/api/payments/async/.
+
+Served by an ASGI server, a request waiting on the gateway holds no worker
+thread, so a slow gateway cannot use up the workers the rest of the site
+needs. Gateway calls go through the pooled AsyncCashfreeClient and simple
+reads and writes through the async ORM. The stock and payment state
+changes need transactions, which the async ORM does not offer, so those
+run in a thread through sync_to_async.
+
+DRF views are sync only, so these are plain Django views: they check the
+JWT bearer token themselves and answer with the same payloads as the views
+in views.py.
+"""
+import json
+import uuid
+from functools import wraps
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from orders import inventory
+from orders.models import Order
+from orders.pricing import quote_order
+from . import gateway, polling, transitions
+from .gateway import GatewayUnavailable, acheck_payment_status_internal, handle_cashfree_response
+from .models import PaymentSession
+from .serializers import CreatePaymentSessionSerializer, PaymentSessionSerializer
+from .views import (
+    CARD_FIELDS, card_payment_payload, otp_outcome, payment_order_payload, payment_status_payload,
+    settled_status_payload,
+)
+
+User = get_user_model()
+jwt_authentication = JWTAuthentication()
+
+mark_paid = sync_to_async(transitions.mark_paid)
+mark_failed = sync_to_async(transitions.mark_failed)
+mark_processing = sync_to_async(transitions.mark_processing)
+
+
+async def authenticate(request):
+    """The active user the request's bearer token belongs to, or None"""
+    header = jwt_authentication.get_header(request)
+    raw_token = jwt_authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = jwt_authentication.get_validated_token(raw_token)
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except (InvalidToken, KeyError):
+        return None
+    return await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}, is_active=True).afirst()
+
+
+def gateway_view(action):
+    """
+    Authenticate the request, pass the view its JSON body and turn gateway
+    errors into the responses the sync views give; action names the call
+    in error messages.
+    """
+    def decorator(handler):
+        @csrf_exempt
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            request.user = await authenticate(request)
+            if request.user is None:
+                return JsonResponse({
+                    'detail': 'Authentication credentials were not provided.'
+                }, status=status.HTTP_401_UNAUTHORIZED)
+            try:
+                data = json.loads(request.body) if request.body else {}
+            except ValueError:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Invalid JSON body'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                return await handler(request, data, *args, **kwargs)
+            except httpx.TimeoutException:
+                return JsonResponse({
+                    'success': False,
+                    'error_code': 'TIMEOUT',
+                    'message': 'Payment gateway request timed out - Please try again'
+                }, status=status.HTTP_408_REQUEST_TIMEOUT)
+            except (httpx.TransportError, GatewayUnavailable):
+                return JsonResponse({
+                    'success': False,
+                    'error_code': 'CONNECTION_ERROR',
+                    'message': 'Unable to connect to payment gateway - Please try again'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except Exception as e:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'An error occurred while {action}',
+                    'error': str(e)
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return view
+    return decorator
+
+
+def session_not_found():
+    return JsonResponse({
+        'success': False,
+        'message': 'Payment session not found'
+    }, status=status.HTTP_404_NOT_FOUND)
+
+
+def payment_completed(order):
+    return JsonResponse({
+        'success': True,
+        'payment_status': 'SUCCESS',
+        'message': 'Payment completed successfully',
+        'order_id': order.id
+    })
+
+
+async def user_payment_session(request, **lookup):
+    return await PaymentSession.objects.select_related('order').filter(
+        order__user=request.user, **lookup
+    ).afirst()
+
+
+@require_POST
+@gateway_view('creating payment session')
+async def create_payment_session(request, data):
+    serializer = CreatePaymentSessionSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse({
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    base_url = request.build_absolute_uri('/')[:-1]
+    return_url = serializer.validated_data.get('return_url', f'{base_url}/payment/success/')
+    notify_url = serializer.validated_data.get('notify_url', f'{base_url}/api/payments/webhook/')
+
+    order = await Order.objects.select_related('user').filter(
+        id=serializer.validated_data['order_id'], user=request.user
+    ).afirst()
+    if order is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Order not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    if order.status == 'cancelled':
+        return JsonResponse({
+            'success': False,
+            'message': 'Cannot pay for a cancelled order'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    payment_session = await PaymentSession.objects.select_related('order').filter(order=order).afirst()
+    if payment_session and payment_session.payment_status in ['created', 'pending']:
+        return JsonResponse({
+            'success': True,
+            'message': 'Payment session already exists',
+            'data': PaymentSessionSerializer(payment_session).data
+        })
+
+    # Hold the stock again if an earlier hold expired or a payment failed
+    try:
+        await sync_to_async(inventory.ensure_reserved)(order)
+    except inventory.OutOfStock as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e),
+            'errors': {'product_ids': e.product_ids, 'variant_ids': e.variant_ids}
+        }, status=status.HTTP_409_CONFLICT)
+
+    order_amount = (await sync_to_async(quote_order)(order)).total_amount
+    cashfree_order_id = f"ORDER_{order.order_number}_{uuid.uuid4().hex[:8]}"
+    payload = payment_order_payload(order, cashfree_order_id, order_amount, return_url, notify_url)
+
+    response = await gateway.get_async_client().create_order(payload)
+    result = handle_cashfree_response(response, "Create payment session")
+    if not result['success']:
+        return JsonResponse(result, status=status.HTTP_400_BAD_REQUEST)
+
+    data = result['data']
+    await PaymentSession.objects.aupdate_or_create(
+        order=order,
+        defaults={
+            'cashfree_order_id': cashfree_order_id,
+            'payment_session_id': data.get('payment_session_id'),
+            'payment_status': 'created',
+            'gateway_response': data
+        }
+    )
+    return JsonResponse({
+        'success': True,
+        'message': 'Payment session created successfully',
+        'data': {
+            'payment_session_id': data.get('payment_session_id'),
+            'cashfree_order_id': cashfree_order_id,
+            'order_amount': float(order_amount),
+            'order_currency': 'INR',
+            'return_url': return_url,
+            'cashfree_mode': settings.CASHFREE_MODE
+        }
+    })
+
+
+@require_POST
+@gateway_view('processing payment')
+async def process_card_payment(request, data):
+    """Process card payment with Cashfree"""
+    payment_session_id = data.get('payment_session_id')
+    card_data = data.get('card_data') or {}
+    if not payment_session_id:
+        return JsonResponse({
+            'success': False,
+            'message': 'Payment session ID is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    for field in CARD_FIELDS:
+        if not card_data.get(field):
+            return JsonResponse({
+                'success': False,
+                'message': f'{field.replace("_", " ").title()} is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    payment_session = await user_payment_session(request, payment_session_id=payment_session_id)
+    if payment_session is None:
+        return session_not_found()
+
+    response = await gateway.get_async_client().pay_order(card_payment_payload(payment_session_id, card_data))
+    result = handle_cashfree_response(response, "Process card payment")
+    if not result['success']:
+        return JsonResponse(result, status=status.HTTP_400_BAD_REQUEST)
+
+    data = result['data']
+    await mark_processing(payment_session, data)
+
+    if data.get('data', {}).get('url'):
+        return JsonResponse({
+            'success': True,
+            'requires_otp': True,
+            'otp_url': data['data']['url'],
+            'message': 'OTP verification required'
+        })
+    if data.get('payment_status') == 'SUCCESS':
+        await mark_paid(
+            payment_session, data, 'Payment completed successfully',
+            transaction_id=data.get('cf_payment_id', ''), created_by=request.user
+        )
+        return payment_completed(payment_session.order)
+    return JsonResponse({
+        'success': False,
+        'message': data.get('message', 'Payment processing failed'),
+        'payment_status': data.get('payment_status', 'FAILED')
+    })
+
+
+@require_POST
+@gateway_view('verifying OTP')
+async def verify_otp(request, data):
+    """Verify OTP for card payment"""
+    otp_url = data.get('otp_url')
+    otp = data.get('otp')
+    payment_session_id = data.get('payment_session_id')
+    if not all([otp_url, otp, payment_session_id]):
+        return JsonResponse({
+            'success': False,
+            'message': 'OTP URL, OTP, and payment session ID are required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    payment_session = await user_payment_session(request, payment_session_id=payment_session_id)
+    if payment_session is None:
+        return session_not_found()
+
+    response = await gateway.get_async_client().submit_otp(otp_url, otp)
+    result = handle_cashfree_response(response, "OTP verification")
+    if not result['success']:
+        return JsonResponse(result, status=status.HTTP_400_BAD_REQUEST)
+
+    data = result['data']
+    outcome = otp_outcome(data)
+    if outcome == 'SUCCESS':
+        await mark_paid(
+            payment_session, data, 'Payment completed after OTP verification',
+            transaction_id=data.get('cf_payment_id', ''), created_by=request.user
+        )
+        return payment_completed(payment_session.order)
+    if outcome == 'FAILED':
+        await mark_failed(payment_session, data)
+        return JsonResponse({
+            'success': False,
+            'payment_status': 'FAILED',
+            'message': data.get('message') or data.get('error_description') or 'OTP verification failed'
+        })
+
+    # Check payment status as fallback
+    status_result = await acheck_payment_status_internal(payment_session.cashfree_order_id)
+    if status_result['success'] and status_result['data'].get('payment_status') == 'SUCCESS':
+        await mark_paid(
+            payment_session, status_result['data'], 'Payment confirmed via status check', created_by=request.user
+        )
+        return payment_completed(payment_session.order)
+    return JsonResponse({
+        'success': False,
+        'message': data.get('message') or 'OTP verification status unclear',
+        'details': data
+    })
+
+
+@require_GET
+@gateway_view('checking payment status')
+async def get_payment_status(request, data, cashfree_order_id):
+    payment_session = await user_payment_session(request, cashfree_order_id=cashfree_order_id)
+    if payment_session is None:
+        return session_not_found()
+
+    if payment_session.payment_status in transitions.FINAL_STATUSES:
+        return JsonResponse(settled_status_payload(payment_session))
+
+    result = await polling.afetch(cashfree_order_id, acheck_payment_status_internal)
+    if not result['success']:
+        return JsonResponse(result, status=status.HTTP_400_BAD_REQUEST)
+
+    data = result['data']
+    order_status = data.get('order_status', '').lower()
+    if order_status in transitions.PAID_ORDER_STATUSES:
+        await mark_paid(payment_session, data, 'Payment completed successfully', created_by=request.user)
+    elif order_status in transitions.FAILED_ORDER_STATUSES:
+        await mark_failed(payment_session, data)
+    elif order_status == 'active' and payment_session.payment_status == 'created':
+        payment_session.payment_status = 'pending'
+        payment_session.gateway_response = data
+        await payment_session.asave(update_fields=['payment_status', 'gateway_response', 'updated_at'])
+    return JsonResponse(payment_status_payload(payment_session, order_status, data))
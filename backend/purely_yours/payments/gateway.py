@@ -0,0 +1,438 @@
+"""
+One HTTP client for the Cashfree API, shared by every payment view.
+
+Each process keeps a single requests.Session with a keep-alive connection
+pool, so calls after the first skip the TCP and TLS handshakes. Every
+operation has its own (connect, read) timeout from CASHFREE_TIMEOUTS.
+
+Reads are retried on connection errors, timeouts and 429/5xx responses,
+with capped exponential backoff and full jitter. Writes are retried only
+when the connection could not be opened: such a request never reached
+Cashfree, while a write whose response was lost may already have taken
+effect.
+
+A circuit breaker stops calling Cashfree for CASHFREE_BREAKER_RESET
+seconds after CASHFREE_BREAKER_THRESHOLD consecutive failed calls, then
+lets one trial call through. While it is open, calls raise
+GatewayUnavailable at once instead of tying up a worker until the timeout.
+
+Every attempt is logged with its latency on the 'payments.gateway' logger
+and counted in metrics().
+
+AsyncCashfreeClient makes the same calls with httpx for the async views in
+payments/async_views.py.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GatewayUnavailable(requests.exceptions.ConnectionError):
+    """Raised without calling Cashfree while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """Whether a call may go out; in the half-open state only one trial call does"""
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def release(self):
+        """Let another trial through when one ended without a result to record"""
+        with self.lock:
+            self.trial = False
+
+    def record(self, success):
+        with self.lock:
+            self.trial = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold or self.opened_at is not None:
+                # A failed trial call opens the breaker for another full period
+                self.opened_at = self.clock()
+
+
+class Metrics:
+    """Per-operation call counts and latencies for this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.operations = defaultdict(lambda: {
+            'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+        })
+
+    def record(self, operation, elapsed_ms=None, outcome='ok'):
+        with self.lock:
+            stats = self.operations[operation]
+            if outcome == 'rejected':
+                stats['rejected'] += 1
+                return
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if outcome == 'retry':
+                stats['retries'] += 1
+            elif outcome == 'failure':
+                stats['failures'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                operation: {**stats, 'avg_ms': stats['total_ms'] / stats['calls'] if stats['calls'] else 0.0}
+                for operation, stats in self.operations.items()
+            }
+
+
+class CashfreeClient:
+    def __init__(self, base_url=None, client_id=None, client_secret=None, api_version=None):
+        self.base_url = (base_url or settings.CASHFREE_BASE_URL).rstrip('/')
+        self.client_id = client_id or settings.CASHFREE_CLIENT_ID
+        self.client_secret = client_secret or settings.CASHFREE_CLIENT_SECRET
+        self.timeouts = settings.CASHFREE_TIMEOUTS
+        self.max_retries = settings.CASHFREE_MAX_RETRIES
+        self.backoff = settings.CASHFREE_RETRY_BACKOFF
+        self.backoff_cap = settings.CASHFREE_RETRY_BACKOFF_CAP
+        self.breaker = CircuitBreaker(settings.CASHFREE_BREAKER_THRESHOLD, settings.CASHFREE_BREAKER_RESET)
+        self.metrics = Metrics()
+
+        self.session = self.make_session(api_version or settings.CASHFREE_API_VERSION)
+
+    def make_session(self, api_version):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.CASHFREE_POOL_SIZE, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'x-api-version': api_version, 'Content-Type': 'application/json'})
+        return session
+
+    @property
+    def credentials(self):
+        return {'x-client-id': self.client_id, 'x-client-secret': self.client_secret}
+
+    def create_order(self, payload):
+        return self.request('create_order', 'POST', f'{self.base_url}/orders',
+                            json=payload, headers=self.credentials)
+
+    def get_order(self, cashfree_order_id):
+        return self.request('get_order', 'GET', f'{self.base_url}/orders/{cashfree_order_id}',
+                            headers=self.credentials, idempotent=True)
+
+    def pay_order(self, payload):
+        """Card payments authenticate with the payment session id, so no credentials are sent"""
+        return self.request('pay_order', 'POST', f'{self.base_url}/orders/sessions', json=payload)
+
+    def submit_otp(self, otp_url, otp):
+        return self.request('submit_otp', 'POST', otp_url,
+                            json={'action': 'SUBMIT_OTP', 'otp': otp}, headers={'accept': '*/*'})
+
+    # Errors raised before the request was sent, which even a write may retry
+    unsent_errors = (requests.exceptions.ConnectTimeout,)
+
+    def request(self, operation, method, url, idempotent=False, **kwargs):
+        """
+        Send one logical call, retrying as described above, and return the
+        final requests.Response. Raises the last requests exception when no
+        attempt got a response, or GatewayUnavailable while the breaker is open.
+        """
+        timeout = self.timeouts.get(operation, self.timeouts['default'])
+        attempt = 0
+        while True:
+            self.admit(operation)
+            started = time.monotonic()
+            response = error = None
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = e
+            finally:
+                if response is None and error is None:
+                    # Raised before Cashfree could answer, e.g. a malformed request
+                    self.breaker.release()
+            if not self.settle(operation, attempt, idempotent, started, response, error):
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            time.sleep(self.backoff_delay(attempt))
+
+    def admit(self, operation):
+        if not self.breaker.allow():
+            self.metrics.record(operation, outcome='rejected')
+            raise GatewayUnavailable(f'Cashfree circuit is open; {operation} not attempted')
+
+    def settle(self, operation, attempt, idempotent, started, response, error):
+        """Record an attempt with the breaker, metrics and log; returns whether to retry it"""
+        elapsed_ms = (time.monotonic() - started) * 1000
+        failed = error is not None or response.status_code >= 500
+        retry = attempt < self.max_retries and (
+            isinstance(error, self.unsent_errors)
+            or idempotent and (error is not None or response.status_code in RETRY_STATUSES)
+        )
+        outcome = 'retry' if retry else 'failure' if failed else 'ok'
+        self.breaker.record(not failed)
+        self.metrics.record(operation, elapsed_ms, outcome)
+        logger.info(
+            'cashfree %s %s in %.1fms attempt=%d',
+            operation, error.__class__.__name__ if error else response.status_code, elapsed_ms, attempt + 1,
+            extra={'operation': operation, 'elapsed_ms': elapsed_ms, 'attempt': attempt + 1, 'outcome': outcome},
+        )
+        return retry
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt))
+
+
+class AsyncCashfreeClient(CashfreeClient):
+    """
+    The same calls, retries, breaker and metrics over an httpx.AsyncClient,
+    for the async payment views: awaiting Cashfree holds no worker thread.
+    Every method that calls Cashfree returns a coroutine.
+    """
+    unsent_errors = (httpx.ConnectTimeout, httpx.ConnectError)
+
+    def make_session(self, api_version):
+        pool = settings.CASHFREE_POOL_SIZE
+        return httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool),
+            headers={'x-api-version': api_version, 'Content-Type': 'application/json'},
+        )
+
+    async def request(self, operation, method, url, idempotent=False, **kwargs):
+        connect, read = self.timeouts.get(operation, self.timeouts['default'])
+        timeout = httpx.Timeout(read, connect=connect)
+        attempt = 0
+        while True:
+            self.admit(operation)
+            started = time.monotonic()
+            response = error = None
+            try:
+                response = await self.session.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            finally:
+                if response is None and error is None:
+                    # Also reached when the task is cancelled, e.g. by a client disconnect
+                    self.breaker.release()
+            if not self.settle(operation, attempt, idempotent, started, response, error):
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            await asyncio.sleep(self.backoff_delay(attempt))
+
+
+def handle_cashfree_response(response, operation_name="API call"):
+    """Handle different Cashfree API response codes"""
+    status_code = response.status_code
+    
+    try:
+        response_data = response.json() if response.content else {}
+    except json.JSONDecodeError:
+        response_data = {"message": "Invalid JSON response"}
+    
+    if status_code == 200:
+        return {
+            'success': True,
+            'data': response_data,
+            'message': f'{operation_name} successful'
+        }
+    elif status_code == 400:
+        return {
+            'success': False,
+            'error_code': 'BAD_REQUEST',
+            'message': response_data.get('message', 'Bad request - Invalid parameters'),
+            'details': response_data
+        }
+    elif status_code == 401:
+        return {
+            'success': False,
+            'error_code': 'UNAUTHORIZED',
+            'message': 'Authentication failed - Invalid API credentials',
+            'details': response_data
+        }
+    elif status_code == 404:
+        return {
+            'success': False,
+            'error_code': 'NOT_FOUND',
+            'message': response_data.get('message', 'Resource not found'),
+            'details': response_data
+        }
+    elif status_code == 409:
+        return {
+            'success': False,
+            'error_code': 'CONFLICT',
+            'message': response_data.get('message', 'Conflict - Resource already exists'),
+            'details': response_data
+        }
+    elif status_code == 422:
+        return {
+            'success': False,
+            'error_code': 'VALIDATION_ERROR',
+            'message': response_data.get('message', 'Validation failed'),
+            'details': response_data
+        }
+    elif status_code == 429:
+        return {
+            'success': False,
+            'error_code': 'RATE_LIMIT',
+            'message': 'Too many requests - Please try again later',
+            'details': response_data
+        }
+    elif status_code == 500:
+        return {
+            'success': False,
+            'error_code': 'INTERNAL_SERVER_ERROR',
+            'message': 'Payment gateway internal error - Please try again',
+            'details': response_data
+        }
+    elif status_code == 502:
+        return {
+            'success': False,
+            'error_code': 'BAD_GATEWAY',
+            'message': 'Payment gateway temporarily unavailable - Please try again',
+            'details': response_data
+        }
+    else:
+        return {
+            'success': False,
+            'error_code': 'UNKNOWN_ERROR',
+            'message': f'Unexpected error (Status: {status_code})',
+            'details': response_data
+        }
+
+
+_client = {'pid': None, 'client': None}
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client, created on first use (and again in a forked worker)"""
+    pid = os.getpid()
+    if _client['pid'] != pid:
+        with _client_lock:
+            if _client['pid'] != pid:
+                _client['client'] = CashfreeClient()
+                _client['pid'] = pid
+    return _client['client']
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def close_with_loop(client):
+    """
+    Close the client's connections when the running event loop shuts down.
+    asyncio.run() and asgiref's async_to_sync finalize a loop's async
+    generators before closing it, so one parked at its yield runs its
+    finally block then. Keep the returned generator referenced.
+    """
+    async def parked():
+        try:
+            yield
+        finally:
+            await client.session.aclose()
+
+    closer = parked()
+    try:
+        closer.asend(None).send(None)  # runs to the yield; nothing in between awaits
+    except StopIteration:
+        pass
+    return closer
+
+
+def get_async_client():
+    """
+    The async client for the running event loop. httpx connections belong
+    to the loop that opened them, so each loop gets its own pool, closed
+    when the loop ends. An ASGI worker keeps one loop for its lifetime;
+    under WSGI every async view runs on a loop of its own, so its
+    connections last one request.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncCashfreeClient()
+        client.closer = close_with_loop(client)
+    return client
+
+
+def metrics():
+    return get_client().metrics.snapshot()
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    if setting.startswith('CASHFREE_'):
+        _client['pid'] = None
+        _async_clients.clear()
+
+
+def check_payment_status_internal(cashfree_order_id):
+    """Internal function to check payment status"""
+    try:
+        response = get_client().get_order(cashfree_order_id)
+        return handle_cashfree_response(response, "Check payment status")
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'message': f'Error checking payment status: {str(e)}'
+        }
+
+
+async def acheck_payment_status_internal(cashfree_order_id):
+    """check_payment_status_internal() through the async client"""
+    try:
+        response = await get_async_client().get_order(cashfree_order_id)
+        return handle_cashfree_response(response, "Check payment status")
+    except Exception as e:
+        return {
+            'success': False,
+            'message': f'Error checking payment status: {str(e)}'
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from purely_yours.benchmark import benchmark_database
+
+
+class SlowGateway:
+    """A local stand-in for Cashfree that reports every order ACTIVE after a fixed delay"""
+
+    def __init__(self, delay):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                time.sleep(delay)
+                body = json.dumps({'order_status': 'ACTIVE'}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # The default listen backlog of 5 would turn a burst of connections into retried SYNs
+            request_queue_size = 1024
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/pg'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the sync and async payment status views against a gateway that takes --delay seconds '
+        'to answer, and report how many polls each keeps in flight'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Concurrent polls, each for its own order')
+        parser.add_argument('--delay', type=float, default=0.5, help='Seconds the gateway takes per call')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Threads serving the sync view, as in a WSGI worker')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            auth, cashfree_order_ids = self.generate_sessions(options['requests'])
+            slow_gateway = SlowGateway(options['delay'])
+            # Size the connection pool to the load so the views, not the pool, are what is measured
+            settings = override_settings(CASHFREE_BASE_URL=slow_gateway.url, CASHFREE_POOL_SIZE=options['requests'])
+            try:
+                with settings:
+                    self.report(
+                        f"sync, {options['workers']} threads", options,
+                        lambda: self.run_sync(auth, cashfree_order_ids, options['workers'])
+                    )
+                    self.report(
+                        'async, one event loop', options,
+                        lambda: asyncio.run(self.run_async(auth, cashfree_order_ids))
+                    )
+            finally:
+                slow_gateway.stop()
+
+    def report(self, label, options, run):
+        # Each run starts cold so the status cache does not answer for the gateway
+        cache.clear()
+        started = time.perf_counter()
+        status_codes = run()
+        elapsed = time.perf_counter() - started
+        failed = sum(status_code != 200 for status_code in status_codes)
+        self.stdout.write(
+            f"{label:<24} {len(status_codes)} polls in {elapsed:6.2f}s   "
+            f"{len(status_codes) / elapsed:7.1f} req/s   "
+            f"{len(status_codes) * options['delay'] / elapsed:6.1f} in flight   {failed} failed"
+        )
+
+    def run_sync(self, auth, cashfree_order_ids, workers):
+        from django.test import Client
+
+        def poll(cashfree_order_id):
+            return Client().get(f'/api/payments/status/{cashfree_order_id}/', HTTP_AUTHORIZATION=auth).status_code
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(poll, cashfree_order_ids))
+
+    async def run_async(self, auth, cashfree_order_ids):
+        from django.test import AsyncClient
+
+        client = AsyncClient()
+        # The gateway client is closed with this loop
+        responses = await asyncio.gather(*[
+            client.get(f'/api/payments/async/status/{cashfree_order_id}/', headers={'Authorization': auth})
+            for cashfree_order_id in cashfree_order_ids
+        ])
+        return [response.status_code for response in responses]
+
+    def generate_sessions(self, count):
+        from django.contrib.auth import get_user_model
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from orders.models import Order
+        from payments.models import PaymentSession
+
+        user = get_user_model().objects.create_user(
+            email='benchmark@example.com', username='benchmark', password='benchmark'
+        )
+        sessions = []
+        for i in range(count):
+            order = Order.objects.create(
+                user=user, subtotal=280, total_amount=280, shipping_name='Benchmark',
+                shipping_mobile='9999999999', shipping_address_line_1='Street', shipping_city='Pune',
+                shipping_state='MH', shipping_pincode='411001',
+            )
+            # Already pending, so an ACTIVE answer writes nothing and only the gateway wait is measured
+            sessions.append(PaymentSession(
+                order=order, cashfree_order_id=f'BENCH_{i}', payment_session_id=f'session_{i}',
+                payment_status='pending'
+            ))
+        PaymentSession.objects.bulk_create(sessions)
+        auth = f'Bearer {RefreshToken.for_user(user).access_token}'
+        return auth, [session.cashfree_order_id for session in sessions]
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.webhooks import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Apply stored Cashfree webhooks; run it every few seconds, or keep it running with --interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep polling, sleeping this many seconds between passes')
+
+    def handle(self, *args, **options):
+        while True:
+            applied, failed = process_pending(options['batch_size'])
+            if applied or failed or not options['interval']:
+                self.stdout.write(f'Applied {applied} webhook(s), {failed} failed')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payments import gateway
+from payments.reconcile import reconcile
+
+REPORT_ROWS = ['checked', 'success', 'failed', 'pending', 'unchanged', 'errors', 'skipped']
+
+
+class Command(BaseCommand):
+    help = 'Ask Cashfree for the status of open payment sessions and settle them; run it every few minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30, help='Minutes since the session was created')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent gateway calls')
+        parser.add_argument('--rate', type=float, default=20, help='Gateway calls per second, 0 for no limit')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        summary = reconcile(
+            timedelta(minutes=options['older_than']),
+            workers=options['workers'],
+            rate=options['rate'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        elapsed = time.monotonic() - started
+
+        calls = gateway.metrics().get('get_order', {})
+        self.stdout.write('Dry run, nothing written' if options['dry_run'] else 'Reconciled payment sessions')
+        for row in REPORT_ROWS:
+            self.stdout.write(f'  {row:<10} {summary[row]:>8}')
+        self.stdout.write(
+            f"  {summary['checked'] / elapsed if elapsed else 0:.1f} sessions/s over {elapsed:.1f}s, "
+            f"gateway {calls.get('calls', 0)} calls, {calls.get('failures', 0)} failed, "
+            f"{calls.get('avg_ms', 0):.1f} ms average"
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymentwebhook',
+            index=models.Index(fields=['cashfree_order_id'], name='payment_web_cashfre_daa12a_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+
+def mark_existing_processed(apps, schema_editor):
+    # Webhooks stored so far were applied when they arrived, without setting the flag
+    PaymentWebhook = apps.get_model('payments', 'PaymentWebhook')
+    PaymentWebhook.objects.filter(processed=False).update(processed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_paymentwebhook_order_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='event_key',
+            field=models.CharField(blank=True, max_length=200, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='paymentwebhook',
+            index=models.Index(fields=['processed', 'id'], name='payment_web_process_a9bf76_idx'),
+        ),
+        migrations.RunPython(mark_existing_processed, migrations.RunPython.noop),
+    ]
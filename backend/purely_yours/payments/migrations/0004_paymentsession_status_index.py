@@ -0,0 +1,18 @@
+# Generated by Django 5.1.10 on 2026-10-18 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_number_block'),
+        ('payments', '0003_webhook_queue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymentsession',
+            index=models.Index(fields=['payment_status', 'created_at'], name='payment_ses_payment_8db33a_idx'),
+        ),
+    ]
@@ -25,6 +25,9 @@ class PaymentSession(models.Model):
 
     class Meta:
         db_table = 'payment_sessions'
+        indexes = [
+            models.Index(fields=['payment_status', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Payment for Order {self.order.order_number}"
@@ -32,12 +35,21 @@ class PaymentSession(models.Model):
 class PaymentWebhook(models.Model):
     cashfree_order_id = models.CharField(max_length=100)
     event_type = models.CharField(max_length=50)
+    # One row per gateway event however often it is delivered, see payments/webhooks.py
+    event_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
     webhook_data = models.JSONField()
     processed = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'payment_webhooks'
+        indexes = [
+            models.Index(fields=['cashfree_order_id']),
+            models.Index(fields=['processed', 'id']),
+        ]
 
     def __str__(self):
         return f"Webhook {self.event_type} for {self.cashfree_order_id}"
@@ -0,0 +1,124 @@
+"""
+Cashfree order status for the payment page, which polls while the customer
+waits.
+
+A gateway answer is cached for PAYMENT_STATUS_CACHE_TIMEOUT seconds per
+cashfree_order_id, and concurrent polls for the same order share one
+gateway call: within a process, followers wait for the thread already
+fetching; across processes, the first poll takes a cache lock and the rest
+wait for it to fill the cache. Gateway calls therefore grow with the number
+of open payments, not with how often they are polled. Sessions already in
+a final state never reach this module; the view answers them from the
+database.
+
+afetch() does the same for the async views without blocking the event loop.
+"""
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+PREFIX = 'payments:status'
+POLL_INTERVAL = 0.05
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def fetch(cashfree_order_id, load):
+    """
+    The cached status of the order, or load(cashfree_order_id) called once
+    for all concurrent callers. load returns a handle_cashfree_response()
+    style dict; failures are cached too, so an outage is not hammered.
+    """
+    key = f'{PREFIX}:{cashfree_order_id}'
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = {'done': threading.Event(), 'result': None}
+    if not leader:
+        flight['done'].wait(settings.PAYMENT_STATUS_LOCK_TIMEOUT)
+        return flight['result'] or cache.get(key) or load(cashfree_order_id)
+
+    try:
+        # A flight that ended since the cache miss above has filled the cache
+        flight['result'] = cache.get(key) or _fetch_once(key, cashfree_order_id, load)
+        return flight['result']
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        flight['done'].set()
+
+
+def _fetch_once(key, cashfree_order_id, load):
+    """Fetch under a cross-process lock, or wait for the process holding it"""
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, settings.PAYMENT_STATUS_LOCK_TIMEOUT)
+    if not locked:
+        deadline = time.monotonic() + settings.PAYMENT_STATUS_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            result = cache.get(key)
+            if result is not None:
+                return result
+        # The holder died or hung; fetch without it
+    try:
+        result = load(cashfree_order_id)
+        cache.set(key, result, settings.PAYMENT_STATUS_CACHE_TIMEOUT)
+        return result
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+_async_inflight = {}
+
+
+async def afetch(cashfree_order_id, load):
+    """fetch() for async callers; load is a coroutine function"""
+    key = f'{PREFIX}:{cashfree_order_id}'
+    result = await cache.aget(key)
+    if result is not None:
+        return result
+
+    loop = asyncio.get_running_loop()
+    flight_key = (id(loop), key)
+    flight = _async_inflight.get(flight_key)
+    if flight is not None:
+        return await flight or await cache.aget(key) or await load(cashfree_order_id)
+
+    flight = _async_inflight[flight_key] = loop.create_future()
+    result = None
+    try:
+        result = await cache.aget(key) or await _afetch_once(key, cashfree_order_id, load)
+        return result
+    finally:
+        del _async_inflight[flight_key]
+        # Followers of a fetch that raised see None and fetch for themselves
+        flight.set_result(result)
+
+
+async def _afetch_once(key, cashfree_order_id, load):
+    lock_key = f'{key}:lock'
+    locked = await cache.aadd(lock_key, 1, settings.PAYMENT_STATUS_LOCK_TIMEOUT)
+    if not locked:
+        deadline = time.monotonic() + settings.PAYMENT_STATUS_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            result = await cache.aget(key)
+            if result is not None:
+                return result
+    try:
+        result = await load(cashfree_order_id)
+        await cache.aset(key, result, settings.PAYMENT_STATUS_CACHE_TIMEOUT)
+        return result
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
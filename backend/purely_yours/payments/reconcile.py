@@ -0,0 +1,114 @@
+"""
+Reconciliation of payment sessions that never heard back from Cashfree.
+
+A session stays open ('created', 'pending' or 'processing') until a webhook
+or a status poll settles it. When neither comes, the order and its held
+stock hang. reconcile() walks open sessions older than a cutoff in primary
+key batches and asks Cashfree for every order in a batch from a bounded
+thread pool, spaced by a rate limit. It then writes the batch's outcomes
+with bulk_update and bulk_create.
+
+Outcomes are applied under row locks to sessions that are still open, so a
+webhook or poll that settled one in the meantime wins and the session is
+counted as skipped.
+"""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import transitions
+from .gateway import check_payment_status_internal
+from .models import PaymentSession
+
+OPEN_STATUSES = ['created', 'pending', 'processing']
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads; a rate of 0 means no limit"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(self.next_at, now)
+            self.next_at = at + self.interval
+        time.sleep(at - now)
+
+
+def fetch_statuses(pool, limiter, cashfree_order_ids):
+    """{cashfree_order_id: handle_cashfree_response() result} for every id"""
+    def fetch(cashfree_order_id):
+        limiter.wait()
+        return cashfree_order_id, check_payment_status_internal(cashfree_order_id)
+    return dict(pool.map(fetch, cashfree_order_ids))
+
+
+def outcome(session, result):
+    """The status the session should move to, or None to leave it"""
+    order_status = result['data'].get('order_status', '').lower()
+    if order_status in transitions.PAID_ORDER_STATUSES:
+        return 'success'
+    if order_status in transitions.FAILED_ORDER_STATUSES:
+        return 'failed'
+    if order_status == 'active' and session.payment_status == 'created':
+        return 'pending'
+    return None
+
+
+def apply_batch(results, summary, dry_run=False):
+    with transaction.atomic():
+        sessions = list(
+            PaymentSession.objects.select_for_update().select_related('order')
+            .filter(cashfree_order_id__in=results, payment_status__in=OPEN_STATUSES)
+        )
+        summary['skipped'] += len(results) - len(sessions)
+
+        changed = []
+        for session in sessions:
+            result = results[session.cashfree_order_id]
+            if not result['success']:
+                summary['errors'] += 1
+                continue
+            status = outcome(session, result)
+            if status is None:
+                summary['unchanged'] += 1
+                continue
+            summary[status] += 1
+            session.payment_status = status
+            session.gateway_response = result['data']
+            changed.append(session)
+        if not dry_run:
+            transitions.mark_many(changed, 'Payment confirmed by reconciliation')
+
+
+def reconcile(older_than, workers=8, rate=20, batch_size=200, dry_run=False):
+    """
+    Settle open sessions created more than older_than (a timedelta) ago.
+    Returns a Counter of checked, success, failed, pending, unchanged,
+    errors and skipped sessions.
+    """
+    sessions = PaymentSession.objects.filter(
+        payment_status__in=OPEN_STATUSES, created_at__lt=timezone.now() - older_than
+    ).order_by('pk')
+    summary = Counter()
+    limiter = RateLimiter(rate)
+    last_pk = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(sessions.filter(pk__gt=last_pk).values_list('pk', 'cashfree_order_id')[:batch_size])
+            if not batch:
+                return summary
+            last_pk = batch[-1][0]
+            summary['checked'] += len(batch)
+            results = fetch_statuses(pool, limiter, [cashfree_order_id for _, cashfree_order_id in batch])
+            apply_batch(results, summary, dry_run)
@@ -0,0 +1,663 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from orders import inventory
+from orders.models import Order, OrderItem, OrderStatusHistory, StockReservation
+from products.testing import make_product
+from . import gateway, polling, reconcile, transitions, webhooks
+from .models import PaymentSession, PaymentWebhook
+
+User = get_user_model()
+
+FAST_CLIENT = {
+    'CASHFREE_TIMEOUTS': {'default': (1, 0.2)},
+    'CASHFREE_RETRY_BACKOFF': 0,
+    'CASHFREE_BREAKER_THRESHOLD': 3,
+}
+
+
+CARD_DATA = {'card_number': '4111', 'card_expiry_mm': '12', 'card_expiry_yy': '30',
+             'card_cvv': '123', 'card_holder_name': 'Buyer'}
+
+
+class StubCashfree:
+    """
+    A local HTTP/1.1 server that answers with scripted (status, body, delay)
+    replies, then with route(path) (200 {} by default), and records each
+    request with its client port
+    """
+
+    def __init__(self):
+        self.replies = []
+        self.route = lambda path: (200, {}, 0)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                stub.requests.append((self.command, self.path, dict(self.headers), body, self.client_address[1]))
+                if stub.replies:
+                    status, reply, delay = stub.replies.pop(0)
+                else:
+                    status, reply, delay = stub.route(self.path)
+                time.sleep(delay)
+                data = json.dumps(reply).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            do_GET = do_POST = respond
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/pg'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(**FAST_CLIENT)
+class CashfreeClientTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubCashfree()
+        self.addCleanup(self.stub.stop)
+        self.client = gateway.CashfreeClient(base_url=self.stub.url, client_id='id', client_secret='secret')
+        self.addCleanup(self.client.session.close)
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get_order('ORDER_1').status_code, 200)
+        ports = {port for *_, port in self.stub.requests}
+        self.assertEqual(len(ports), 1)
+        method, path, headers, _, _ = self.stub.requests[0]
+        self.assertEqual((method, path), ('GET', '/pg/orders/ORDER_1'))
+        self.assertEqual(headers['x-client-secret'], 'secret')
+        self.assertEqual(headers['x-api-version'], '2023-08-01')
+
+    def test_reads_are_retried(self):
+        self.stub.replies = [(503, {}, 0), (502, {}, 0), (200, {'order_status': 'PAID'}, 0)]
+        response = self.client.get_order('ORDER_1')
+        self.assertEqual(response.json(), {'order_status': 'PAID'})
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(self.client.metrics.snapshot()['get_order']['retries'], 2)
+
+    def test_reads_give_up_after_the_retry_budget(self):
+        self.stub.replies = [(200, {}, 0.4)] * 3
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client.get_order('ORDER_1')
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_writes_are_not_retried_once_sent(self):
+        self.stub.replies = [(502, {'message': 'bad gateway'}, 0)]
+        self.assertEqual(self.client.create_order({'order_id': 'ORDER_1'}).status_code, 502)
+
+        self.stub.replies = [(200, {}, 0.4)]
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client.create_order({'order_id': 'ORDER_2'})
+        self.assertEqual([body['order_id'] for *_, body, _ in self.stub.requests], ['ORDER_1', 'ORDER_2'])
+
+    def test_card_payments_and_otp_carry_no_credentials(self):
+        self.client.pay_order({'payment_session_id': 'session'})
+        self.client.submit_otp(f'{self.stub.url}/orders/pay/authenticate/1', '123456')
+        for _, _, headers, _, _ in self.stub.requests:
+            self.assertNotIn('x-client-secret', headers)
+        self.assertEqual(self.stub.requests[1][3], {'action': 'SUBMIT_OTP', 'otp': '123456'})
+
+    def test_circuit_opens_after_repeated_failures(self):
+        now = [0]
+        self.client.breaker.clock = lambda: now[0]
+        self.stub.replies = [(500, {}, 0)] * 3
+        for _ in range(3):
+            self.client.create_order({})
+
+        with self.assertRaises(gateway.GatewayUnavailable):
+            self.client.get_order('ORDER_1')
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(self.client.metrics.snapshot()['get_order']['rejected'], 1)
+
+        now[0] = 31  # half-open: one trial call closes the circuit again
+        self.assertEqual(self.client.get_order('ORDER_1').status_code, 200)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_a_trial_call_that_raises_frees_the_half_open_circuit(self):
+        now = [0]
+        self.client.breaker.clock = lambda: now[0]
+        self.stub.replies = [(500, {}, 0)] * 3
+        for _ in range(3):
+            self.client.create_order({})
+
+        now[0] = 31
+        with self.assertRaises(TypeError):
+            self.client.create_order({'amount': object()})  # not JSON serializable
+        self.assertEqual(self.client.get_order('ORDER_1').status_code, 200)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_async_trial_call_that_raises_frees_the_half_open_circuit(self):
+        async def calls():
+            client = gateway.AsyncCashfreeClient(base_url=self.stub.url, client_id='id', client_secret='secret')
+            client.breaker.opened_at, client.breaker.failures = 0, 3
+            client.breaker.clock = lambda: 31
+            try:
+                with self.assertRaises(httpx.InvalidURL):
+                    await client.submit_otp('http://[::1/otp', '123456')
+                return (await client.get_order('ORDER_1')).status_code
+            finally:
+                await client.session.aclose()
+
+        self.assertEqual(asyncio.run(calls()), 200)
+
+    def test_async_clients_are_closed_with_their_loop(self):
+        async def call():
+            client = gateway.get_async_client()
+            self.assertIs(gateway.get_async_client(), client)
+            self.assertEqual((await client.get_order('ORDER_1')).status_code, 200)
+            return client
+
+        with override_settings(CASHFREE_BASE_URL=self.stub.url):
+            self.assertTrue(asyncio.run(call()).session.is_closed)
+            # How Django runs an async view under WSGI: a new loop per request
+            self.assertTrue(async_to_sync(call)().session.is_closed)
+
+    def test_client_errors_do_not_trip_the_breaker(self):
+        self.stub.replies = [(400, {'message': 'bad'}, 0)] * 5
+        for _ in range(5):
+            self.assertEqual(self.client.create_order({}).status_code, 400)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+
+class StubGatewayTestCase(TestCase):
+    """A buyer with an open payment session, and CASHFREE_BASE_URL pointed at a stub"""
+
+    def setUp(self):
+        cache.clear()
+        self.stub = StubCashfree()
+        self.addCleanup(self.stub.stop)
+        settings = override_settings(CASHFREE_BASE_URL=self.stub.url, **FAST_CLIENT)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        order = Order.objects.create(
+            user=self.user, subtotal=280, total_amount=280, shipping_name='Buyer',
+            shipping_mobile='9999999999', shipping_address_line_1='Street', shipping_city='Pune',
+            shipping_state='MH', shipping_pincode='411001',
+        )
+        self.session = PaymentSession.objects.create(
+            order=order, cashfree_order_id='ORDER_1', payment_session_id='session'
+        )
+
+
+class PaymentGatewayViewTests(StubGatewayTestCase):
+    def test_status_check_goes_through_the_shared_client(self):
+        self.stub.replies = [(503, {}, 0), (200, {'order_status': 'ACTIVE'}, 0)]
+        response = self.client.get('/api/payments/status/ORDER_1/')
+
+        self.assertEqual(response.data['data']['payment_status'], 'pending')
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertIs(gateway.get_client(), gateway.get_client())
+        self.assertEqual(gateway.metrics()['get_order']['calls'], 2)
+
+    def test_expired_orders_fail_the_session(self):
+        self.stub.replies = [(200, {'order_status': 'EXPIRED'}, 0)]
+        response = self.client.get('/api/payments/status/ORDER_1/')
+        self.assertEqual(response.data['data']['payment_status'], 'failed')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.payment_status, 'failed')
+
+    def test_open_circuit_fails_fast(self):
+        self.stub.replies = [(500, {}, 0)] * 3
+        for _ in range(3):
+            self.client.post('/api/payments/process-card-payment/', {
+                'payment_session_id': 'session', 'card_data': CARD_DATA,
+            }, format='json')
+
+        response = self.client.post('/api/payments/verify-otp/', {
+            'otp_url': f'{self.stub.url}/orders/pay/authenticate/1', 'otp': '123456', 'payment_session_id': 'session'
+        }, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_repeated_card_success_confirms_the_order_once(self):
+        reply = (200, {'payment_status': 'SUCCESS', 'cf_payment_id': 'cf_1'}, 0)
+        self.stub.replies = [reply, reply]
+        for _ in range(2):
+            response = self.client.post('/api/payments/process-card-payment/', {
+                'payment_session_id': 'session', 'card_data': CARD_DATA,
+            }, format='json')
+            self.assertEqual(response.data['payment_status'], 'SUCCESS')
+
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.payment_status, self.session.transaction_id), ('success', 'cf_1'))
+        self.assertEqual(OrderStatusHistory.objects.filter(status='confirmed').count(), 1)
+
+    def test_failed_otp_releases_the_held_stock(self):
+        product = make_product(stock_quantity=4)
+        StockReservation.objects.create(order=self.session.order, product=product, quantity=1, status='held')
+        self.stub.replies = [(200, {'payment_status': 'FAILED'}, 0)]
+        response = self.client.post('/api/payments/verify-otp/', {
+            'otp_url': f'{self.stub.url}/orders/pay/authenticate/1', 'otp': '123456', 'payment_session_id': 'session'
+        }, format='json')
+
+        self.assertEqual(response.data['payment_status'], 'FAILED')
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 5)
+        self.assertEqual(StockReservation.objects.get().status, 'released')
+
+    def cancel_with_stock(self):
+        product = make_product(stock_quantity=4)
+        order = self.session.order
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=100)
+        StockReservation.objects.create(order=order, product=product, quantity=1, status='held')
+        self.assertEqual(self.client.post(f'/api/orders/{order.id}/cancel/').status_code, 200)
+        return product
+
+    def test_cancelled_orders_cannot_open_a_payment_session(self):
+        product = self.cancel_with_stock()
+        PaymentSession.objects.filter(pk=self.session.pk).update(payment_status='failed')
+        response = self.client.post('/api/payments/create-session/', {'order_id': self.session.order_id}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stub.requests, [])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 5)
+        self.assertFalse(StockReservation.objects.exclude(status='released').exists())
+
+    def test_payment_for_a_cancelled_order_is_recorded_for_refund(self):
+        product = self.cancel_with_stock()
+        self.stub.replies = [(200, {'payment_status': 'SUCCESS', 'cf_payment_id': 'cf_1'}, 0)]
+        self.client.post('/api/payments/process-card-payment/', {
+            'payment_session_id': 'session', 'card_data': CARD_DATA,
+        }, format='json')
+
+        order = Order.objects.get(pk=self.session.order_id)
+        self.assertEqual((order.status, order.payment_status), ('cancelled', 'paid'))
+        self.assertTrue(order.status_history.filter(notes=transitions.REFUND_DUE_NOTES).exists())
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 5)
+        self.assertFalse(StockReservation.objects.exclude(status='released').exists())
+
+
+class PaymentStatusPollingTests(StubGatewayTestCase):
+    def poll(self):
+        response = self.client.get('/api/payments/status/ORDER_1/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    def test_repeated_polls_share_one_gateway_call(self):
+        self.stub.replies = [(200, {'order_status': 'ACTIVE'}, 0)]
+        for _ in range(5):
+            self.assertEqual(self.poll()['payment_status'], 'pending')
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_paid_orders_are_confirmed_once_then_served_from_the_database(self):
+        self.stub.replies = [(200, {'order_status': 'PAID'}, 0)]
+        for _ in range(3):
+            self.assertEqual(self.poll()['payment_status'], 'success')
+        cache.clear()
+        with self.assertNumQueries(1):
+            data = self.poll()
+        self.assertEqual((data['payment_status'], data['order_status']), ('success', 'paid'))
+
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(OrderStatusHistory.objects.filter(status='confirmed').count(), 1)
+
+    def test_failed_payments_are_not_polled(self):
+        PaymentSession.objects.filter(pk=self.session.pk).update(payment_status='failed')
+        self.assertEqual(self.poll()['payment_status'], 'failed')
+        self.assertEqual(self.stub.requests, [])
+
+
+class StatusCoalescingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def load(self, cashfree_order_id):
+        self.calls.append(cashfree_order_id)
+        time.sleep(0.2)
+        return {'success': True, 'data': {'order_status': 'ACTIVE'}}
+
+    def test_concurrent_polls_make_one_call(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(polling.fetch('ORDER_1', self.load)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, ['ORDER_1'])
+        self.assertEqual(len(results), 10)
+
+    def test_waits_for_a_fetch_in_another_process(self):
+        cache.add(f'{polling.PREFIX}:ORDER_1:lock', 1)
+        answer = {'success': True, 'data': {'order_status': 'PAID'}}
+        threading.Timer(0.1, cache.set, [f'{polling.PREFIX}:ORDER_1', answer]).start()
+        self.assertEqual(polling.fetch('ORDER_1', self.load), answer)
+        self.assertEqual(self.calls, [])
+
+    async def test_concurrent_async_polls_make_one_call(self):
+        async def load(cashfree_order_id):
+            self.calls.append(cashfree_order_id)
+            await asyncio.sleep(0.2)
+            return {'success': True, 'data': {'order_status': 'ACTIVE'}}
+
+        results = await asyncio.gather(*[polling.afetch('ORDER_1', load) for _ in range(10)])
+        self.assertEqual(self.calls, ['ORDER_1'])
+        self.assertEqual(len(results), 10)
+
+
+class AsyncPaymentViewTests(StubGatewayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    async def poll(self):
+        return await self.async_client.get('/api/payments/async/status/ORDER_1/', headers=self.auth)
+
+    async def pay(self):
+        return await self.async_client.post(
+            '/api/payments/async/process-card-payment/',
+            {'payment_session_id': 'session', 'card_data': CARD_DATA},
+            content_type='application/json', headers=self.auth,
+        )
+
+    async def test_requires_a_valid_token(self):
+        response = await self.async_client.get('/api/payments/async/status/ORDER_1/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(
+            '/api/payments/async/status/ORDER_1/', headers={'Authorization': 'Bearer invalid'}
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.stub.requests, [])
+
+    async def test_status_poll_confirms_a_paid_order(self):
+        self.stub.replies = [(200, {'order_status': 'PAID'}, 0)]
+        for _ in range(3):
+            response = await self.poll()
+            self.assertEqual(response.json()['data']['payment_status'], 'success')
+
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(await OrderStatusHistory.objects.filter(status='confirmed').acount(), 1)
+
+    async def test_status_poll_fails_an_expired_order(self):
+        self.stub.replies = [(200, {'order_status': 'EXPIRED'}, 0)]
+        response = await self.poll()
+        self.assertEqual(response.json()['data']['payment_status'], 'failed')
+        await self.session.arefresh_from_db()
+        self.assertEqual(self.session.payment_status, 'failed')
+
+    async def test_concurrent_polls_share_one_gateway_call(self):
+        self.stub.replies = [(200, {'order_status': 'ACTIVE'}, 0.2)]
+        responses = await asyncio.gather(*[self.poll() for _ in range(10)])
+
+        self.assertEqual({response.json()['data']['payment_status'] for response in responses}, {'pending'})
+        self.assertEqual(len(self.stub.requests), 1)
+
+    async def test_card_payment_settles_the_order(self):
+        self.stub.replies = [(200, {'payment_status': 'SUCCESS', 'cf_payment_id': 'cf_1'}, 0)]
+        response = await self.pay()
+
+        self.assertEqual(response.json()['payment_status'], 'SUCCESS')
+        session = await PaymentSession.objects.select_related('order').aget(pk=self.session.pk)
+        self.assertEqual((session.payment_status, session.transaction_id), ('success', 'cf_1'))
+        self.assertEqual(session.order.payment_status, 'paid')
+
+    async def test_repeated_card_success_confirms_the_order_once(self):
+        reply = (200, {'payment_status': 'SUCCESS', 'cf_payment_id': 'cf_1'}, 0)
+        self.stub.replies = [reply, reply]
+        for _ in range(2):
+            self.assertEqual((await self.pay()).json()['payment_status'], 'SUCCESS')
+        self.assertEqual(await OrderStatusHistory.objects.filter(status='confirmed').acount(), 1)
+
+    async def test_create_session_replaces_a_failed_one(self):
+        await PaymentSession.objects.filter(pk=self.session.pk).aupdate(payment_status='failed')
+        self.stub.replies = [(200, {'payment_session_id': 'session_2'}, 0)]
+        response = await self.async_client.post(
+            '/api/payments/async/create-session/', {'order_id': str(self.session.order_id)},
+            content_type='application/json', headers=self.auth,
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['payment_session_id'], 'session_2')
+        session = await PaymentSession.objects.aget(pk=self.session.pk)
+        self.assertEqual((session.payment_status, session.payment_session_id), ('created', 'session_2'))
+
+    async def test_slow_gateway_times_out(self):
+        self.stub.replies = [(200, {'payment_status': 'SUCCESS'}, 0.5)]
+        response = await self.pay()
+        self.assertEqual(response.status_code, 408)
+        self.assertEqual(len(self.stub.requests), 1)
+
+
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.product = make_product(stock_quantity=5)
+        self.order = Order.objects.create(
+            user=self.user, subtotal=200, total_amount=200, shipping_name='Buyer',
+            shipping_mobile='9999999999', shipping_address_line_1='Street', shipping_city='Pune',
+            shipping_state='MH', shipping_pincode='411001', payment_method='online',
+        )
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2, price=100)
+        inventory.reserve(self.order, inventory.order_lines(self.order))
+        self.session = PaymentSession.objects.create(
+            order=self.order, cashfree_order_id='cf_1', payment_session_id='session_1'
+        )
+
+    def deliver(self, event_type, payment_id=1, signature=None):
+        body = json.dumps({
+            'type': event_type,
+            'event_time': '2026-10-18T10:00:00+05:30',
+            'data': {'order': {'order_id': 'cf_1'}, 'payment': {'cf_payment_id': payment_id}},
+        }).encode()
+        return self.client.post(
+            '/api/payments/webhook/', body, content_type='application/json',
+            HTTP_X_WEBHOOK_TIMESTAMP='1700000000',
+            HTTP_X_WEBHOOK_SIGNATURE=signature or webhooks.sign('1700000000', body),
+        )
+
+    def process(self):
+        out = StringIO()
+        call_command('process_payment_webhooks', stdout=out)
+        return out.getvalue()
+
+    def test_endpoint_only_stores_the_event(self):
+        with self.assertNumQueries(1):
+            response = self.deliver('PAYMENT_SUCCESS_WEBHOOK')
+        self.assertEqual(response.status_code, 200)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.payment_status, 'created')
+        self.assertEqual(PaymentWebhook.objects.get().event_key, 'PAYMENT_SUCCESS_WEBHOOK:cf_1:1')
+
+    def test_unsigned_events_are_rejected(self):
+        self.assertEqual(self.deliver('PAYMENT_SUCCESS_WEBHOOK', signature='forged').status_code, 400)
+        self.assertFalse(PaymentWebhook.objects.exists())
+
+    def test_redeliveries_are_applied_once(self):
+        for _ in range(3):
+            self.deliver('PAYMENT_SUCCESS_WEBHOOK')
+        self.assertEqual(PaymentWebhook.objects.count(), 1)
+        self.assertIn('Applied 1 webhook(s)', self.process())
+
+        # A second success event for the same order changes nothing
+        self.deliver('PAYMENT_SUCCESS_WEBHOOK', payment_id=2)
+        self.process()
+
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.payment_status, self.order.status), ('paid', 'confirmed'))
+        self.assertEqual(OrderStatusHistory.objects.filter(order=self.order, status='confirmed').count(), 1)
+        self.assertEqual(StockReservation.objects.get().status, 'committed')
+        self.assertFalse(PaymentWebhook.objects.filter(processed=False).exists())
+        self.assertIn('Applied 0 webhook(s)', self.process())
+
+    def test_failure_after_success_does_not_undo_it(self):
+        self.deliver('PAYMENT_SUCCESS_WEBHOOK')
+        self.deliver('PAYMENT_FAILED_WEBHOOK', payment_id=2)
+        self.process()
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.payment_status, 'success')
+        self.assertEqual(self.session.transaction_id, '1')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+
+    def test_events_for_an_unknown_session_stay_pending(self):
+        self.session.delete()
+        self.deliver('PAYMENT_SUCCESS_WEBHOOK')
+        self.process()
+        webhook = PaymentWebhook.objects.get()
+        self.assertFalse(webhook.processed)
+        self.assertIn("No payment session for order 'cf_1'", webhook.last_error)
+
+        # Once the session is there, the retry applies the event
+        PaymentSession.objects.create(order=self.order, cashfree_order_id='cf_1', payment_session_id='session_1')
+        self.assertIn('Applied 1 webhook(s)', self.process())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'confirmed')
+
+    def test_events_that_raise_are_retried_then_parked(self):
+        PaymentWebhook.objects.create(
+            cashfree_order_id='cf_1', event_type='PAYMENT_SUCCESS_WEBHOOK', event_key='malformed',
+            webhook_data={'data': {'order': {'order_id': 'cf_1'}, 'payment': ['unexpected']}},
+        )
+        self.deliver('PAYMENT_FAILED_WEBHOOK')
+        self.assertIn('Applied 1 webhook(s), 1 failed', self.process())
+
+        malformed = PaymentWebhook.objects.get(event_key='malformed')
+        self.assertFalse(malformed.processed)
+        self.assertIn('attribute', malformed.last_error)
+        for _ in range(webhooks.MAX_ATTEMPTS):
+            self.process()
+        malformed.refresh_from_db()
+        self.assertEqual(malformed.attempts, webhooks.MAX_ATTEMPTS)
+
+
+class ReconcileTestCase(StubGatewayTestCase):
+    """Open sessions from an hour ago whose gateway status cycles through order_statuses"""
+    sessions = 200
+    order_statuses = ['PAID', 'ACTIVE', 'TERMINATED', 'EXPIRED']
+
+    def setUp(self):
+        super().setUp()
+        self.stub.route = self.route
+        orders = Order.objects.bulk_create([
+            Order(
+                user=self.user, order_number=f'PYTEST{i:07d}', subtotal=100, total_amount=100,
+                shipping_name='Buyer', shipping_mobile='9999999999', shipping_address_line_1='Street',
+                shipping_city='Pune', shipping_state='MH', shipping_pincode='411001',
+            )
+            for i in range(self.sessions)
+        ])
+        PaymentSession.objects.bulk_create([
+            PaymentSession(order=order, cashfree_order_id=f'CF_{i}', payment_session_id=f'session_{i}')
+            for i, order in enumerate(orders)
+        ])
+        # Every order holds one unit of the product's stock
+        self.product = make_product()
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, product=self.product, quantity=1, status='held') for order in orders
+        ])
+        PaymentSession.objects.exclude(pk=self.session.pk).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+
+    def route(self, path):
+        i = int(path.rsplit('_', 1)[1])
+        return 200, {'order_status': self.order_statuses[i % 4]}, 0
+
+
+class ReconcileAtScaleTests(ReconcileTestCase):
+    sessions = 2000
+
+    def test_open_sessions_are_settled_in_bulk(self):
+        PaymentSession.objects.filter(cashfree_order_id='CF_0').update(payment_status='failed')
+        out = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('reconcile_payments', '--older-than=30', '--rate=0', '--workers=8',
+                         '--batch-size=500', stdout=out)
+
+        report = out.getvalue()
+        self.assertIn('checked        1999', report)
+        self.assertIn('success         499', report)
+        self.assertIn('failed         1000', report)
+        self.assertIn('pending         500', report)
+        self.assertEqual(len(self.stub.requests), 1999)  # not the settled one, nor the recent one
+
+        statuses = dict(PaymentSession.objects.values_list('payment_status').annotate(n=models.Count('pk')))
+        self.assertEqual(statuses, {'success': 499, 'failed': 1001, 'pending': 500, 'created': 1})
+        self.assertEqual(Order.objects.filter(payment_status='paid', status='confirmed').count(), 499)
+        self.assertEqual(OrderStatusHistory.objects.filter(status='confirmed').count(), 499)
+        reservations = dict(StockReservation.objects.values_list('status').annotate(n=models.Count('pk')))
+        self.assertEqual(reservations, {'committed': 499, 'released': 1000, 'held': 501})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 1000)
+
+        # Writes are per batch, not per session
+        self.assertLess(len(ctx.captured_queries), 200)
+
+
+class ReconcilePaymentsTests(ReconcileTestCase):
+    def test_dry_run_and_rerun_write_nothing_new(self):
+        call_command('reconcile_payments', '--rate=0', '--dry-run', stdout=StringIO())
+        self.assertEqual(PaymentSession.objects.filter(payment_status='created').count(), self.sessions + 1)
+
+        call_command('reconcile_payments', '--rate=0', stdout=StringIO())
+        out = StringIO()
+        call_command('reconcile_payments', '--rate=0', stdout=out)
+        self.assertIn('success           0', out.getvalue())
+        self.assertEqual(OrderStatusHistory.objects.count(), self.sessions // 4)
+
+    def test_payment_for_a_cancelled_order_is_recorded_for_refund(self):
+        order = PaymentSession.objects.get(cashfree_order_id='CF_0').order  # reported PAID
+        Order.objects.filter(pk=order.pk).update(status='cancelled')
+        call_command('reconcile_payments', '--rate=0', stdout=StringIO())
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('cancelled', 'paid'))
+        self.assertEqual(order.status_history.get().notes, transitions.REFUND_DUE_NOTES)
+        self.assertFalse(order.reservations.filter(status='committed').exists())
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_calls_are_spaced(self):
+        limiter = reconcile.RateLimiter(100)
+        started = time.monotonic()
+        for _ in range(11):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
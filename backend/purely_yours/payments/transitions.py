@@ -0,0 +1,111 @@
+"""
+Payment state changes shared by the webhook worker and the payment views.
+
+Each change is a conditional UPDATE on the payment session, so applying the
+same event twice, or racing a webhook against a status poll, moves the
+order, its stock and its history exactly once. mark_many() makes the same
+changes in bulk for reconciliation.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from orders import inventory
+from orders.models import Order, OrderStatusHistory
+from .models import PaymentSession
+
+FINAL_STATUSES = ['success', 'failed']
+# Cashfree order_status values, lowercased, that settle a session
+PAID_ORDER_STATUSES = {'paid'}
+FAILED_ORDER_STATUSES = {'cancelled', 'terminated', 'expired'}
+REFUND_DUE_NOTES = 'Payment received after the order was cancelled; refund due'
+
+
+def mark_paid(payment_session, gateway_response, notes, transaction_id=None, created_by=None):
+    """
+    Confirm the session's order unless it already is; returns whether this
+    call did it. A cancelled order stays cancelled without taking its stock
+    back: the payment is recorded on it so it can be refunded.
+    """
+    fields = {'payment_status': 'success', 'gateway_response': gateway_response, 'updated_at': timezone.now()}
+    if transaction_id is not None:
+        fields['transaction_id'] = transaction_id
+    with transaction.atomic():
+        if not PaymentSession.objects.filter(pk=payment_session.pk).exclude(payment_status='success').update(**fields):
+            return False
+        for name, value in fields.items():
+            setattr(payment_session, name, value)
+
+        order = payment_session.order
+        order.refresh_from_db(fields=['status'])
+        order.payment_status = 'paid'
+        if order.status == 'cancelled':
+            order.save()
+            OrderStatusHistory.objects.create(
+                order=order, status='cancelled', notes=REFUND_DUE_NOTES, created_by=created_by
+            )
+            return True
+        order.status = 'confirmed'
+        order.save()
+        inventory.commit(order)
+        OrderStatusHistory.objects.create(order=order, status='confirmed', notes=notes, created_by=created_by)
+    return True
+
+
+def mark_failed(payment_session, gateway_response):
+    """Fail a session that has not settled yet and free its held stock; returns whether this call did it"""
+    fields = {'payment_status': 'failed', 'gateway_response': gateway_response, 'updated_at': timezone.now()}
+    with transaction.atomic():
+        if not PaymentSession.objects.filter(pk=payment_session.pk).exclude(
+            payment_status__in=FINAL_STATUSES
+        ).update(**fields):
+            return False
+        for name, value in fields.items():
+            setattr(payment_session, name, value)
+        inventory.release(payment_session.order, statuses=('held',))
+    return True
+
+
+def mark_processing(payment_session, gateway_response):
+    """Record a payment attempt on a session that has not settled yet; returns whether it was recorded"""
+    fields = {'payment_status': 'processing', 'gateway_response': gateway_response, 'updated_at': timezone.now()}
+    if not PaymentSession.objects.filter(pk=payment_session.pk).exclude(
+        payment_status__in=FINAL_STATUSES
+    ).update(**fields):
+        return False
+    for name, value in fields.items():
+        setattr(payment_session, name, value)
+    return True
+
+
+def mark_many(payment_sessions, notes):
+    """
+    Write sessions whose payment_status and gateway_response the caller has
+    set, with their rows locked and still open, and move the orders of the
+    'success' and 'failed' ones as mark_paid() and mark_failed() would, in
+    a fixed number of queries.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        for payment_session in payment_sessions:
+            payment_session.updated_at = now
+        PaymentSession.objects.bulk_update(payment_sessions, ['payment_status', 'gateway_response', 'updated_at'])
+
+        paid = [session.order for session in payment_sessions if session.payment_status == 'success']
+        confirmed = [order for order in paid if order.status != 'cancelled']
+        for order in paid:
+            order.payment_status = 'paid'
+            order.updated_at = now
+        for order in confirmed:
+            order.status = 'confirmed'
+        Order.objects.bulk_update(paid, ['payment_status', 'status', 'updated_at'])
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(order=order, status='confirmed', notes=notes) if order.status == 'confirmed'
+            else OrderStatusHistory(order=order, status='cancelled', notes=REFUND_DUE_NOTES)
+            for order in paid
+        ])
+
+        inventory.commit_orders(confirmed)
+        inventory.release_orders(
+            [session.order for session in payment_sessions if session.payment_status == 'failed'],
+            statuses=('held',)
+        )
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('sessions/', views.PaymentSessionListView.as_view(), name='payment-sessions'),
@@ -9,4 +9,8 @@ urlpatterns = [
     path('verify-otp/', views.verify_otp, name='verify-otp'),
     path('status/<str:cashfree_order_id>/', views.get_payment_status, name='payment-status'),
     path('webhook/', views.payment_webhook, name='payment-webhook'),
+    path('async/create-session/', async_views.create_payment_session, name='async-create-payment-session'),
+    path('async/process-card-payment/', async_views.process_card_payment, name='async-process-card-payment'),
+    path('async/verify-otp/', async_views.verify_otp, name='async-verify-otp'),
+    path('async/status/<str:cashfree_order_id>/', async_views.get_payment_status, name='async-payment-status'),
 ]
@@ -3,20 +3,17 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.conf import settings
-from django.views.decorators.csrf import csrf_exempt
-from django.utils.decorators import method_decorator
 from django.http import JsonResponse
 import requests
 import uuid
-import json
-import hmac
-import hashlib
-import base64
-import time
 
+from . import gateway, polling, transitions, webhooks
+from .gateway import check_payment_status_internal, handle_cashfree_response
 from .models import PaymentSession, PaymentWebhook
 from .serializers import PaymentSessionSerializer, CreatePaymentSessionSerializer
-from orders.models import Order, OrderStatusHistory
+from orders.models import Order
+from orders import inventory
+from orders.pricing import quote_order
 
 class PaymentSessionListView(generics.ListAPIView):
     serializer_class = PaymentSessionSerializer
@@ -32,84 +29,50 @@ class PaymentSessionDetailView(generics.RetrieveAPIView):
     def get_queryset(self):
         return PaymentSession.objects.filter(order__user=self.request.user)
 
-def handle_cashfree_response(response, operation_name="API call"):
-    """Handle different Cashfree API response codes"""
-    status_code = response.status_code
-    
-    try:
-        response_data = response.json() if response.content else {}
-    except json.JSONDecodeError:
-        response_data = {"message": "Invalid JSON response"}
-    
-    if status_code == 200:
-        return {
-            'success': True,
-            'data': response_data,
-            'message': f'{operation_name} successful'
-        }
-    elif status_code == 400:
-        return {
-            'success': False,
-            'error_code': 'BAD_REQUEST',
-            'message': response_data.get('message', 'Bad request - Invalid parameters'),
-            'details': response_data
-        }
-    elif status_code == 401:
-        return {
-            'success': False,
-            'error_code': 'UNAUTHORIZED',
-            'message': 'Authentication failed - Invalid API credentials',
-            'details': response_data
-        }
-    elif status_code == 404:
-        return {
-            'success': False,
-            'error_code': 'NOT_FOUND',
-            'message': response_data.get('message', 'Resource not found'),
-            'details': response_data
-        }
-    elif status_code == 409:
-        return {
-            'success': False,
-            'error_code': 'CONFLICT',
-            'message': response_data.get('message', 'Conflict - Resource already exists'),
-            'details': response_data
-        }
-    elif status_code == 422:
-        return {
-            'success': False,
-            'error_code': 'VALIDATION_ERROR',
-            'message': response_data.get('message', 'Validation failed'),
-            'details': response_data
-        }
-    elif status_code == 429:
-        return {
-            'success': False,
-            'error_code': 'RATE_LIMIT',
-            'message': 'Too many requests - Please try again later',
-            'details': response_data
-        }
-    elif status_code == 500:
-        return {
-            'success': False,
-            'error_code': 'INTERNAL_SERVER_ERROR',
-            'message': 'Payment gateway internal error - Please try again',
-            'details': response_data
-        }
-    elif status_code == 502:
-        return {
-            'success': False,
-            'error_code': 'BAD_GATEWAY',
-            'message': 'Payment gateway temporarily unavailable - Please try again',
-            'details': response_data
-        }
-    else:
-        return {
-            'success': False,
-            'error_code': 'UNKNOWN_ERROR',
-            'message': f'Unexpected error (Status: {status_code})',
-            'details': response_data
+CARD_FIELDS = ['card_number', 'card_expiry_mm', 'card_expiry_yy', 'card_cvv', 'card_holder_name']
+
+def payment_order_payload(order, cashfree_order_id, order_amount, return_url, notify_url):
+    return {
+        "order_id": cashfree_order_id,
+        "order_currency": "INR",
+        "order_amount": float(order_amount),
+        "customer_details": {
+            "customer_id": str(order.user.id),
+            "customer_name": f"{order.user.first_name} {order.user.last_name}".strip(),
+            "customer_email": order.user.email,
+            "customer_phone": order.shipping_mobile or order.user.mobile or "9999999999"
+        },
+        "order_meta": {
+            "return_url": return_url,
+            "notify_url": notify_url
+        },
+        "order_note": f"Payment for order {order.order_number}"
+    }
+
+def card_payment_payload(payment_session_id, card_data):
+    return {
+        "payment_session_id": payment_session_id,
+        "payment_method": {
+            "card": {
+                "channel": "post",
+                "card_number": card_data['card_number'].replace(' ', ''),
+                "card_expiry_mm": card_data['card_expiry_mm'],
+                "card_expiry_yy": card_data['card_expiry_yy'],
+                "card_cvv": card_data['card_cvv'],
+                "card_holder_name": card_data['card_holder_name'],
+            }
         }
+    }
+
+def otp_outcome(data):
+    """'SUCCESS' or 'FAILED' from an OTP submission's response, or None when it does not say"""
+    payment_status = data.get('payment_status') or data.get('status') or data.get('data', {}).get('payment_status')
+    authenticate_status = data.get('authenticate_status')
+    if payment_status == 'SUCCESS' or authenticate_status == 'SUCCESS' or data.get('action') == 'COMPLETE':
+        return 'SUCCESS'
+    if payment_status == 'FAILED' or authenticate_status == 'FAILED':
+        return 'FAILED'
+    return None
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -126,6 +89,12 @@ def create_payment_session(request):
             # Get the order
             order = get_object_or_404(Order, id=order_id, user=request.user)
             print("Order found:", order)
+
+            if order.status == 'cancelled':
+                return Response({
+                    'success': False,
+                    'message': 'Cannot pay for a cancelled order'
+                }, status=status.HTTP_400_BAD_REQUEST)
             
             # Check if payment session already exists
             if hasattr(order, 'payment_session'):
@@ -137,37 +106,26 @@ def create_payment_session(request):
                         'data': PaymentSessionSerializer(payment_session).data
                     })
 
+            # Hold the stock again if an earlier hold expired or a payment failed
+            try:
+                inventory.ensure_reserved(order)
+            except inventory.OutOfStock as e:
+                return Response({
+                    'success': False,
+                    'message': str(e),
+                    'errors': {'product_ids': e.product_ids, 'variant_ids': e.variant_ids}
+                }, status=status.HTTP_409_CONFLICT)
+
+            # Charge what the order's recorded lines and charges add up to
+            order_amount = quote_order(order).total_amount
+
             # Generate unique order ID for Cashfree
             cashfree_order_id = f"ORDER_{order.order_number}_{uuid.uuid4().hex[:8]}"
 
             # Prepare Cashfree API request
-            url = f"{settings.CASHFREE_BASE_URL}/orders"
-            
-            payload = {
-                "order_id": cashfree_order_id,
-                "order_currency": "INR",
-                "order_amount": float(order.total_amount),
-                "customer_details": {
-                    "customer_id": str(order.user.id),
-                    "customer_name": f"{order.user.first_name} {order.user.last_name}".strip(),
-                    "customer_email": order.user.email,
-                    "customer_phone": order.shipping_mobile or order.user.mobile or "9999999999"
-                },
-                "order_meta": {
-                    "return_url": return_url,
-                    "notify_url": notify_url
-                },
-                "order_note": f"Payment for order {order.order_number}"
-            }
+            payload = payment_order_payload(order, cashfree_order_id, order_amount, return_url, notify_url)
 
-            headers = {
-                "x-api-version": settings.CASHFREE_API_VERSION,
-                "x-client-id": settings.CASHFREE_CLIENT_ID,
-                "x-client-secret": settings.CASHFREE_CLIENT_SECRET,
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = gateway.get_client().create_order(payload)
             result = handle_cashfree_response(response, "Create payment session")
             
             if result['success']:
@@ -197,7 +155,7 @@ def create_payment_session(request):
                     'data': {
                         'payment_session_id': data.get('payment_session_id'),
                         'cashfree_order_id': cashfree_order_id,
-                        'order_amount': float(order.total_amount),
+                        'order_amount': float(order_amount),
                         'order_currency': 'INR',
                         'return_url': return_url,
                         'cashfree_mode': settings.CASHFREE_MODE
@@ -252,8 +210,7 @@ def process_card_payment(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Validate card data
-        required_fields = ['card_number', 'card_expiry_mm', 'card_expiry_yy', 'card_cvv', 'card_holder_name']
-        for field in required_fields:
+        for field in CARD_FIELDS:
             if not card_data.get(field):
                 return Response({
                     'success': False,
@@ -262,7 +219,7 @@ def process_card_payment(request):
         
         # Get payment session
         try:
-            payment_session = PaymentSession.objects.get(
+            payment_session = PaymentSession.objects.select_related('order').get(
                 payment_session_id=payment_session_id,
                 order__user=request.user
             )
@@ -273,37 +230,16 @@ def process_card_payment(request):
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Prepare Cashfree payment request
-        url = "https://sandbox.cashfree.com/pg/orders/sessions"
-        
-        payload = {
-            "payment_session_id": payment_session_id,
-            "payment_method": {
-                "card": {
-                    "channel": "post",
-                    "card_number": card_data['card_number'].replace(' ', ''),
-                    "card_expiry_mm": card_data['card_expiry_mm'],
-                    "card_expiry_yy": card_data['card_expiry_yy'],
-                    "card_cvv": card_data['card_cvv'],
-                    "card_holder_name": card_data['card_holder_name'],
-                }
-            }
-        }
-        
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-version": "2023-08-01",
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        payload = card_payment_payload(payment_session_id, card_data)
+
+        response = gateway.get_client().pay_order(payload)
         result = handle_cashfree_response(response, "Process card payment")
         
         if result['success']:
             data = result['data']
             
-            # Update payment session
-            payment_session.payment_status = 'processing'
-            payment_session.gateway_response = data
-            payment_session.save()
+            # Update payment session, unless it already settled
+            transitions.mark_processing(payment_session, data)
             
             # Check if OTP is required
             if data.get('data', {}).get('url'):
@@ -314,30 +250,17 @@ def process_card_payment(request):
                     'message': 'OTP verification required'
                 })
             elif data.get('payment_status') == 'SUCCESS':
-                # Payment successful
-                payment_session.payment_status = 'success'
-                payment_session.transaction_id = data.get('cf_payment_id', '')
-                payment_session.save()
-                
-                # Update order
-                order = payment_session.order
-                order.payment_status = 'paid'
-                order.status = 'confirmed'
-                order.save()
-                
-                # Create status history
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='confirmed',
-                    notes='Payment completed successfully',
-                    created_by=request.user
+                # Payment successful; confirms the order once however often it is reported
+                transitions.mark_paid(
+                    payment_session, data, 'Payment completed successfully',
+                    transaction_id=data.get('cf_payment_id', ''), created_by=request.user
                 )
                 
                 return Response({
                     'success': True,
                     'payment_status': 'SUCCESS',
                     'message': 'Payment completed successfully',
-                    'order_id': order.id
+                    'order_id': payment_session.order.id
                 })
             else:
                 return Response({
@@ -384,7 +307,7 @@ def verify_otp(request):
         
         # Get payment session
         try:
-            payment_session = PaymentSession.objects.get(
+            payment_session = PaymentSession.objects.select_related('order').get(
                 payment_session_id=payment_session_id,
                 order__user=request.user
             )
@@ -395,64 +318,33 @@ def verify_otp(request):
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Submit OTP to Cashfree
-        payload = {
-            "action": "SUBMIT_OTP",
-            "otp": otp
-        }
-        
-        headers = {
-            "accept": "*/*",
-            "Content-Type": "application/json",
-            "x-api-version": "2023-08-01",
-        }
-        
-        response = requests.post(otp_url, json=payload, headers=headers, timeout=30)
+        response = gateway.get_client().submit_otp(otp_url, otp)
         result = handle_cashfree_response(response, "OTP verification")
         
         if result['success']:
             data = result['data']
             
             # Check payment status
-            payment_status = data.get('payment_status') or data.get('status') or data.get('data', {}).get('payment_status')
-            authenticate_status = data.get('authenticate_status')
-            
-            if (payment_status == 'SUCCESS' or 
-                authenticate_status == 'SUCCESS' or 
-                data.get('action') == 'COMPLETE'):
+            outcome = otp_outcome(data)
+
+            if outcome == 'SUCCESS':
                 
                 # Payment successful
-                payment_session.payment_status = 'success'
-                payment_session.transaction_id = data.get('cf_payment_id', '')
-                payment_session.gateway_response = data
-                payment_session.save()
-                
-                # Update order
-                order = payment_session.order
-                order.payment_status = 'paid'
-                order.status = 'confirmed'
-                order.save()
-                
-                # Create status history
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='confirmed',
-                    notes='Payment completed after OTP verification',
-                    created_by=request.user
+                transitions.mark_paid(
+                    payment_session, data, 'Payment completed after OTP verification',
+                    transaction_id=data.get('cf_payment_id', ''), created_by=request.user
                 )
                 
                 return Response({
                     'success': True,
                     'payment_status': 'SUCCESS',
                     'message': 'Payment completed successfully',
-                    'order_id': order.id
+                    'order_id': payment_session.order.id
                 })
-            elif (payment_status == 'FAILED' or 
-                  authenticate_status == 'FAILED'):
+            elif outcome == 'FAILED':
                 
-                # Payment failed
-                payment_session.payment_status = 'failed'
-                payment_session.gateway_response = data
-                payment_session.save()
+                # Payment failed; frees the stock the order held
+                transitions.mark_failed(payment_session, data)
                 
                 return Response({
                     'success': False,
@@ -464,20 +356,8 @@ def verify_otp(request):
                 status_result = check_payment_status_internal(payment_session.cashfree_order_id)
                 if status_result['success'] and status_result['data'].get('payment_status') == 'SUCCESS':
                     # Payment successful
-                    payment_session.payment_status = 'success'
-                    payment_session.save()
-                    
-                    # Update order
-                    order = payment_session.order
-                    order.payment_status = 'paid'
-                    order.status = 'confirmed'
-                    order.save()
-                    
-                    # Create status history
-                    OrderStatusHistory.objects.create(
-                        order=order,
-                        status='confirmed',
-                        notes='Payment confirmed via status check',
+                    transitions.mark_paid(
+                        payment_session, status_result['data'], 'Payment confirmed via status check',
                         created_by=request.user
                     )
                     
@@ -485,7 +365,7 @@ def verify_otp(request):
                         'success': True,
                         'payment_status': 'SUCCESS',
                         'message': 'Payment completed successfully',
-                        'order_id': order.id
+                        'order_id': payment_session.order.id
                     })
                 else:
                     return Response({
@@ -515,73 +395,57 @@ def verify_otp(request):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def check_payment_status_internal(cashfree_order_id):
-    """Internal function to check payment status"""
-    try:
-        url = f"{settings.CASHFREE_BASE_URL}/orders/{cashfree_order_id}"
-        headers = {
-            "x-api-version": settings.CASHFREE_API_VERSION,
-            "x-client-id": settings.CASHFREE_CLIENT_ID,
-            "x-client-secret": settings.CASHFREE_CLIENT_SECRET,
+def payment_status_payload(payment_session, order_status, details):
+    return {
+        'success': True,
+        'data': {
+            'payment_status': payment_session.payment_status,
+            'order_status': order_status,
+            'cashfree_order_id': payment_session.cashfree_order_id,
+            'order_details': details
         }
+    }
 
-        response = requests.get(url, headers=headers, timeout=30)
-        return handle_cashfree_response(response, "Check payment status")
-        
-    except Exception as e:
-        return {
-            'success': False,
-            'message': f'Error checking payment status: {str(e)}'
-        }
+def settled_status_payload(payment_session):
+    """The status of a session in a final state, from what was stored when it settled"""
+    details = payment_session.gateway_response
+    order_status = 'paid' if payment_session.payment_status == 'success' else details.get('order_status', '')
+    return payment_status_payload(payment_session, order_status.lower(), details)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_payment_status(request, cashfree_order_id):
     try:
         payment_session = get_object_or_404(
-            PaymentSession, 
+            PaymentSession.objects.select_related('order'),
             cashfree_order_id=cashfree_order_id,
             order__user=request.user
         )
 
-        # Fetch latest status from Cashfree
-        result = check_payment_status_internal(cashfree_order_id)
-        
+        # Settled payments never change again, so the database answers them
+        if payment_session.payment_status in transitions.FINAL_STATUSES:
+            return Response(settled_status_payload(payment_session))
+
+        # Fetch the latest status from Cashfree, shared by concurrent and repeated polls
+        result = polling.fetch(cashfree_order_id, check_payment_status_internal)
+
         if result['success']:
             data = result['data']
-            
-            # Update payment session status
+
+            # Only changes are written; polling an unchanged order writes nothing
             order_status = data.get('order_status', '').lower()
-            if order_status == 'paid':
-                payment_session.payment_status = 'success'
-                payment_session.order.payment_status = 'paid'
-                payment_session.order.status = 'confirmed'
-                payment_session.order.save()
-                
-                # Create status history
-                OrderStatusHistory.objects.create(
-                    order=payment_session.order,
-                    status='confirmed',
-                    notes='Payment completed successfully',
-                    created_by=request.user
+            if order_status in transitions.PAID_ORDER_STATUSES:
+                transitions.mark_paid(
+                    payment_session, data, 'Payment completed successfully', created_by=request.user
                 )
-            elif order_status in ['cancelled', 'terminated']:
-                payment_session.payment_status = 'failed'
-            elif order_status == 'active':
+            elif order_status in transitions.FAILED_ORDER_STATUSES:
+                transitions.mark_failed(payment_session, data)
+            elif order_status == 'active' and payment_session.payment_status == 'created':
                 payment_session.payment_status = 'pending'
-            
-            payment_session.gateway_response = data
-            payment_session.save()
+                payment_session.gateway_response = data
+                payment_session.save(update_fields=['payment_status', 'gateway_response', 'updated_at'])
 
-            return Response({
-                'success': True,
-                'data': {
-                    'payment_status': payment_session.payment_status,
-                    'order_status': order_status,
-                    'cashfree_order_id': cashfree_order_id,
-                    'order_details': data
-                }
-            })
+            return Response(payment_status_payload(payment_session, order_status, data))
         else:
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
 
@@ -597,64 +461,14 @@ def get_payment_status(request, cashfree_order_id):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@method_decorator(csrf_exempt, name='dispatch')
 @api_view(['POST'])
 @permission_classes([])
 def payment_webhook(request):
+    """Verify and store the event; process_payment_webhooks applies it"""
+    if settings.CASHFREE_VERIFY_WEBHOOKS and not webhooks.verify(request):
+        return JsonResponse({'status': 'error', 'message': 'Invalid webhook signature'}, status=400)
     try:
-        # Verify webhook signature (optional but recommended)
-        webhook_data = json.loads(request.body)
-        
-        # Store webhook for processing
-        PaymentWebhook.objects.create(
-            cashfree_order_id=webhook_data.get('order', {}).get('order_id', ''),
-            event_type=webhook_data.get('type', ''),
-            webhook_data=webhook_data
-        )
-
-        # Process webhook
-        if webhook_data.get('type') == 'PAYMENT_SUCCESS_WEBHOOK':
-            order_data = webhook_data.get('order', {})
-            cashfree_order_id = order_data.get('order_id')
-            
-            try:
-                payment_session = PaymentSession.objects.get(cashfree_order_id=cashfree_order_id)
-                payment_session.payment_status = 'success'
-                payment_session.transaction_id = webhook_data.get('payment', {}).get('cf_payment_id', '')
-                payment_session.gateway_response = webhook_data
-                payment_session.save()
-
-                # Update order status
-                order = payment_session.order
-                order.payment_status = 'paid'
-                order.status = 'confirmed'
-                order.save()
-
-                # Create status history
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='confirmed',
-                    notes='Payment completed via webhook',
-                    created_by=order.user
-                )
-
-            except PaymentSession.DoesNotExist:
-                pass
-
-        elif webhook_data.get('type') == 'PAYMENT_FAILED_WEBHOOK':
-            order_data = webhook_data.get('order', {})
-            cashfree_order_id = order_data.get('order_id')
-            
-            try:
-                payment_session = PaymentSession.objects.get(cashfree_order_id=cashfree_order_id)
-                payment_session.payment_status = 'failed'
-                payment_session.gateway_response = webhook_data
-                payment_session.save()
-
-            except PaymentSession.DoesNotExist:
-                pass
-
-        return JsonResponse({'status': 'success'})
-
-    except Exception as e:
+        webhooks.store(request.body)
+    except ValueError as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success'})
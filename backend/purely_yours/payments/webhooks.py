@@ -0,0 +1,121 @@
+"""
+Cashfree webhook ingestion.
+
+The endpoint only verifies the signature and appends the event to
+PaymentWebhook with one INSERT, so it answers in constant time however busy
+checkout is. The process_payment_webhooks command applies stored events in
+id order, in batches.
+
+An event is identified by its type, order and payment id (or, failing
+those, a hash of the body). event_key is unique, so a delivery the gateway
+retries is stored once and applied once. The transitions themselves are
+idempotent too, so two workers, or a worker racing a status poll, cannot
+confirm an order twice.
+"""
+import base64
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import PaymentSession, PaymentWebhook
+from . import transitions
+
+SIGNATURE_HEADER = 'HTTP_X_WEBHOOK_SIGNATURE'
+TIMESTAMP_HEADER = 'HTTP_X_WEBHOOK_TIMESTAMP'
+MAX_ATTEMPTS = 5
+APPLIED_EVENTS = ('PAYMENT_SUCCESS_WEBHOOK', 'PAYMENT_FAILED_WEBHOOK')
+
+
+def sign(timestamp, body):
+    digest = hmac.new(settings.CASHFREE_CLIENT_SECRET.encode(), timestamp.encode() + body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify(request):
+    """Whether the request carries Cashfree's signature of its timestamp and raw body"""
+    signature = request.META.get(SIGNATURE_HEADER, '')
+    timestamp = request.META.get(TIMESTAMP_HEADER, '')
+    return bool(signature) and hmac.compare_digest(signature, sign(timestamp, request.body))
+
+
+def event_data(payload):
+    """The order and payment details, which current API versions nest under 'data'"""
+    return payload.get('data') or payload
+
+
+def event_key(payload, body):
+    data = event_data(payload)
+    order_id = (data.get('order') or {}).get('order_id', '')
+    payment_id = (data.get('payment') or {}).get('cf_payment_id')
+    if order_id and payment_id:
+        return f"{payload.get('type', '')}:{order_id}:{payment_id}"
+    return f'sha256:{hashlib.sha256(body).hexdigest()}'
+
+
+def store(body):
+    """Append the event unless it was already stored. Raises ValueError for a body that is not JSON."""
+    payload = json.loads(body)
+    PaymentWebhook.objects.bulk_create([PaymentWebhook(
+        cashfree_order_id=(event_data(payload).get('order') or {}).get('order_id', ''),
+        event_type=payload.get('type', ''),
+        event_key=event_key(payload, body),
+        webhook_data=payload,
+    )], ignore_conflicts=True)
+
+
+class UnknownPaymentSession(LookupError):
+    """A payment event for an order with no payment session, perhaps not committed yet"""
+
+
+def apply(webhook, payment_session):
+    """Apply a payment success or failure event; other event types are only recorded"""
+    if webhook.event_type not in APPLIED_EVENTS:
+        return
+    if payment_session is None:
+        # Raised so the event stays pending and is retried, up to MAX_ATTEMPTS
+        raise UnknownPaymentSession(f'No payment session for order {webhook.cashfree_order_id!r}')
+    if webhook.event_type == 'PAYMENT_SUCCESS_WEBHOOK':
+        payment = event_data(webhook.webhook_data).get('payment') or {}
+        transitions.mark_paid(
+            payment_session, webhook.webhook_data, 'Payment completed via webhook',
+            transaction_id=str(payment.get('cf_payment_id', '')), created_by=payment_session.order.user
+        )
+    elif webhook.event_type == 'PAYMENT_FAILED_WEBHOOK':
+        transitions.mark_failed(payment_session, webhook.webhook_data)
+
+
+def process_pending(batch_size=100):
+    """
+    Apply every stored event not yet processed, oldest first, in one pass.
+    An event that raises is retried on later runs, up to MAX_ATTEMPTS.
+    Returns (applied, failed) counts.
+    """
+    applied = failed = 0
+    last_id = 0
+    while True:
+        batch = list(
+            PaymentWebhook.objects.filter(processed=False, attempts__lt=MAX_ATTEMPTS, id__gt=last_id)
+            .order_by('id')[:batch_size]
+        )
+        if not batch:
+            return applied, failed
+        last_id = batch[-1].id
+        sessions = PaymentSession.objects.select_related('order__user').in_bulk(
+            {webhook.cashfree_order_id for webhook in batch}, field_name='cashfree_order_id'
+        )
+        for webhook in batch:
+            webhook.attempts += 1
+            try:
+                apply(webhook, sessions.get(webhook.cashfree_order_id))
+            except Exception as e:
+                webhook.last_error = str(e)
+                failed += 1
+            else:
+                webhook.processed = True
+                webhook.processed_at = timezone.now()
+                webhook.last_error = ''
+                applied += 1
+        PaymentWebhook.objects.bulk_update(batch, ['processed', 'processed_at', 'attempts', 'last_error'])
@@ -0,0 +1,138 @@
+"""
+Response cache for the public catalog endpoints.
+
+Entries are keyed on the request URL (host, path and normalized query params)
+together with generation tokens for the data the response depends on:
+
+* ``listings``: anything shown in product lists
+* ``taxonomy``: collections and tags, including their product counts
+* ``product:<id>``: everything on one product's detail page
+
+Model signals bump the affected tokens once the change commits, so stale
+entries are never read again and simply expire. The tokens live in the
+database (CatalogGeneration) rather than the cache, so every process sees a
+change as soon as it commits, even with a per-process cache backend.
+
+A token is a time in whole seconds, and every bump moves past all tokens
+handed out so far. The newest token of a response therefore doubles as its
+Last-Modified date without two versions ever sharing one; scopes that have
+not changed yet read as 0 and send none. The ETag is derived from the
+tokens too, unless a view supplies its own version, as the
+product detail view does from row timestamps.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .models import CatalogGeneration
+
+PREFIX = 'catalog'
+LISTINGS = 'listings'
+TAXONOMY = 'taxonomy'
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def product_scope(product_id):
+    return f'product:{product_id}'
+
+
+def next_generation():
+    """A token later than the current time and every token handed out so far"""
+    latest = CatalogGeneration.objects.aggregate(latest=Max('value'))['latest'] or 0
+    return max(int(time.time()), latest + 1)
+
+
+def get_generations(scopes):
+    """Current token of each scope, 0 for one that has not changed since tokens were kept"""
+    found = dict(CatalogGeneration.objects.filter(scope__in=scopes).values_list('scope', 'value'))
+    return [found.get(scope, 0) for scope in scopes]
+
+
+def bump(scopes):
+    value = next_generation()
+    CatalogGeneration.objects.bulk_create(
+        [CatalogGeneration(scope=scope, value=value) for scope in scopes],
+        update_conflicts=True, unique_fields=['scope'], update_fields=['value'],
+    )
+
+
+def invalidate(product_ids=(), listings=False, taxonomy=False):
+    """Retire cached responses for the given scopes when the current transaction commits"""
+    scopes = [product_scope(product_id) for product_id in set(product_ids)]
+    if listings:
+        scopes.append(LISTINGS)
+    if taxonomy:
+        scopes.append(TAXONOMY)
+    if scopes:
+        transaction.on_commit(lambda: bump(scopes))
+
+
+def invalidate_products(product_ids):
+    """For changes to a product's own fields, which show up in listings too"""
+    invalidate(product_ids, listings=True)
+
+
+def request_key(request, tokens):
+    params = sorted(
+        (name, value) for name, values in request.GET.lists() for value in values if value != ''
+    )
+    raw = '|'.join([request.scheme, request.get_host(), request.path, urlencode(params), *map(str, tokens)])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class CatalogCacheMixin:
+    """
+    Serves GET responses of a public view from the catalog cache, with ETag
+    and Last-Modified validators so clients can revalidate with a 304.
+    """
+    cache_scopes = (LISTINGS,)
+
+    def get_cache_scopes(self):
+        """Scopes the response depends on, or None to bypass the cache"""
+        return self.cache_scopes
+
+    def get_version(self, tokens):
+        """Values the ETag is derived from"""
+        return tokens
+
+    def get(self, request, *args, **kwargs):
+        scopes = self.get_cache_scopes()
+        if scopes is None:
+            return super().get(request, *args, **kwargs)
+
+        tokens = get_generations(scopes)
+        version = self.get_version(tokens)
+        etag = quote_etag(request_key(request, version))
+        last_modified = max(tokens) or None
+
+        # Validators are checked before the cache or the serializer is touched
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            cache = get_cache()
+            key = f'{PREFIX}:response:{request_key(request, [*tokens, *version])}'
+            data = cache.get(key)
+            if data is not None:
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+            else:
+                response = super().get(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+                response['X-Cache'] = 'MISS'
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
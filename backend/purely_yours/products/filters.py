@@ -1,5 +1,7 @@
 import django_filters
+from rest_framework import filters
 from .models import Product, Collection
+from . import search
 
 class ProductFilter(django_filters.FilterSet):
     collection = django_filters.ModelChoiceFilter(queryset=Collection.objects.all())
@@ -15,3 +17,20 @@ class ProductFilter(django_filters.FilterSet):
         if value:
             return queryset.filter(stock_quantity__gt=0)
         return queryset
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Full-text `?search=` through the product search index. Results are
+    ordered by relevance unless the client asked for an explicit ordering,
+    so this backend must run after OrderingFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        queryset = search.get_backend().filter_queryset(queryset, query)
+        if request.query_params.get(filters.OrderingFilter.ordering_param):
+            return queryset
+        return queryset.order_by('-search_rank', *queryset.query.order_by)
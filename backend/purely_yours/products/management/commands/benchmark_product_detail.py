@@ -0,0 +1,69 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from purely_yours.benchmark import benchmark_database, format_stats, measure
+
+
+class Command(BaseCommand):
+    help = 'Benchmark product detail requests: full render, cached render and 304 revalidation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variants', type=int, default=10)
+        parser.add_argument('--images', type=int, default=10)
+        parser.add_argument('--faqs', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        from rest_framework.test import APIClient
+
+        with benchmark_database():
+            self.generate_product(options)
+            client = APIClient()
+            url = '/api/products/benchmark-product/'
+            etag = client.get(url)['ETag']
+
+            def full_render():
+                cache.clear()
+                assert client.get(url).status_code == 200
+
+            def cached_render():
+                assert client.get(url).status_code == 200
+
+            def not_modified():
+                assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+            repeat = options['repeat']
+            self.stdout.write(format_stats('full render (cache cleared)', measure(full_render, repeat)))
+            self.stdout.write(format_stats('cached render', measure(cached_render, repeat)))
+            self.stdout.write(format_stats('304 Not Modified', measure(not_modified, repeat)))
+
+    def generate_product(self, options):
+        from products.models import FAQ, Collection, Product, ProductImage, ProductTag, ProductTagAssignment, ProductVariant
+
+        product = Product.objects.create(
+            name='Benchmark Product', slug='benchmark-product', sku='BENCH', price=499,
+            description='Ayurvedic blend ' * 50,
+            key_benefits=[f'Benefit {i}' for i in range(8)],
+            key_ingredients=[{'name': f'Ingredient {i}', 'description': 'Herb ' * 20} for i in range(8)],
+        )
+        product.collections.set(Collection.objects.bulk_create([
+            Collection(name=f'Collection {i}', slug=f'collection-{i}') for i in range(3)
+        ]))
+        ProductTagAssignment.objects.bulk_create([
+            ProductTagAssignment(product=product, tag=tag)
+            for tag in ProductTag.objects.bulk_create([
+                ProductTag(name=f'Tag {i}', slug=f'tag-{i}') for i in range(4)
+            ])
+        ])
+        ProductVariant.objects.bulk_create([
+            ProductVariant(id=i + 1, product=product, name=f'Pack of {i + 1}', sku=f'BENCH-{i}', price=499 + i)
+            for i in range(options['variants'])
+        ])
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'products/benchmark-{i}.webp', is_primary=i == 0, order=i)
+            for i in range(options['images'])
+        ])
+        FAQ.objects.bulk_create([
+            FAQ(product=product, question=f'Question {i}?', answer='Answer ' * 30, order=i)
+            for i in range(options['faqs'])
+        ])
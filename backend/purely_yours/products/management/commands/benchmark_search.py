@@ -0,0 +1,87 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from purely_yours.benchmark import benchmark_database, format_stats, measure
+
+WORDS = [
+    'ashwagandha', 'shilajit', 'amla', 'tulsi', 'neem', 'turmeric', 'giloy', 'brahmi', 'triphala',
+    'moringa', 'gokshura', 'punarnava', 'safed', 'musli', 'guggulu', 'arjuna', 'shatavari', 'kumkumadi',
+    'capsules', 'tea', 'oil', 'serum', 'powder', 'tablets', 'syrup', 'gummies', 'vati', 'taila',
+    'immunity', 'sleep', 'glow', 'detox', 'digestion', 'skin', 'hair', 'joint', 'liver', 'sugar', 'stress', 'energy',
+]
+
+QUERIES = ['ashwagandha', 'hair oil', 'skin glow serum', 'sleep', 'liver det', 'a']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-text product search against icontains filtering on a generated catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.generate_catalog(options['products'])
+            for query in QUERIES:
+                self.compare(query, options['repeat'])
+
+    def generate_catalog(self, count):
+        from products.models import Collection, Product
+        from products.search import get_backend
+
+        rng = random.Random(42)
+        collections = Collection.objects.bulk_create([
+            Collection(name=f'{word.title()} Care', slug=f'{word}-care') for word in WORDS[28:]
+        ])
+        batch = []
+        for i in range(count):
+            words = rng.sample(WORDS, 6)
+            batch.append(Product(
+                name=f"{' '.join(words[:3]).title()} {i}",
+                slug=f'product-{i}',
+                sku=f'SKU-{i}',
+                description=' '.join(rng.choices(WORDS, k=12)),
+                key_ingredients=[{'name': word.title()} for word in words[3:5]],
+                key_benefits=[f'Supports {words[5]}'],
+                price=rng.randint(100, 2000),
+            ))
+            if len(batch) == 2000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+        Membership = Product.collections.through
+        Membership.objects.bulk_create([
+            Membership(product_id=product_id, collection=rng.choice(collections))
+            for product_id in Product.objects.values_list('pk', flat=True)
+        ], batch_size=5000)
+
+        get_backend().rebuild()
+        self.stdout.write(f'Generated and indexed {count} products')
+
+    def compare(self, query, repeat):
+        from products.models import Product
+        from products.search import search
+
+        products = Product.objects.filter(is_active=True)
+
+        def full_text():
+            results = search(products, query)
+            results.count()
+            list(results.values_list('pk', flat=True)[:20])
+
+        def icontains():
+            results = products.filter(
+                Q(name__icontains=query) |
+                Q(description__icontains=query) |
+                Q(collections__name__icontains=query)
+            ).distinct()
+            results.count()
+            list(results.values_list('pk', flat=True)[:20])
+
+        self.stdout.write(f'\nQuery {query!r}: {search(products, query).count()} matches')
+        self.stdout.write(format_stats('  full-text index (count + first page)', measure(full_text, repeat)))
+        self.stdout.write(format_stats('  icontains scan (count + first page)', measure(icontains, repeat)))
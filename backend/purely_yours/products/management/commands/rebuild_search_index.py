@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Recreate the product full-text search index from the catalog'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild()
+        count = Product.objects.filter(is_active=True).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} active products with the {backend.vendor or "fallback"} search backend'
+        ))
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:13
+
+import django.db.models.deletion
+import products.search
+from django.db import migrations, models
+
+
+def build_search_index(apps, schema_editor):
+    products.search.get_backend(schema_editor.connection).rebuild(apps=apps)
+
+
+def drop_search_index(apps, schema_editor):
+    products.search.get_backend(schema_editor.connection).drop_index()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_rating_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='products.product')),
+                ('document', products.search.SearchDocumentField(db_column='products_search_index')),
+            ],
+            options={
+                'db_table': 'products_search_index',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
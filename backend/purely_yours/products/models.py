@@ -1,9 +1,23 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+from .search import INDEX_TABLE, SearchDocumentField
 
 User = get_user_model()
 
+class CollectionQuerySet(models.QuerySet):
+    def with_product_counts(self):
+        """Annotate each collection with its number of active products"""
+        active_products = Product.objects.filter(
+            is_active=True,
+            collections=models.OuterRef('pk')
+        ).order_by().values('collections').annotate(count=models.Count('pk')).values('count')
+        return self.annotate(
+            active_product_count=Coalesce(models.Subquery(active_products), 0)
+        )
+
 class Collection(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True)
@@ -12,6 +26,9 @@ class Collection(models.Model):
     is_active = models.BooleanField(default=True)
     show_on_homepage = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CollectionQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'Collections'
@@ -20,6 +37,114 @@ class Collection(models.Model):
     def __str__(self):
         return self.name
 
+def listing_prefetches(prefix=''):
+    """
+    Prefetches needed by ProductListSerializer. Pass a prefix such as
+    'product__' to apply them to products reached through a relation.
+    """
+    return [
+        models.Prefetch(
+            f'{prefix}images',
+            queryset=ProductImage.objects.filter(is_primary=True),
+            to_attr='primary_images'
+        ),
+        models.Prefetch(
+            f'{prefix}tag_assignments',
+            queryset=ProductTagAssignment.objects.select_related('tag').order_by('tag_id'),
+            to_attr='listing_tag_assignments'
+        ),
+        models.Prefetch(
+            f'{prefix}collections',
+            queryset=Collection.objects.with_product_counts()
+        ),
+    ]
+
+class ProductQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Products with everything ProductListSerializer reads, in a fixed number of queries"""
+        return self.prefetch_related(*listing_prefetches())
+
+    def with_versions(self):
+        """
+        Annotate the latest change time and row count of every relation the
+        detail page shows, each as a correlated subquery so the whole version
+        is read in one query. Counts catch deletions that leave the latest
+        timestamp unchanged.
+
+        The product counts shown with its collections move when other
+        products change, so the latest change time and active member count
+        of those collections are part of the version too.
+        """
+        related = {
+            'variants': (ProductVariant.objects.all(), 'updated_at'),
+            'images': (ProductImage.objects.all(), 'updated_at'),
+            'faqs': (FAQ.objects.all(), 'updated_at'),
+            'tags': (ProductTagAssignment.objects.all(), 'tag__updated_at'),
+            'collections': (Product.collections.through.objects.all(), 'collection__updated_at'),
+        }
+        annotations = {}
+        for name, (queryset, field) in related.items():
+            rows = queryset.filter(product=models.OuterRef('pk')).order_by().values('product')
+            annotations[f'{name}_updated_at'] = models.Subquery(
+                rows.annotate(latest=models.Max(field)).values('latest')
+            )
+            annotations[f'{name}_count'] = Coalesce(
+                models.Subquery(rows.annotate(total=models.Count('pk')).values('total')), 0
+            )
+
+        members = Product.collections.through.objects.filter(collection__products=models.OuterRef('pk')).order_by()
+        annotations['collection_products_updated_at'] = models.Subquery(
+            members.annotate(latest=models.Func('product__updated_at', function='MAX')).values('latest'),
+            output_field=models.DateTimeField()
+        )
+        annotations['collection_products_count'] = models.Subquery(
+            members.filter(product__is_active=True).annotate(
+                total=models.Func('pk', function='COUNT')
+            ).values('total'),
+            output_field=models.IntegerField()
+        )
+        return self.annotate(**annotations)
+
+    def with_user_state(self, user):
+        """
+        Annotate in_wishlist and cart_quantity for the given user, as one
+        EXISTS and one correlated subquery in the listing query itself
+        """
+        # Imported here: the cart and wishlist models depend on this module
+        from cart.models import CartItem
+        from wishlist.models import WishlistItem
+
+        in_cart = CartItem.objects.filter(
+            cart__user=user, product=models.OuterRef('pk')
+        ).order_by().values('product').annotate(total=models.Sum('quantity')).values('total')
+        return self.annotate(
+            in_wishlist=models.Exists(
+                WishlistItem.objects.filter(wishlist__user=user, product=models.OuterRef('pk'))
+            ),
+            cart_quantity=Coalesce(models.Subquery(in_cart), 0),
+        )
+
+    def adjust_rating_counters(self, rating_delta, count_delta):
+        """
+        Apply a review delta to the stored rating columns in one UPDATE.
+        The average is derived from the pre-update values plus the delta,
+        so concurrent adjustments never read a stale sum or count.
+        """
+        new_sum = models.F('rating_sum') + rating_delta
+        new_count = models.F('rating_count') + count_delta
+        return self.update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating_average=Coalesce(
+                models.ExpressionWrapper(
+                    Cast(new_sum, models.FloatField()) / NullIf(new_count, 0),
+                    output_field=models.DecimalField(max_digits=3, decimal_places=2)
+                ),
+                models.Value(0),
+                output_field=models.DecimalField(max_digits=3, decimal_places=2)
+            ),
+        )
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
@@ -47,13 +172,25 @@ class Product(models.Model):
     # SEO
     meta_title = models.CharField(max_length=255, blank=True)
     meta_description = models.TextField(blank=True)
+
+    # Review counters, maintained from reviews.ExternalReview writes
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Partial indexes, since is_active=True compiles to a bare boolean test
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True), name='product_active_created_idx'),
+            models.Index(fields=['price'], condition=models.Q(is_active=True), name='product_active_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -66,16 +203,31 @@ class Product(models.Model):
 
     @property
     def average_rating(self):
-        from reviews.models import Review
-        reviews = Review.objects.filter(product=self)
-        if reviews.exists():
-            return reviews.aggregate(models.Avg('rating'))['rating__avg']
-        return 0
+        return float(self.rating_average)
 
     @property
     def review_count(self):
-        from reviews.models import Review
-        return Review.objects.filter(product=self).count()
+        return self.rating_count
+
+class ProductSearchIndex(models.Model):
+    """
+    Read-only mapping of the full-text index maintained by products.search,
+    so product querysets can join it. The table is created by a migration
+    in the form the database supports.
+    """
+    product = models.OneToOneField(
+        Product,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name='search_index'
+    )
+    document = SearchDocumentField(db_column=INDEX_TABLE)
+
+    class Meta:
+        managed = False
+        db_table = INDEX_TABLE
 
 class ProductVariant(models.Model):
     id = models.BigIntegerField(primary_key=True)
@@ -87,6 +239,7 @@ class ProductVariant(models.Model):
     stock_quantity = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.product.name} - {self.name}"
@@ -103,19 +256,26 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
     order = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['product', 'is_primary']),
+        ]
 
     def save(self, *args, **kwargs):
         if self.is_primary:
             # Set all other images for this product to not primary
-            ProductImage.objects.filter(product=self.product, is_primary=True).update(is_primary=False)
+            ProductImage.objects.filter(product=self.product, is_primary=True).update(
+                is_primary=False, updated_at=timezone.now()
+            )
         super().save(*args, **kwargs)
 
 class ProductTag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -133,9 +293,21 @@ class FAQ(models.Model):
     answer = models.TextField()
     order = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['order']
 
     def __str__(self):
         return f"{self.product.name} - {self.question[:50]}"
+
+class CatalogGeneration(models.Model):
+    """
+    Generation of one catalog cache scope, see products/cache.py. Kept in the
+    database so that every process builds the same cache keys and validators.
+    """
+    scope = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField()  # Unix time in seconds, doubles as Last-Modified
+
+    def __str__(self):
+        return f"{self.scope} @ {self.value}"
@@ -0,0 +1,380 @@
+"""
+Full-text product search.
+
+Active products are indexed into a table keyed by product ID. On SQLite the
+table is an FTS5 virtual table ranked with bm25; on PostgreSQL it holds a
+weighted tsvector behind a GIN index. Other databases fall back to icontains
+filtering. Queries join the index through ProductSearchIndex, so results are
+de-duplicated and can be filtered, ranked and paginated like any queryset.
+"""
+import hashlib
+import re
+import time
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import NotSupportedError, connection, models, transaction
+
+INDEX_TABLE = 'products_search_index'
+
+# Indexed columns with their relevance weights
+COLUMNS = [
+    ('name', 10.0),
+    ('description', 1.0),
+    ('ingredients', 4.0),
+    ('benefits', 2.0),
+    ('tags', 5.0),
+    ('collections', 3.0),
+]
+
+# PostgreSQL only has four weight classes
+POSTGRES_WEIGHTS = {
+    'name': 'A',
+    'tags': 'B',
+    'ingredients': 'B',
+    'collections': 'C',
+    'benefits': 'C',
+    'description': 'D',
+}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+RESULTS_CACHE_PREFIX = 'product-search'
+GENERATION_KEY = f'{RESULTS_CACHE_PREFIX}:generation'
+
+
+def flatten_text(value):
+    """Join the strings found in a JSON value, e.g. key_ingredients entries"""
+    if isinstance(value, dict):
+        return ' '.join(flatten_text(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return ' '.join(flatten_text(item) for item in value)
+    if value is None:
+        return ''
+    return str(value)
+
+
+def collect_documents(product_ids=None, apps=global_apps):
+    """
+    Build the indexed text of active products in three queries.
+    Returns a dict of product ID to a dict of column text.
+    """
+    Product = apps.get_model('products', 'Product')
+    ProductTagAssignment = apps.get_model('products', 'ProductTagAssignment')
+    Membership = Product.collections.through
+
+    products = Product.objects.filter(is_active=True).order_by()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    documents = {}
+    for row in products.values('id', 'name', 'description', 'key_ingredients', 'key_benefits'):
+        documents[row['id']] = {
+            'name': row['name'],
+            'description': row['description'],
+            'ingredients': flatten_text(row['key_ingredients']),
+            'benefits': flatten_text(row['key_benefits']),
+            'tags': [],
+            'collections': [],
+        }
+
+    tag_rows = ProductTagAssignment.objects.filter(product_id__in=documents).values_list('product_id', 'tag__name')
+    for product_id, name in tag_rows:
+        documents[product_id]['tags'].append(name)
+    collection_rows = Membership.objects.filter(product_id__in=documents).values_list(
+        'product_id', 'collection__name'
+    )
+    for product_id, name in collection_rows:
+        documents[product_id]['collections'].append(name)
+
+    for document in documents.values():
+        document['tags'] = ' '.join(document['tags'])
+        document['collections'] = ' '.join(document['collections'])
+    return documents
+
+
+class SearchDocumentField(models.TextField):
+    """The index column full-text queries are matched against"""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    """`search_index__document__match=expression`, a full-text match on the index"""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        raise NotSupportedError(f'Full-text search is not supported on {connection.vendor}')
+
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} @@ to_tsquery('english', {rhs})", lhs_params + rhs_params
+
+
+class SearchRank(models.Func):
+    """Relevance of the joined index row, higher is better"""
+    output_field = models.FloatField()
+
+    def __init__(self, document, expression, **extra):
+        super().__init__(document, models.Value(expression), **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # FTS5 exposes bm25 with the configured column weights as the hidden
+        # `rank` column of the row being matched; lower is better.
+        alias = self.get_source_expressions()[0].alias
+        return f'-{connection.ops.quote_name(alias)}.rank', []
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        document, expression = self.get_source_expressions()
+        document_sql, document_params = compiler.compile(document)
+        expression_sql, expression_params = compiler.compile(expression)
+        return (
+            f"ts_rank({document_sql}, to_tsquery('english', {expression_sql}))",
+            document_params + expression_params
+        )
+
+
+class SearchBackend:
+    """icontains fallback for databases without a full-text index"""
+    vendor = None
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self):
+        pass
+
+    def drop_index(self):
+        pass
+
+    def index_products(self, product_ids=None, apps=global_apps):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self, apps=global_apps):
+        self.drop_index()
+        self.create_index()
+        self.index_products(apps=apps)
+
+    def parse_query(self, query):
+        return TOKEN_RE.findall(query.lower())
+
+    def filter_queryset(self, queryset, query):
+        """Restrict a Product queryset to matches, annotated with `search_rank`"""
+        terms = self.parse_query(query)
+        if not terms:
+            return queryset.none()
+        from .models import Product
+        matches = Product.objects.all()
+        for term in terms:
+            matches = matches.filter(
+                models.Q(name__icontains=term) |
+                models.Q(description__icontains=term) |
+                models.Q(collections__name__icontains=term) |
+                models.Q(tag_assignments__tag__name__icontains=term)
+            )
+        return queryset.filter(pk__in=matches.values('pk')).annotate(
+            search_rank=models.Case(
+                models.When(name__icontains=terms[0], then=models.Value(1.0)),
+                default=models.Value(0.0),
+                output_field=models.FloatField()
+            )
+        )
+
+    def search(self, queryset, query):
+        """Ranked matches of a Product queryset, best first"""
+        return self.filter_queryset(queryset, query).order_by('-search_rank', '-created_at')
+
+
+class SQLiteSearchBackend(SearchBackend):
+    vendor = 'sqlite'
+
+    def create_index(self):
+        columns = ', '.join(name for name, weight in COLUMNS)
+        weights = ', '.join(str(weight) for name, weight in COLUMNS)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} "
+                f"USING fts5({columns}, tokenize='porter unicode61')"
+            )
+            # Persist the column weights so the `rank` column applies them
+            cursor.execute(
+                f"INSERT INTO {INDEX_TABLE}({INDEX_TABLE}, rank) VALUES ('rank', %s)",
+                [f'bm25({weights})']
+            )
+
+    def drop_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+    def index_products(self, product_ids=None, apps=global_apps):
+        documents = collect_documents(product_ids, apps=apps)
+        columns = [name for name, weight in COLUMNS]
+        with self.connection.cursor() as cursor:
+            if product_ids is not None:
+                self.remove_products(product_ids)
+            else:
+                cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+            cursor.executemany(
+                f"INSERT INTO {INDEX_TABLE}(rowid, {', '.join(columns)}) "
+                f"VALUES (%s, {', '.join(['%s'] * len(columns))})",
+                [[product_id] + [document[name] for name in columns] for product_id, document in documents.items()]
+            )
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {INDEX_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(product_ids))})",
+                product_ids
+            )
+
+    def to_match_expression(self, terms):
+        # Every term must match; the last one may be a prefix of a word
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def filter_queryset(self, queryset, query):
+        terms = self.parse_query(query)
+        if not terms:
+            return queryset.none()
+        expression = self.to_match_expression(terms)
+        return queryset.filter(search_index__document__match=expression).annotate(
+            search_rank=SearchRank('search_index__document', expression)
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    vendor = 'postgresql'
+
+    def create_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+                f"rowid bigint PRIMARY KEY REFERENCES products_product(id) ON DELETE CASCADE, "
+                f"{INDEX_TABLE} tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_gin ON {INDEX_TABLE} USING GIN ({INDEX_TABLE})"
+            )
+
+    def drop_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+    def index_products(self, product_ids=None, apps=global_apps):
+        documents = collect_documents(product_ids, apps=apps)
+        columns = [name for name, weight in COLUMNS]
+        vector = ' || '.join(
+            f"setweight(to_tsvector('english', %s), '{POSTGRES_WEIGHTS[name]}')" for name in columns
+        )
+        with self.connection.cursor() as cursor:
+            if product_ids is not None:
+                self.remove_products(product_ids)
+            else:
+                cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+            cursor.executemany(
+                f"INSERT INTO {INDEX_TABLE}(rowid, {INDEX_TABLE}) VALUES (%s, {vector})",
+                [[product_id] + [document[name] for name in columns] for product_id, document in documents.items()]
+            )
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = ANY(%s)', [product_ids])
+
+    def to_match_expression(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def filter_queryset(self, queryset, query):
+        terms = self.parse_query(query)
+        if not terms:
+            return queryset.none()
+        expression = self.to_match_expression(terms)
+        return queryset.filter(search_index__document__match=expression).annotate(
+            search_rank=SearchRank('search_index__document', expression)
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using=None):
+    """The search backend for a database connection, the default one unless given"""
+    if using is None:
+        using = connection
+    return BACKENDS.get(using.vendor, SearchBackend)(using)
+
+
+def index_products(product_ids):
+    """Reindex products after a change; inactive or deleted ones are dropped"""
+    get_backend().index_products(product_ids)
+    invalidate_results()
+
+
+def remove_products(product_ids):
+    get_backend().remove_products(product_ids)
+    invalidate_results()
+
+
+def search(queryset, query):
+    return get_backend().search(queryset, query)
+
+
+def normalize_query(query):
+    return ' '.join(TOKEN_RE.findall(query.lower()))
+
+
+def invalidate_results():
+    """
+    Retire every cached result list by moving to a new generation once the
+    change commits, so no request can cache pre-commit results under it
+    """
+    transaction.on_commit(lambda: cache.set(GENERATION_KEY, time.time_ns(), timeout=None))
+
+
+def cached_result_ids(query, collection=''):
+    """
+    Ranked IDs of the active products matching a query, capped at
+    PRODUCT_SEARCH_MAX_RESULTS, and whether more matched than the cap.
+    With a shared cache, results are cached per normalized query and
+    collection until the TTL expires or any product is reindexed.
+    """
+    normalized = normalize_query(query)
+    timeout = settings.PRODUCT_SEARCH_CACHE_TIMEOUT
+    key = None
+    if timeout:
+        # An evicted generation restarts at the current time, never at a value older entries used
+        generation = cache.get_or_set(GENERATION_KEY, time.time_ns(), timeout=None)
+        digest = hashlib.sha1(f'{normalized}|{collection}'.encode()).hexdigest()
+        key = f'{RESULTS_CACHE_PREFIX}:{generation}:{digest}'
+
+    ids = cache.get(key) if key else None
+    if ids is None:
+        from .models import Product
+        products = Product.objects.filter(is_active=True)
+        if collection:
+            products = products.filter(collections__slug=collection)
+        if normalized:
+            products = search(products, normalized)
+        # One past the cap tells a full list from a truncated one
+        ids = list(products.values_list('pk', flat=True)[:settings.PRODUCT_SEARCH_MAX_RESULTS + 1])
+        if key:
+            cache.set(key, ids, timeout)
+    return ids[:settings.PRODUCT_SEARCH_MAX_RESULTS], len(ids) > settings.PRODUCT_SEARCH_MAX_RESULTS
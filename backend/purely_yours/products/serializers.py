@@ -9,6 +9,8 @@ class CollectionSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'image', 'product_count','show_on_homepage']
 
     def get_product_count(self, obj):
+        if hasattr(obj, 'active_product_count'):
+            return obj.active_product_count
         return obj.products.filter(is_active=True).count()
 
 class ProductImageSerializer(serializers.ModelSerializer):
@@ -35,12 +37,16 @@ class FAQSerializer(serializers.ModelSerializer):
         fields = ['id', 'question', 'answer', 'order']
 
 class ProductListSerializer(serializers.ModelSerializer):
+    """
+    Reads the prefetches added by Product.objects.for_listing() when they are
+    present, and falls back to per-object queries otherwise.
+    """
     collections = CollectionSerializer(many=True, read_only=True)
     tags = serializers.SerializerMethodField()
     primary_image = serializers.SerializerMethodField()
     discount_percentage = serializers.ReadOnlyField()
-    average_rating = serializers.ReadOnlyField()
-    review_count = serializers.ReadOnlyField()
+    average_rating = serializers.FloatField(source='rating_average', read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
 
     class Meta:
         model = Product
@@ -49,18 +55,28 @@ class ProductListSerializer(serializers.ModelSerializer):
                  'average_rating', 'review_count', 'stock_quantity']
 
     def get_primary_image(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
+        if hasattr(obj, 'primary_images'):
+            primary_image = obj.primary_images[0] if obj.primary_images else None
+        else:
+            primary_image = obj.images.filter(is_primary=True).first()
         if primary_image:
             return self.context['request'].build_absolute_uri(primary_image.image.url)
         return None
 
     def get_tags(self, obj):
-        tags = ProductTag.objects.filter(product_assignments__product=obj)
+        if hasattr(obj, 'listing_tag_assignments'):
+            tags = [assignment.tag for assignment in obj.listing_tag_assignments]
+        else:
+            tags = ProductTag.objects.filter(product_assignments__product=obj)
         return ProductTagSerializer(tags, many=True).data
-        primary_image = obj.images.filter(is_primary=True).first()
-        if primary_image:
-            return self.context['request'].build_absolute_uri(primary_image.image.url)
-        return None
+
+class ProductUserStateSerializer(ProductListSerializer):
+    """Listing fields plus the annotations from Product.objects.with_user_state()"""
+    in_wishlist = serializers.BooleanField(read_only=True)
+    cart_quantity = serializers.IntegerField(read_only=True)
+
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ['in_wishlist', 'cart_quantity']
 
 class ProductDetailSerializer(serializers.ModelSerializer):
     collections = CollectionSerializer(many=True, read_only=True)
@@ -69,8 +85,8 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     tags = serializers.SerializerMethodField()
     faqs = FAQSerializer(many=True, read_only=True)
     discount_percentage = serializers.ReadOnlyField()
-    average_rating = serializers.ReadOnlyField()
-    review_count = serializers.ReadOnlyField()
+    average_rating = serializers.FloatField(source='rating_average', read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
 
     class Meta:
         model = Product
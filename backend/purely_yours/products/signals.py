@@ -0,0 +1,100 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import cache as catalog_cache
+from . import search
+from .models import FAQ, Collection, Product, ProductImage, ProductTag, ProductTagAssignment, ProductVariant
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.collections.through)
+def index_collection_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # pk_set is not provided when clearing a collection, so note its products now
+        instance._cleared_product_ids = list(instance.products.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        search.index_products(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        search.index_products(getattr(instance, '_cleared_product_ids', []) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=ProductTagAssignment)
+@receiver(post_delete, sender=ProductTagAssignment)
+def index_tag_assignment(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        search.index_products([instance.product_id])
+
+
+@receiver(post_save, sender=Collection)
+def index_collection_products(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        search.index_products(list(instance.products.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=Collection)
+def note_collection_products(sender, instance, **kwargs):
+    instance._deleted_product_ids = list(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Collection)
+def index_deleted_collection_products(sender, instance, **kwargs):
+    search.index_products(getattr(instance, '_deleted_product_ids', []))
+
+
+@receiver(post_save, sender=ProductTag)
+def index_tag_products(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        search.index_products(list(
+            ProductTagAssignment.objects.filter(tag=instance).values_list('product_id', flat=True)
+        ))
+
+
+# Catalog response cache. Product changes also reach collection product counts.
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    catalog_cache.invalidate([instance.pk], listings=True, taxonomy=True)
+
+
+@receiver(m2m_changed, sender=Product.collections.through)
+def invalidate_collection_membership_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            product_ids = pk_set or getattr(instance, '_cleared_product_ids', [])
+        else:
+            product_ids = [instance.pk]
+        catalog_cache.invalidate(product_ids, listings=True, taxonomy=True)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductTagAssignment)
+@receiver(post_delete, sender=ProductTagAssignment)
+def invalidate_listed_relation_responses(sender, instance, **kwargs):
+    catalog_cache.invalidate_products([instance.product_id])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=FAQ)
+@receiver(post_delete, sender=FAQ)
+def invalidate_detail_relation_responses(sender, instance, **kwargs):
+    catalog_cache.invalidate([instance.product_id])
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=ProductTag)
+@receiver(post_delete, sender=ProductTag)
+def invalidate_taxonomy_responses(sender, instance, **kwargs):
+    catalog_cache.invalidate(listings=True, taxonomy=True)
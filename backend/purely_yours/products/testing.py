@@ -0,0 +1,17 @@
+"""Fixtures shared by the test suites of the apps that sell products"""
+from .models import Product
+
+
+def make_product(slug='oil', **fields):
+    """
+    Create an active product. The name and SKU follow the slug and the price
+    is 100 unless given, so a test only spells out the fields it is about.
+    """
+    fields = {
+        'name': slug.replace('-', ' ').title(),
+        'description': '',
+        'sku': slug.upper(),
+        'price': 100,
+        **fields,
+    }
+    return Product.objects.create(slug=slug, **fields)
@@ -1,3 +1,599 @@
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .cache import LISTINGS, bump
+from .models import FAQ, Collection, Product, ProductImage, ProductTag, ProductTagAssignment, ProductVariant
+from .search import GENERATION_KEY, search
+from .testing import make_product
+from cart.models import Cart, CartItem
+from reviews.models import ExternalReview
+from wishlist.models import Wishlist, WishlistItem
+
+User = get_user_model()
+
+
+def make_catalog(count, start=0):
+    collection, _ = Collection.objects.get_or_create(name='Wellness', slug='wellness')
+    tag, _ = ProductTag.objects.get_or_create(name='Bestseller', slug='bestseller')
+    user, _ = User.objects.get_or_create(email='reviewer@example.com', defaults={'username': 'reviewer'})
+    products = []
+    for i in range(start, start + count):
+        product = make_product(
+            f'product-{i}',
+            name=f'Product {i}',
+            description=f'Description {i}',
+            sku=f'SKU-{i}',
+            price=100 + i,
+            original_price=200 + i,
+            stock_quantity=10,
+        )
+        product.collections.add(collection)
+        ProductTagAssignment.objects.create(product=product, tag=tag)
+        ProductImage.objects.create(
+            product=product,
+            image=f'products/product-{i}.webp',
+            is_primary=True,
+        )
+        ExternalReview.objects.create(
+            review_id=uuid.uuid4(), product=product, product_title=product.name, rating=4,
+            author=user.email, timestamp=timezone.now(), body='Good',
+        )
+        products.append(product)
+    return products
+
+
+class ProductListingQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        cache.clear()  # measure the database path, not the response cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_listing_query_count_does_not_grow_with_page_size(self):
+        make_catalog(2)
+        small, _ = self.count_queries('/api/products/')
+        make_catalog(18, start=2)
+        large, response = self.count_queries('/api/products/')
+
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 6)  # including the catalog cache's generation read
+
+    def test_collection_tag_and_search_views_use_fixed_queries(self):
+        make_catalog(2)
+        small = [
+            self.count_queries(url)[0]
+            for url in ('/api/products/collections/wellness/',
+                        '/api/products/tags/bestseller/',
+                        '/api/products/search/?q=Product')
+        ]
+        make_catalog(10, start=2)
+        large = [
+            self.count_queries(url)[0]
+            for url in ('/api/products/collections/wellness/',
+                        '/api/products/tags/bestseller/',
+                        '/api/products/search/?q=Product')
+        ]
+        self.assertEqual(small, large)
+
+    def test_listing_payload_reads_prefetched_data(self):
+        make_catalog(1)
+        make_product('hidden', is_active=False).collections.add(Collection.objects.get())
+        response = self.client.get('/api/products/')
+        item = response.data['results'][0]
+
+        self.assertTrue(item['primary_image'].endswith('.webp'))
+        self.assertEqual(item['tags'], [{'id': ProductTag.objects.get().id, 'name': 'Bestseller', 'slug': 'bestseller'}])
+        self.assertEqual(item['collections'][0]['product_count'], 1)
+        self.assertEqual(item['average_rating'], 4)
+        self.assertEqual(item['review_count'], 1)
+
+
+class ProductUserStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill(self, products):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        wishlist, _ = Wishlist.objects.get_or_create(user=self.user)
+        for i, product in enumerate(products):
+            if i % 2:
+                WishlistItem.objects.create(wishlist=wishlist, product=product)
+            CartItem.objects.create(cart=cart, product=product, quantity=i + 1)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_user_state_is_annotated_in_the_listing_query(self):
+        self.fill(make_catalog(2))
+        small, _ = self.count_queries('/api/products/?annotate=user_state')
+        self.fill(make_catalog(10, start=2))
+        large, response = self.count_queries('/api/products/?annotate=user_state')
+        cache.clear()
+        plain, _ = self.count_queries('/api/products/')
+
+        self.assertEqual(small, large)
+        self.assertEqual(large, plain - 1)  # the listing's own queries, less the cache's generation read
+        state = {item['slug']: (item['in_wishlist'], item['cart_quantity']) for item in response.data['results']}
+        self.assertEqual(state['product-0'], (False, 1))
+        self.assertEqual(state['product-1'], (True, 2))
+
+    def test_other_users_state_and_views(self):
+        products = make_catalog(2)
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass')
+        CartItem.objects.create(cart=Cart.objects.create(user=other), product=products[0], quantity=5)
+        WishlistItem.objects.create(wishlist=Wishlist.objects.create(user=other), product=products[0])
+
+        for url in ('/api/products/collections/wellness/', '/api/products/tags/bestseller/'):
+            item = self.client.get(f'{url}?annotate=user_state').data['results'][0]
+            self.assertEqual((item['in_wishlist'], item['cart_quantity']), (False, 0))
+
+    def test_user_state_bypasses_the_shared_cache(self):
+        products = make_catalog(1)
+        self.client.get('/api/products/?annotate=user_state')
+        self.fill(products)
+        response = self.client.get('/api/products/?annotate=user_state')
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual(response.data['results'][0]['cart_quantity'], 1)
+
+        anonymous = APIClient().get('/api/products/?annotate=user_state')
+        self.assertEqual(anonymous['X-Cache'], 'MISS')
+        self.assertNotIn('in_wishlist', anonymous.data['results'][0])
+
+
+def search_slugs(query, queryset=None):
+    if queryset is None:
+        queryset = Product.objects.filter(is_active=True)
+    return list(search(queryset, query).values_list('slug', flat=True))
+
+
+class ProductSearchTests(TestCase):
+    def test_name_matches_rank_above_description_matches(self):
+        make_product('tea', name='Herbal Tea', description='A calming blend with ashwagandha')
+        make_product('ashwa', name='Ashwagandha Capsules', description='Daily support')
+        self.assertEqual(search_slugs('ashwagandha'), ['ashwa', 'tea'])
+
+    def test_last_term_matches_as_prefix(self):
+        make_product('ashwa', name='Ashwagandha Capsules')
+        self.assertEqual(search_slugs('ashwa'), ['ashwa'])
+        self.assertEqual(search_slugs('capsules ashwag'), ['ashwa'])
+
+    def test_json_fields_tags_and_collections_are_indexed(self):
+        product = make_product(
+            'prost', name='Prost Plus',
+            key_ingredients=[{'name': 'Gokshura', 'description': 'Urinary comfort'}],
+            key_benefits=['Supports vitality'],
+        )
+        ProductTagAssignment.objects.create(product=product, tag=ProductTag.objects.create(name='Bestseller', slug='bestseller'))
+        Collection.objects.create(name='Male Wellness', slug='male-wellness').products.add(product)
+
+        for query in ['gokshura', 'vitality', 'bestseller', 'wellness']:
+            self.assertEqual(search_slugs(query), ['prost'], query)
+
+    def test_results_are_not_duplicated_by_collections(self):
+        product = make_product('gut', name='Gut Care', description='For gut health')
+        product.collections.add(
+            Collection.objects.create(name='Gut Health', slug='gut-health'),
+            Collection.objects.create(name='Gut Wellness', slug='gut-wellness'),
+        )
+        self.assertEqual(search_slugs('gut'), ['gut'])
+
+    def test_index_follows_product_and_relation_changes(self):
+        product = make_product('sleep', name='Sleep Fuel')
+        collection = Collection.objects.create(name='Night Care', slug='night-care')
+        collection.products.add(product)
+        tag = ProductTag.objects.create(name='Calm', slug='calm')
+        ProductTagAssignment.objects.create(product=product, tag=tag)
+
+        product.name = 'Rest Fuel'
+        product.save()
+        self.assertEqual(search_slugs('sleep'), [])
+        self.assertEqual(search_slugs('rest'), ['sleep'])
+
+        collection.name = 'Bedtime Care'
+        collection.save()
+        self.assertEqual(search_slugs('bedtime'), ['sleep'])
+        collection.products.clear()
+        self.assertEqual(search_slugs('bedtime'), [])
+
+        tag.name = 'Soothing'
+        tag.save()
+        self.assertEqual(search_slugs('soothing'), ['sleep'])
+        tag.delete()
+        self.assertEqual(search_slugs('soothing'), [])
+
+        product.is_active = False
+        product.save()
+        self.assertEqual(search_slugs('rest', Product.objects.all()), [])
+
+    def test_search_can_be_combined_with_filters(self):
+        product = make_product('amla', name='Amla Juice')
+        make_product('amla-candy', name='Amla Candy')
+        Collection.objects.create(name='Drinks', slug='drinks').products.add(product)
+        self.assertEqual(search_slugs('amla', Product.objects.filter(collections__slug='drinks')), ['amla'])
+
+
+@override_settings(PRODUCT_SEARCH_CACHE_TIMEOUT=300)  # as with a shared cache backend
+class ProductSearchViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        make_product('oil', name='Neelibhringadi Hair Oil', description='Hair growth oil')
+        make_product('serum', name='Face Serum', description='Not for hair')
+        make_product('hidden', name='Hidden Hair Oil', is_active=False)
+
+    def test_list_view_search_is_ranked(self):
+        response = self.client.get('/api/products/', {'search': 'hair'})
+        self.assertEqual([p['slug'] for p in response.data['results']], ['oil', 'serum'])
+
+    def test_list_view_search_respects_explicit_ordering(self):
+        response = self.client.get('/api/products/', {'search': 'hair', 'ordering': 'name'})
+        self.assertEqual([p['slug'] for p in response.data['results']], ['serum', 'oil'])
+
+    def test_search_endpoint_returns_ranked_matches(self):
+        response = self.client.get('/api/products/search/', {'q': 'hair oil'})
+        self.assertEqual([p['slug'] for p in response.data['results']], ['oil'])
+        self.assertEqual(response.data['count'], 1)
+
+    def test_search_endpoint_is_paginated(self):
+        for i in range(3):
+            make_product(f'oil-{i}', name=f'Hair Oil {i}')
+        response = self.client.get('/api/products/search/', {'q': 'hair', 'page_size': 2, 'page': 3})
+
+        self.assertEqual(response.data['count'], 5)
+        self.assertFalse(response.data['count_capped'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+        self.assertEqual(response.data['query'], 'hair')
+
+    @override_settings(PRODUCT_SEARCH_MAX_RESULTS=3)
+    def test_capped_results_say_so(self):
+        for i in range(3):
+            make_product(f'oil-{i}', name=f'Hair Oil {i}')
+        response = self.client.get('/api/products/search/', {'q': 'hair'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertTrue(response.data['count_capped'])
+
+    def test_search_results_are_cached_per_normalized_query(self):
+        self.client.get('/api/products/search/', {'q': 'Hair  OIL'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/search/', {'q': 'hair oil'})
+
+        self.assertEqual([p['slug'] for p in response.data['results']], ['oil'])
+        self.assertFalse(any('products_search_index' in q['sql'] for q in ctx.captured_queries))
+
+    @override_settings(PRODUCT_SEARCH_CACHE_TIMEOUT=0)
+    def test_results_are_not_cached_without_a_shared_cache(self):
+        self.client.get('/api/products/search/', {'q': 'hair oil'})
+        # A queryset update sends no signals, like a change made by another process
+        Product.objects.filter(slug='oil').update(is_active=False)
+        response = self.client.get('/api/products/search/', {'q': 'hair oil'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_product_changes_invalidate_cached_results(self):
+        self.client.get('/api/products/search/', {'q': 'hair oil'})
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product('new-oil', name='Bhringraj Hair Oil')
+            Product.objects.get(slug='oil').delete()
+
+        response = self.client.get('/api/products/search/', {'q': 'hair oil'})
+        self.assertEqual([p['slug'] for p in response.data['results']], ['new-oil'])
+
+    def test_results_are_retired_when_the_change_commits(self):
+        self.client.get('/api/products/search/', {'q': 'hair oil'})
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product('new-oil', name='Bhringraj Hair Oil')
+            # Requests racing the transaction still cache under the old generation
+            generation = cache.get(GENERATION_KEY)
+        self.assertNotEqual(cache.get(GENERATION_KEY), generation)
+
+
+class StubRedis:
+    """
+    A local stand-in for a Redis server: enough of the protocol (RESP2)
+    and of the commands for Django's RedisCache, kept in one dict
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self.commands = []
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                return args
+
+            def handle(self):
+                queued = None
+                while (args := self.read_command()) is not None:
+                    name = args[0].decode().upper()
+                    stub.commands.append(name)
+                    if name == 'MULTI':
+                        queued, reply = [], 'OK'
+                    elif name == 'EXEC':
+                        reply, queued = [stub.execute(*command) for command in queued], None
+                    elif queued is not None:
+                        queued.append((name, args[1:]))
+                        reply = 'QUEUED'
+                    else:
+                        reply = stub.execute(name, args[1:])
+                    self.wfile.write(encode(reply))
+
+        def encode(reply):
+            if reply is None:
+                return b'$-1\r\n'
+            if isinstance(reply, Exception):
+                return f'-ERR {reply}\r\n'.encode()
+            if isinstance(reply, int):
+                return f':{reply}\r\n'.encode()
+            if isinstance(reply, str):
+                return f'+{reply}\r\n'.encode()
+            if isinstance(reply, list):
+                return f'*{len(reply)}\r\n'.encode() + b''.join(encode(item) for item in reply)
+            return f'${len(reply)}\r\n'.encode() + reply + b'\r\n'
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'redis://127.0.0.1:{self.server.server_address[1]}/0'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def live(self, key):
+        if key in self.expiry and self.expiry[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expiry.pop(key)
+        return key in self.data
+
+    def execute(self, name, args):
+        if name == 'GET':
+            return self.data[args[0]] if self.live(args[0]) else None
+        if name == 'MGET':
+            return [self.data[key] if self.live(key) else None for key in args]
+        if name == 'SET':
+            key, value, *options = args
+            options = [option.decode().upper() for option in options]
+            if 'NX' in options and self.live(key):
+                return None
+            self.data[key] = value
+            self.expiry.pop(key, None)
+            for unit, scale in (('EX', 1), ('PX', 0.001)):
+                if unit in options:
+                    self.expiry[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+            return 'OK'
+        if name == 'MSET':
+            for key, value in zip(args[::2], args[1::2]):
+                self.data[key] = value
+                self.expiry.pop(key, None)
+            return 'OK'
+        if name == 'DEL':
+            deleted = [key for key in args if self.live(key)]
+            for key in deleted:
+                del self.data[key]
+                self.expiry.pop(key, None)
+            return len(deleted)
+        if name == 'EXISTS':
+            return sum(self.live(key) for key in args)
+        if name == 'INCRBY':
+            value = int(self.data[args[0]] if self.live(args[0]) else 0) + int(args[1])
+            self.data[args[0]] = str(value).encode()
+            return value
+        if name == 'EXPIRE':
+            if not self.live(args[0]):
+                return 0
+            self.expiry[args[0]] = time.monotonic() + int(args[1])
+            return 1
+        if name == 'PERSIST':
+            return int(self.live(args[0]) and self.expiry.pop(args[0], None) is not None)
+        if name == 'FLUSHDB':
+            self.data.clear()
+            self.expiry.clear()
+            return 'OK'
+        return Exception(f"unknown command '{name}'")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CatalogResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.collection = Collection.objects.create(name='Hair Care', slug='hair-care')
+        self.product = make_product('hair-oil', sku='OIL')
+        self.product.collections.add(self.collection)
+        self.other = make_product('face-serum', sku='SERUM', price=200)
+
+    def change(self, func):
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+
+    def test_repeat_requests_are_served_from_cache(self):
+        first = self.client.get('/api/products/', {'ordering': 'name', 'page': 1})
+        with self.assertNumQueries(1):  # the generations
+            second = self.client.get('/api/products/', {'page': 1, 'ordering': 'name', 'min_price': ''})
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_etag_and_last_modified_allow_304(self):
+        response = self.client.get('/api/products/hair-oil/')
+        not_modified = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        self.change(lambda: FAQ.objects.create(product=self.product, question='Q', answer='A'))
+        changed = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.data['faqs']), 1)
+
+        not_modified = self.client.get('/api/products/hair-oil/', HTTP_IF_MODIFIED_SINCE=changed['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_last_modified_moves_on_within_the_same_second(self):
+        self.change(lambda: self.product.collections.remove(self.collection))
+        response = self.client.get('/api/products/')
+        self.change(lambda: FAQ.objects.create(product=self.product, question='Q', answer='A'))
+        self.change(lambda: ProductVariant.objects.create(
+            id=4002, product=self.other, name='50ml', sku='SERUM-50', price=150
+        ))
+        self.change(lambda: self.other.collections.add(self.collection))
+
+        changed = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['Last-Modified'], response['Last-Modified'])
+
+    def test_generations_are_shared_between_processes(self):
+        response = self.client.get('/api/products/')
+
+        # A process with its own, empty cache agrees on the validators
+        cache.clear()
+        not_modified = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # A change committed by another process retires this process's entries
+        self.client.get('/api/products/')
+        self.assertEqual(self.client.get('/api/products/')['X-Cache'], 'HIT')
+        bump([LISTINGS])
+        self.assertEqual(self.client.get('/api/products/')['X-Cache'], 'MISS')
+
+    def test_detail_etag_is_derived_from_row_versions(self):
+        etag = self.client.get('/api/products/hair-oil/')['ETag']
+
+        with self.assertNumQueries(2):
+            not_modified = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Changes that bypass signals still move the version
+        FAQ.objects.create(product=self.product, question='Q', answer='A')
+        added = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(added.status_code, 200)
+        FAQ.objects.filter(product=self.product).delete()
+        removed = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=added['ETag'])
+        self.assertEqual(removed.status_code, 200)
+        self.assertEqual(removed['ETag'], etag)
+
+    def test_detail_etag_follows_collection_changes(self):
+        response = self.client.get('/api/products/hair-oil/')
+        self.change(lambda: self.other.collections.add(self.collection))
+
+        changed = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_detail_etag_only_follows_its_own_collections(self):
+        self.other.collections.add(self.collection)
+        etag = self.client.get('/api/products/hair-oil/')['ETag']
+
+        self.change(lambda: Collection.objects.create(name='Skin Care', slug='skin-care'))
+        unrelated = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(unrelated.status_code, 304)
+
+        # Another member leaving the collection's count, even without signals
+        Product.objects.filter(pk=self.other.pk).update(is_active=False)
+        changed = self.client.get('/api/products/hair-oil/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['collections'][0]['product_count'], 1)
+
+    def test_detail_changes_only_invalidate_that_product(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/face-serum/')
+        self.change(lambda: ProductVariant.objects.create(
+            id=4001, product=self.product, name='200ml', sku='OIL-200', price=180
+        ))
+
+        self.assertEqual(self.client.get('/api/products/')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/products/face-serum/')['X-Cache'], 'HIT')
+        response = self.client.get('/api/products/hair-oil/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['variants'][0]['sku'], 'OIL-200')
+
+    def test_product_and_collection_changes_invalidate_listings(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/collections/')
+
+        def rename():
+            self.product.name = 'Bhringraj Hair Oil'
+            self.product.save()
+        self.change(rename)
+        names = [p['name'] for p in self.client.get('/api/products/').data['results']]
+        self.assertIn('Bhringraj Hair Oil', names)
+
+        self.change(lambda: self.product.collections.remove(self.collection))
+        collections = self.client.get('/api/products/collections/').data
+        self.assertEqual(collections[0]['product_count'], 0)
+
+    def test_review_counters_invalidate_listings(self):
+        self.client.get('/api/products/hair-oil/')
+        self.change(lambda: ExternalReview.objects.create(
+            review_id=uuid.uuid4(), product=self.product, product_title=self.product.name,
+            rating=5, author='a@example.com', timestamp=timezone.now(), body='Great',
+        ))
+        self.assertEqual(self.client.get('/api/products/hair-oil/').data['review_count'], 1)
+
+    def test_missing_products_are_not_cached(self):
+        self.assertEqual(self.client.get('/api/products/unknown/').status_code, 404)
+        self.change(lambda: make_product('unknown'))
+        self.assertEqual(self.client.get('/api/products/unknown/').status_code, 200)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}
+            with override_settings(CACHES=caches):
+                self.client.get('/api/products/tags/')
+                self.assertEqual(self.client.get('/api/products/tags/')['X-Cache'], 'HIT')
+
+    def test_redis_backend(self):
+        redis = StubRedis()
+        self.addCleanup(redis.stop)
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': redis.url,
+        }}
+        with override_settings(CACHES=caches):
+            self.client.get('/api/products/tags/')
+            self.assertEqual(self.client.get('/api/products/tags/')['X-Cache'], 'HIT')
+            self.change(lambda: ProductTag.objects.create(name='Vegan', slug='vegan'))
+            response = self.client.get('/api/products/tags/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([tag['slug'] for tag in response.data], ['vegan'])
+        self.assertIn('GET', redis.commands)
+
+
 true = True
 false = False
 null = None
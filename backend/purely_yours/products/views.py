@@ -1,48 +1,101 @@
 from rest_framework import generics, filters, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
 from .models import Collection, Product, ProductTag
-from .serializers import CollectionSerializer, ProductListSerializer, ProductDetailSerializer, ProductTagSerializer
-from .filters import ProductFilter
+from .serializers import (
+    CollectionSerializer, ProductListSerializer, ProductDetailSerializer, ProductTagSerializer,
+    ProductUserStateSerializer,
+)
+from .filters import ProductFilter, ProductSearchFilter
+from .cache import LISTINGS, TAXONOMY, CatalogCacheMixin, product_scope
+from . import search
 
-class CollectionListView(generics.ListAPIView):
-    queryset = Collection.objects.filter(is_active=True)
+class CollectionListView(CatalogCacheMixin, generics.ListAPIView):
+    cache_scopes = (TAXONOMY, LISTINGS)
+    queryset = Collection.objects.filter(is_active=True).with_product_counts()
     serializer_class = CollectionSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
-class TagListView(generics.ListAPIView):
+class TagListView(CatalogCacheMixin, generics.ListAPIView):
+    cache_scopes = (TAXONOMY,)
     queryset = ProductTag.objects.all()
     serializer_class = ProductTagSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
-class ProductListView(generics.ListAPIView):
+class UserStateMixin:
+    """
+    Listings called with ?annotate=user_state by a signed-in user carry
+    in_wishlist and cart_quantity for every product, read in the listing
+    query itself. Those responses are per user, so they skip the shared
+    catalog cache; anonymous requests ignore the parameter.
+    """
+
+    def wants_user_state(self):
+        annotations = self.request.query_params.get('annotate', '').split(',')
+        return 'user_state' in annotations and self.request.user.is_authenticated
+
+    def get_cache_scopes(self):
+        if self.wants_user_state():
+            return None
+        return super().get_cache_scopes()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.wants_user_state():
+            queryset = queryset.with_user_state(self.request.user)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.wants_user_state():
+            return ProductUserStateSerializer
+        return super().get_serializer_class()
+
+class ProductListView(UserStateMixin, CatalogCacheMixin, generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'description', 'collections__name']
     ordering_fields = ['price', 'created_at', 'name']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Product.objects.filter(is_active=True).prefetch_related('collections')
+        return Product.objects.filter(is_active=True).for_listing()
+
+VERSION_FIELDS = [
+    f'{relation}_{field}'
+    for relation in ('variants', 'images', 'faqs', 'tags', 'collections', 'collection_products')
+    for field in ('updated_at', 'count')
+]
 
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductDetailSerializer
     permission_classes = [permissions.AllowAny]
     lookup_field = 'slug'
 
-class CollectionProductsView(generics.ListAPIView):
+    def get_cache_scopes(self):
+        # One query reads the product's version; a missing product skips the cache
+        self.product_version = Product.objects.filter(
+            is_active=True, slug=self.kwargs['slug']
+        ).with_versions().values_list('pk', 'updated_at', 'rating_count', 'rating_sum', *VERSION_FIELDS).first()
+        if self.product_version is None:
+            return None
+        return (TAXONOMY, product_scope(self.product_version[0]))
+
+    def get_version(self, tokens):
+        # Rows only, so every process derives the same ETag; the taxonomy token
+        # still moves Last-Modified when collection counts change
+        return self.product_version
+
+class CollectionProductsView(UserStateMixin, CatalogCacheMixin, generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'description']
     ordering_fields = ['price', 'created_at', 'name']
     ordering = ['-created_at']
 
@@ -51,14 +104,13 @@ class CollectionProductsView(generics.ListAPIView):
         return Product.objects.filter(
             is_active=True,
             collections__slug=collection_slug
-        ).prefetch_related('collections')
+        ).for_listing()
 
-class TagProductsView(generics.ListAPIView):
+class TagProductsView(UserStateMixin, CatalogCacheMixin, generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'description']
     ordering_fields = ['price', 'created_at', 'name']
     ordering = ['-created_at']
 
@@ -69,7 +121,7 @@ class TagProductsView(generics.ListAPIView):
             return Product.objects.filter(
                 is_active=True,
                 tag_assignments__tag=tag
-            ).distinct().prefetch_related('collections')
+            ).distinct().for_listing()
         except ProductTag.DoesNotExist:
             return Product.objects.none()
 
@@ -80,27 +132,26 @@ class TagProductsView(generics.ListAPIView):
 
 
 
+class SearchResultsPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def search_products(request):
     query = request.GET.get('q', '')
     collection = request.GET.get('collection', '')
     
-    products = Product.objects.filter(is_active=True)
-    
-    if query:
-        products = products.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(collections__name__icontains=query)
-        )
-    
-    if collection:
-        products = products.filter(collections__slug=collection)
+    # Ranked IDs of active products come from the result cache; only the requested page is loaded
+    paginator = SearchResultsPagination()
+    result_ids, capped = search.cached_result_ids(query, collection)
+    page_ids = paginator.paginate_queryset(result_ids, request)
+    positions = {pk: position for position, pk in enumerate(page_ids)}
+    products = sorted(Product.objects.filter(pk__in=page_ids).for_listing(), key=lambda product: positions[product.pk])
     
     serializer = ProductListSerializer(products, many=True, context={'request': request})
-    return Response({
-        'results': serializer.data,
-        'count': products.count(),
-        'query': query
-    })
+    response = paginator.get_paginated_response(serializer.data)
+    response.data['query'] = query
+    # count stops at PRODUCT_SEARCH_MAX_RESULTS; this says when more products matched
+    response.data['count_capped'] = capped
+    return response
@@ -0,0 +1,47 @@
+"""
+Helpers for the benchmark management commands.
+
+Benchmarks run against a throwaway database created the same way the test
+runner creates one, so they never read or write real data.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def benchmark_database():
+    """Create a migrated scratch database for the duration of the block"""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat=20, warmup=2):
+    """Call func repeatedly and return timing statistics in milliseconds"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'max': timings[-1],
+    }
+
+
+def format_stats(label, stats):
+    return (
+        f"{label:<40} median {stats['median']:8.2f} ms   "
+        f"p95 {stats['p95']:8.2f} ms   min {stats['min']:8.2f} ms"
+    )
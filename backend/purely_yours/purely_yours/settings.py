@@ -13,6 +13,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
+
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -146,6 +149,58 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Caching
+# CACHE_BACKEND picks locmem (per process), file (shared on one host) or redis
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'purely-yours',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'purely-yours-cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+# Whether every process sees the same cache. Per-user data that other
+# processes would have to invalidate (cart totals, wishlists) is only cached
+# when it does; a locmem copy could stay stale in the other workers.
+SHARED_CACHE = CACHE_BACKEND != 'locmem'
+
+# Public catalog responses, see products/cache.py. Their generations are kept
+# in the database, so any backend serves fresh responses, locmem included.
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 600
+
+# Product search
+# Seconds a query's ranked result IDs stay cached. Off without a shared cache,
+# where reindexing a product could only retire the results of one process.
+PRODUCT_SEARCH_CACHE_TIMEOUT = 300 if SHARED_CACHE else 0
+PRODUCT_SEARCH_MAX_RESULTS = 1000
+
+STOCK_RESERVATION_TIMEOUT = 30 * 60  # Seconds an unpaid order holds its stock
+# Shipping and tax rules are reloaded when a save bumps their version in the
+# cache; a cache private to each process also needs a maximum age.
+PRICING_RULES_MAX_AGE = None if SHARED_CACHE else 60
+# Carts of visitors who are not signed in, see cart/guest.py. Use a shared
+# backend (file or redis) when running more than one process.
+GUEST_CART_CACHE_ALIAS = 'default'
+GUEST_CART_TIMEOUT = 7 * 24 * 60 * 60
+# Seconds a user's wishlisted product IDs stay cached. Off without a shared
+# cache: a change could only clear the copy of the process that made it, and
+# uncached the IDs are a single indexed query.
+WISHLIST_CACHE_TIMEOUT = 24 * 60 * 60 if SHARED_CACHE else 0
+ORDER_NUMBER_BLOCK_SIZE = 20  # Order numbers each process takes from the database at a time
+
 # JWT Configuration
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -186,6 +241,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ]
 CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins for development; restrict in production
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'x-cart-token')  # Guest cart token, see cart/guest.py
 
 
 
@@ -194,4 +250,22 @@ CASHFREE_CLIENT_ID = os.getenv('CASHFREE_CLIENT_ID', 'TEST10617785fa76d4d6c30e3a
 CASHFREE_CLIENT_SECRET = os.getenv('CASHFREE_CLIENT_SECRET', 'cfsk_ma_test_d81124315144a76ef75738d1938ee4e8_404a2e57')
 CASHFREE_API_VERSION = '2023-08-01'
 CASHFREE_BASE_URL = 'https://sandbox.cashfree.com/pg'  # Use https://api.cashfree.com/pg for production
-CASHFREE_MODE = 'sandbox'  # Change to 'production' for live environment
\ No newline at end of file
+CASHFREE_MODE = 'sandbox'  # Change to 'production' for live environment
+
+# Cashfree HTTP client, see payments/gateway.py
+CASHFREE_TIMEOUTS = {  # (connect, read) seconds per operation
+    'default': (3.05, 15),
+    'create_order': (3.05, 15),
+    'pay_order': (3.05, 30),
+    'submit_otp': (3.05, 30),
+    'get_order': (3.05, 10),
+}
+CASHFREE_POOL_SIZE = 10  # Keep-alive connections per process
+CASHFREE_MAX_RETRIES = 2  # Extra attempts for reads and for writes that never connected
+CASHFREE_RETRY_BACKOFF = 0.2  # Seconds; doubles per retry, with full jitter
+CASHFREE_RETRY_BACKOFF_CAP = 2
+CASHFREE_BREAKER_THRESHOLD = 5  # Consecutive failed calls that open the circuit
+CASHFREE_BREAKER_RESET = 30  # Seconds the circuit stays open before a trial call
+CASHFREE_VERIFY_WEBHOOKS = True  # Reject webhooks without a valid x-webhook-signature
+PAYMENT_STATUS_CACHE_TIMEOUT = 3  # Seconds a polled gateway status is reused, see payments/polling.py
+PAYMENT_STATUS_LOCK_TIMEOUT = 10  # Longest a poll waits for another one already asking the gateway
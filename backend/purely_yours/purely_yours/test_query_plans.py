@@ -0,0 +1,61 @@
+"""
+Checks that the hot queries behind the API views are served by indexes.
+
+Each entry builds the queryset a view runs. Its EXPLAIN QUERY PLAN must not
+contain a full table scan. Add new entries here when a view gains a filter
+that runs on every request.
+"""
+import re
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import OTP
+from consultations.models import Consultation, DoctorAvailability
+from orders.models import Order
+from payments.models import PaymentSession, PaymentWebhook
+from products.models import Collection, Product, ProductImage
+from reviews.models import ExternalReview
+
+# "SCAN table" with no index; "SCAN table USING [COVERING] INDEX" is fine
+FULL_SCAN_RE = re.compile(r'\bSCAN (\w+)(?: AS \w+)?$')
+
+HOT_QUERIES = {
+    'product list': lambda: Product.objects.filter(is_active=True).order_by('-created_at')[:20],
+    'product list count': lambda: Product.objects.filter(is_active=True).values('pk'),
+    'product list by price': lambda: Product.objects.filter(
+        is_active=True, price__gte=100, price__lte=500
+    ).order_by('price')[:20],
+    'collection products': lambda: Product.objects.filter(
+        is_active=True, collections__slug='wellness'
+    ).order_by('-created_at')[:20],
+    'collection product counts': lambda: Collection.objects.filter(is_active=True).with_product_counts(),
+    'primary images prefetch': lambda: ProductImage.objects.filter(is_primary=True, product_id__in=[1, 2, 3]),
+    'product reviews page': lambda: ExternalReview.objects.filter(product_id=1).order_by('-timestamp', '-id')[:20],
+    'review by author': lambda: ExternalReview.objects.filter(author='someone@example.com', product_id=1),
+    'order list page': lambda: Order.objects.filter(user_id=1).order_by('-created_at', '-id')[:20],
+    'otp verification': lambda: OTP.objects.filter(
+        mobile='9999999999', otp='123456', is_verified=False, expires_at__gt=timezone.now()
+    ),
+    'webhooks for order': lambda: PaymentWebhook.objects.filter(cashfree_order_id='order_1'),
+    'open payment sessions': lambda: PaymentSession.objects.filter(
+        payment_status__in=['created', 'pending', 'processing'], created_at__lt=timezone.now(), pk__gt=0
+    ).order_by('pk')[:200],
+    'pending webhooks': lambda: PaymentWebhook.objects.filter(
+        processed=False, attempts__lt=5, id__gt=0
+    ).order_by('id')[:100],
+    'user consultations': lambda: Consultation.objects.filter(user_id=1),
+    'doctor availability': lambda: DoctorAvailability.objects.filter(doctor_id=1, weekday=2),
+}
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plans are checked with SQLite EXPLAIN QUERY PLAN')
+class HotQueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        for label, build in HOT_QUERIES.items():
+            with self.subTest(label):
+                plan = build().explain()
+                scans = [line for line in plan.splitlines() if FULL_SCAN_RE.search(line.strip())]
+                self.assertEqual(scans, [], f'{label} scans a whole table:\n{plan}')
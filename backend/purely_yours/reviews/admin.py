@@ -64,10 +64,8 @@ class ReviewsSummaryAdmin(admin.ModelAdmin):
     
     def update_summaries(self, request, queryset):
         """Admin action to update selected review summaries"""
-        updated_count = 0
-        for summary in queryset:
-            summary.update_summary()
-            updated_count += 1
+        summaries = ReviewsSummary.refresh_summaries(queryset.values_list('product_id', flat=True))
+        updated_count = len(summaries)
         
         self.message_user(
             request,
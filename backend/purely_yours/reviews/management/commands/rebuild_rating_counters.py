@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from reviews.models import rebuild_product_rating_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored rating sum/count/average columns on products from external reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help='Limit the rebuild to these product IDs')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        product_ids = options['product_ids'] or None
+        updated = rebuild_product_rating_counters(product_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating counters for {updated} products'))
@@ -0,0 +1,35 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_rating_counters(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ExternalReview = apps.get_model('reviews', 'ExternalReview')
+
+    totals = {
+        row['product_id']: row
+        for row in ExternalReview.objects.order_by().values('product_id').annotate(
+            total=models.Sum('rating'),
+            count=models.Count('id'),
+        )
+    }
+    products = list(Product.objects.filter(pk__in=totals).only('id'))
+    for product in products:
+        row = totals[product.pk]
+        product.rating_sum = row['total']
+        product.rating_count = row['count']
+        product.rating_average = round(Decimal(row['total']) / row['count'], 2)
+    Product.objects.bulk_update(products, ['rating_sum', 'rating_count', 'rating_average'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_rating_counters'),
+        ('reviews', '0003_reviewssummary_externalreview_is_imported_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_related_updated_at'),
+        ('reviews', '0004_backfill_product_rating_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='externalreview',
+            index=models.Index(fields=['product', '-timestamp', '-id'], name='reviews_ext_product_01536c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='reviews_rev_user_id_2035ea_idx'),
+        ),
+    ]
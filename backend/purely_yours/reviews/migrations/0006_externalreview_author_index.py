@@ -0,0 +1,17 @@
+# Generated by Django 5.1.10 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='externalreview',
+            index=models.Index(fields=['author', 'product'], name='reviews_ext_author_1a0796_idx'),
+        ),
+    ]
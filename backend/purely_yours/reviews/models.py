@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from products import cache as catalog_cache
 from products.models import Product
+from django.utils import timezone
+from decimal import Decimal
 
 User = get_user_model()
 
@@ -20,6 +23,9 @@ class Review(models.Model):
     class Meta:
         unique_together = ['user', 'product']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.product.name} - {self.rating} stars"
@@ -56,6 +62,8 @@ class ExternalReview(models.Model):
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['product', 'rating']),
+            models.Index(fields=['product', '-timestamp', '-id']),
+            models.Index(fields=['author', 'product']),
             models.Index(fields=['verified_buyer']),
             models.Index(fields=['timestamp']),
         ]
@@ -63,6 +71,70 @@ class ExternalReview(models.Model):
     def __str__(self):
         return f"External Review: {self.author} - {self.product_title} - {self.rating} stars"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the product counters currently include for this row
+        if 'product_id' in instance.__dict__ and 'rating' in instance.__dict__:
+            instance._counted = (instance.product_id, instance.rating)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save the review and move its rating into the product counters in the same transaction"""
+        with transaction.atomic():
+            counted = None
+            if not self._state.adding:
+                counted = getattr(self, '_counted', None) or ExternalReview.objects.filter(
+                    pk=self.pk
+                ).values_list('product_id', 'rating').first()
+            super().save(*args, **kwargs)
+            if counted != (self.product_id, self.rating):
+                product_ids = [self.product_id]
+                if counted:
+                    Product.objects.filter(pk=counted[0]).adjust_rating_counters(-counted[1], -1)
+                    product_ids.append(counted[0])
+                Product.objects.filter(pk=self.product_id).adjust_rating_counters(self.rating, 1)
+                catalog_cache.invalidate_products(product_ids)
+        self._counted = (self.product_id, self.rating)
+
+
+def rebuild_product_rating_counters(product_ids=None, batch_size=500):
+    """
+    Recompute the stored rating columns on Product from ExternalReview with a
+    single grouped query, writing them back with bulk_update.
+    Returns the number of products updated.
+    """
+    reviews = ExternalReview.objects.all()
+    products = Product.objects.only('id', 'rating_sum', 'rating_count', 'rating_average').order_by('pk')
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+        products = products.filter(pk__in=product_ids)
+
+    totals = {
+        row['product_id']: row
+        for row in reviews.order_by().values('product_id').annotate(
+            total=models.Sum('rating'),
+            count=models.Count('id'),
+        )
+    }
+
+    updated = []
+    for product in products.iterator(chunk_size=batch_size):
+        row = totals.get(product.pk)
+        product.rating_sum = row['total'] if row else 0
+        product.rating_count = row['count'] if row else 0
+        product.rating_average = (
+            round(Decimal(product.rating_sum) / product.rating_count, 2) if product.rating_count else Decimal('0')
+        )
+        updated.append(product)
+
+    with transaction.atomic():
+        Product.objects.bulk_update(
+            updated, ['rating_sum', 'rating_count', 'rating_average'], batch_size=batch_size
+        )
+        catalog_cache.invalidate_products([product.pk for product in updated])
+    return len(updated)
+
 
 class ReviewsSummary(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='reviews_summary')
@@ -89,43 +161,86 @@ class ReviewsSummary(models.Model):
     def __str__(self):
         return f"External Reviews Summary for {self.product.name}: {self.total_reviews} reviews, {self.average_rating} avg"
     
-    def update_summary(self):
-        """Update summary statistics based on external reviews only"""
-        from django.db.models import Avg
-        
-        # Get only external reviews for this product
-        external_reviews = self.product.external_reviews.all()
-        
-        # Count total external reviews
-        self.total_reviews = external_reviews.count()
-        
+    STAR_FIELDS = ['one_star_count', 'two_star_count', 'three_star_count', 'four_star_count', 'five_star_count']
+    STAT_FIELDS = ['total_reviews', 'average_rating', *STAR_FIELDS, 'verified_buyers', 'verified_buyer_percentage']
+
+    @classmethod
+    def summary_aggregates(cls):
+        """Every summary statistic as one conditional aggregate over external reviews"""
+        aggregates = {
+            'total_reviews': models.Count('id'),
+            'average_rating': models.Avg('rating'),
+            'verified_buyers': models.Count('id', filter=models.Q(verified_buyer=True)),
+        }
+        for stars, field in enumerate(cls.STAR_FIELDS, start=1):
+            aggregates[field] = models.Count('id', filter=models.Q(rating=stars))
+        return aggregates
+
+    @classmethod
+    def totals_from_export(cls, data):
+        """Totals in the form summary_aggregates() gives, from a scraped reviews_summary export"""
+        distribution = data.get('rating_distribution', {})
+        totals = {
+            field: distribution.get(f'{stars}_star', 0) for stars, field in enumerate(cls.STAR_FIELDS, start=1)
+        }
+        totals['total_reviews'] = data.get('total_reviews', 0)
+        totals['average_rating'] = Decimal(str(data.get('average_rating', 0)))
+        totals['verified_buyers'] = data.get('verified_buyers', 0)
+        return totals
+
+    def apply_totals(self, totals):
+        """Copy aggregate results onto the summary without saving it"""
+        self.total_reviews = totals.get('total_reviews') or 0
+        for field in self.STAR_FIELDS + ['verified_buyers']:
+            setattr(self, field, totals.get(field) or 0)
         if self.total_reviews > 0:
-            # Calculate average rating from external reviews only
-            external_avg = external_reviews.aggregate(avg=Avg('rating'))['avg'] or 0
-            self.average_rating = external_avg
-            
-            # Calculate rating distribution from external reviews only
-            self.one_star_count = external_reviews.filter(rating=1).count()
-            self.two_star_count = external_reviews.filter(rating=2).count()
-            self.three_star_count = external_reviews.filter(rating=3).count()
-            self.four_star_count = external_reviews.filter(rating=4).count()
-            self.five_star_count = external_reviews.filter(rating=5).count()
-            
-            # Calculate verified buyers from external reviews only
-            self.verified_buyers = external_reviews.filter(verified_buyer=True).count()
-            self.verified_buyer_percentage = (self.verified_buyers / self.total_reviews) * 100
+            self.average_rating = round(Decimal(totals['average_rating']), 2)
+            self.verified_buyer_percentage = round(Decimal(self.verified_buyers * 100) / self.total_reviews, 2)
         else:
-            # No external reviews found
             self.average_rating = 0
-            self.one_star_count = 0
-            self.two_star_count = 0
-            self.three_star_count = 0
-            self.four_star_count = 0
-            self.five_star_count = 0
-            self.verified_buyers = 0
             self.verified_buyer_percentage = 0
-        
+
+    def update_summary(self):
+        """Update summary statistics based on external reviews only"""
+        self.apply_totals(self.product.external_reviews.aggregate(**self.summary_aggregates()))
         self.save()
+
+    @classmethod
+    def refresh_summaries(cls, product_ids, seeds=None):
+        """
+        Recompute the summaries of many products with one grouped query,
+        creating missing summaries and bulk updating the rest.
+        seeds maps product IDs to totals stored instead of the computed
+        ones, for imports that only bring some of a product's reviews.
+        Returns a dict of product ID to summary.
+        """
+        seeds = seeds or {}
+        product_ids = set(Product.objects.filter(pk__in=product_ids).order_by().values_list('pk', flat=True))
+        if not product_ids:
+            return {}
+
+        totals = {
+            row['product_id']: row
+            for row in ExternalReview.objects.filter(product_id__in=product_ids)
+            .order_by().values('product_id').annotate(**cls.summary_aggregates())
+        }
+        summaries = {summary.product_id: summary for summary in cls.objects.filter(product_id__in=product_ids)}
+        now = timezone.now()
+
+        existing = list(summaries.values())
+        created = [
+            cls(product_id=product_id) for product_id in product_ids if product_id not in summaries
+        ]
+        for summary in existing + created:
+            summary.apply_totals(seeds.get(summary.product_id) or totals.get(summary.product_id, {}))
+            summary.last_updated = now
+            summaries[summary.product_id] = summary
+
+        with transaction.atomic():
+            cls.objects.bulk_create(created, batch_size=500)
+            cls.objects.bulk_update(existing, cls.STAT_FIELDS + ['last_updated'], batch_size=500)
+            catalog_cache.invalidate(product_ids)
+        return summaries
     
     @property
     def rating_distribution(self):
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products import cache as catalog_cache
+from products.models import Product
+from .models import ExternalReview, ReviewsSummary
+
+
+@receiver(post_delete, sender=ExternalReview)
+def remove_rating_from_product(sender, instance, **kwargs):
+    """Runs inside the deletion transaction, including queryset deletes"""
+    product_id, rating = getattr(instance, '_counted', (instance.product_id, instance.rating))
+    Product.objects.filter(pk=product_id).adjust_rating_counters(-rating, -1)
+    catalog_cache.invalidate_products([product_id])
+
+
+@receiver(post_save, sender=ReviewsSummary)
+@receiver(post_delete, sender=ReviewsSummary)
+def invalidate_summary_responses(sender, instance, **kwargs):
+    catalog_cache.invalidate([instance.product_id])
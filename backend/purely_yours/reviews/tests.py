@@ -1,3 +1,189 @@
+import uuid
+from io import StringIO
+from decimal import Decimal
+
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Product
+from products.testing import make_product
+from .models import ExternalReview, ReviewsSummary
+
+
+def make_review(product, rating, **kwargs):
+    return ExternalReview.objects.create(
+        review_id=uuid.uuid4(), product=product, product_title=product.name, rating=rating,
+        author=kwargs.pop('author', 'someone@example.com'), timestamp=timezone.now(), body='', **kwargs
+    )
+
+
+class ProductRatingCounterTests(TestCase):
+    def setUp(self):
+        self.product = make_product('first')
+
+    def assertCounters(self, product, rating_sum, rating_count, rating_average):
+        product.refresh_from_db()
+        self.assertEqual(
+            (product.rating_sum, product.rating_count, product.rating_average),
+            (rating_sum, rating_count, Decimal(rating_average))
+        )
+
+    def test_create_update_and_delete_keep_counters_current(self):
+        review = make_review(self.product, 5)
+        make_review(self.product, 2)
+        self.assertCounters(self.product, 7, 2, '3.50')
+
+        review.rating = 3
+        review.save()
+        self.assertCounters(self.product, 5, 2, '2.50')
+
+        review.delete()
+        self.assertCounters(self.product, 2, 1, '2.00')
+
+        ExternalReview.objects.all().delete()
+        self.assertCounters(self.product, 0, 0, '0.00')
+
+    def test_moving_a_review_updates_both_products(self):
+        other = make_product('second')
+        review = make_review(self.product, 4)
+
+        review = ExternalReview.objects.get(pk=review.pk)
+        review.product = other
+        review.save()
+
+        self.assertCounters(self.product, 0, 0, '0.00')
+        self.assertCounters(other, 4, 1, '4.00')
+
+    def test_saving_without_changes_does_not_double_count(self):
+        review = make_review(self.product, 4)
+        review.title = 'Edited'
+        review.save()
+        ExternalReview.objects.get(pk=review.pk).save()
+        self.assertCounters(self.product, 4, 1, '4.00')
+
+    def test_rebuild_command_recomputes_from_reviews(self):
+        make_review(self.product, 5)
+        make_review(self.product, 4)
+        make_review(self.product, 4)
+        empty = make_product('empty')
+        Product.objects.update(rating_sum=99, rating_count=99, rating_average=1)
+
+        call_command('rebuild_rating_counters', stdout=StringIO())
+
+        self.assertCounters(self.product, 13, 3, '4.33')
+        self.assertCounters(empty, 0, 0, '0.00')
+
+
+class ReviewsSummaryTests(TestCase):
+    def setUp(self):
+        self.product = make_product('summary')
+        for rating, verified in [(5, True), (5, False), (4, True), (1, False)]:
+            make_review(self.product, rating, verified_buyer=verified)
+
+    def assertSummary(self, summary):
+        self.assertEqual(summary.total_reviews, 4)
+        self.assertEqual(summary.average_rating, Decimal('3.75'))
+        self.assertEqual(summary.rating_distribution, {
+            '1_star': 1, '2_star': 0, '3_star': 0, '4_star': 1, '5_star': 2,
+        })
+        self.assertEqual(summary.verified_buyers, 2)
+        self.assertEqual(summary.verified_buyer_percentage, Decimal('50.00'))
+
+    def test_update_summary_runs_one_aggregate_query(self):
+        summary = ReviewsSummary.objects.create(product=self.product)
+        with self.assertNumQueries(2):
+            summary.update_summary()
+        summary.refresh_from_db()
+        self.assertSummary(summary)
+
+    def test_refresh_summaries_is_constant_in_product_count(self):
+        ReviewsSummary.objects.create(product=self.product)
+        others = [make_product(f'other-{i}') for i in range(5)]
+        for product in others:
+            make_review(product, 3)
+
+        with self.assertNumQueries(7):
+            summaries = ReviewsSummary.refresh_summaries([self.product.id] + [p.id for p in others])
+
+        self.assertEqual(len(summaries), 6)
+        self.assertSummary(ReviewsSummary.objects.get(product=self.product))
+        self.assertEqual(ReviewsSummary.objects.get(product=others[0]).average_rating, Decimal('3.00'))
+
+    def test_refresh_summaries_can_store_seeded_totals(self):
+        other = make_product('other')
+        make_review(other, 3)
+        seeds = {self.product.id: ReviewsSummary.totals_from_export({
+            'total_reviews': 40, 'average_rating': 4.6, 'verified_buyers': 30,
+            'rating_distribution': {'1_star': 1, '2_star': 0, '3_star': 2, '4_star': 8, '5_star': 29},
+        })}
+        summaries = ReviewsSummary.refresh_summaries([self.product.id, other.id], seeds=seeds)
+
+        seeded = ReviewsSummary.objects.get(product=self.product)
+        self.assertEqual((seeded.total_reviews, seeded.average_rating), (40, Decimal('4.60')))
+        self.assertEqual(seeded.rating_distribution['5_star'], 29)
+        self.assertEqual(seeded.verified_buyer_percentage, Decimal('75.00'))
+        self.assertEqual(summaries[other.id].total_reviews, 1)
+
+    def test_refresh_summaries_zeroes_products_without_reviews(self):
+        empty = make_product('empty')
+        summary = ReviewsSummary.refresh_summaries([empty.id])[empty.id]
+        self.assertEqual((summary.total_reviews, summary.average_rating), (0, 0))
+
+
+class ProductReviewsPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.product = make_product('oil')
+        now = timezone.now()
+        # Pairs of reviews share a timestamp so the id tiebreaker matters
+        for i in range(25):
+            review = make_review(self.product, 5)
+            review.timestamp = now - timedelta(minutes=i // 2)
+            review.save()
+        self.url = f'/api/reviews/product/{self.product.id}/'
+        self.expected = list(
+            ExternalReview.objects.order_by('-timestamp', '-id').values_list('review_id', flat=True)
+        )
+
+    def ids(self, response):
+        return [uuid.UUID(str(review['review_id'])) for review in response.data['results']]
+
+    def test_cursor_walks_every_review_once_in_both_directions(self):
+        response = self.client.get(self.url, {'page_size': 10})
+        self.assertEqual(response.data['count'], 25)
+        self.assertIsNone(response.data['previous'])
+        pages = [response]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response)
+        self.assertEqual(sum((self.ids(page) for page in pages), []), self.expected)
+
+        back = self.client.get(pages[-1].data['previous'])
+        self.assertEqual(self.ids(back), self.ids(pages[1]))
+        back = self.client.get(back.data['previous'])
+        self.assertEqual(self.ids(back), self.ids(pages[0]))
+        self.assertIsNone(back.data['previous'])
+
+    def test_count_can_be_skipped(self):
+        with CaptureQueriesContext(connection) as counted:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as uncounted:
+            response = self.client.get(self.url, {'count': 'false'})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(uncounted), len(counted) - 1)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in uncounted.captured_queries))
+
+    def test_page_numbers_still_work(self):
+        response = self.client.get(self.url, {'page': 2, 'page_size': 10})
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(self.ids(response), self.expected[10:20])
 
-# Create your tests here.
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
@@ -2,13 +2,17 @@ from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from .models import Review, ReviewHelpful, ExternalReview, ReviewsSummary
 from .serializers import ReviewSerializer, CreateReviewSerializer, ExternalReviewSerializer
 from products.models import Product
+from purely_yours.pagination import KeysetPagination
 
 class ProductReviewsView(generics.ListAPIView):
     serializer_class = ExternalReviewSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
         product_id = self.kwargs['product_id']
@@ -33,40 +37,40 @@ def create_review(request, product_id):
         )
         
         if serializer.is_valid():
-            review = serializer.save()
-            
-            # Update corresponding ExternalReview
-            external_review = ExternalReview.objects.filter(
-                author=request.user.email,
-                product=product
-            ).first()
-            
-            if external_review:
-                external_review.rating = review.rating
-                external_review.title = review.title
-                external_review.body = review.comment
-                external_review.timestamp = timezone.now()
-                external_review.save()
-            else:
-                # Create new ExternalReview
-                ExternalReview.objects.create(
-                    review_id=uuid.uuid4(),
-                    product=product,
-                    verified_buyer=review.is_verified_purchase,
-                    product_title=product.name,
-                    product_url=f"/products/{product.id}",
-                    rating=review.rating,
+            with transaction.atomic():
+                review = serializer.save()
+                
+                # Update corresponding ExternalReview
+                external_review = ExternalReview.objects.filter(
                     author=request.user.email,
-                    timestamp=timezone.now(),
-                    title=review.title,
-                    body=review.comment,
-                    source='internal',
-                    is_imported=False
-                )
-            
-            # Update reviews summary
-            summary, created = ReviewsSummary.objects.get_or_create(product=product)
-            summary.update_summary()
+                    product=product
+                ).first()
+                
+                if external_review:
+                    external_review.rating = review.rating
+                    external_review.title = review.title
+                    external_review.body = review.comment
+                    external_review.timestamp = timezone.now()
+                    external_review.save()
+                else:
+                    # Create new ExternalReview
+                    ExternalReview.objects.create(
+                        review_id=uuid.uuid4(),
+                        product=product,
+                        verified_buyer=review.is_verified_purchase,
+                        product_title=product.name,
+                        product_url=f"/products/{product.id}",
+                        rating=review.rating,
+                        author=request.user.email,
+                        timestamp=timezone.now(),
+                        title=review.title,
+                        body=review.comment,
+                        source='internal',
+                        is_imported=False
+                    )
+                
+                # Update reviews summary
+                ReviewsSummary.refresh_summaries([product.id])
             
             return Response({
                 'success': True,
@@ -86,27 +90,27 @@ def create_review(request, product_id):
     )
     
     if serializer.is_valid():
-        review = serializer.save()
-        
-        # Also create ExternalReview
-        ExternalReview.objects.create(
-            review_id=uuid.uuid4(),
-            product=product,
-            verified_buyer=review.is_verified_purchase,
-            product_title=product.name,
-            product_url=f"/products/{product.id}",
-            rating=review.rating,
-            author=request.user.email,
-            timestamp=timezone.now(),
-            title=review.title,
-            body=review.comment,
-            source='internal',
-            is_imported=False
-        )
-        
-        # Update reviews summary
-        summary, created = ReviewsSummary.objects.get_or_create(product=product)
-        summary.update_summary()
+        with transaction.atomic():
+            review = serializer.save()
+            
+            # Also create ExternalReview
+            ExternalReview.objects.create(
+                review_id=uuid.uuid4(),
+                product=product,
+                verified_buyer=review.is_verified_purchase,
+                product_title=product.name,
+                product_url=f"/products/{product.id}",
+                rating=review.rating,
+                author=request.user.email,
+                timestamp=timezone.now(),
+                title=review.title,
+                body=review.comment,
+                source='internal',
+                is_imported=False
+            )
+            
+            # Update reviews summary
+            ReviewsSummary.refresh_summaries([product.id])
         
         return Response({
             'success': True,
@@ -148,6 +152,7 @@ def mark_review_helpful(request, review_id):
 class UserReviewsView(generics.ListAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Review.objects.filter(user=self.request.user)
@@ -167,37 +172,41 @@ def update_review(request, review_id):
     )
     
     if serializer.is_valid():
-        updated_review = serializer.save()
-        
-        # Update corresponding ExternalReview
-        external_review = ExternalReview.objects.filter(
-            author=request.user.email,
-            product=updated_review.product
-        ).first()
-        
-        if external_review:
-            external_review.rating = updated_review.rating
-            external_review.title = updated_review.title
-            external_review.body = updated_review.comment
-            external_review.timestamp = timezone.now()
-            external_review.verified_buyer = updated_review.is_verified_purchase
-            external_review.save()
-        else:
-            # Create new ExternalReview if doesn't exist
-            ExternalReview.objects.create(
-                review_id=uuid.uuid4(),
-                product=updated_review.product,
-                verified_buyer=updated_review.is_verified_purchase,
-                product_title=updated_review.product.name,
-                product_url=f"/products/{updated_review.product.id}",
-                rating=updated_review.rating,
+        with transaction.atomic():
+            updated_review = serializer.save()
+            
+            # Update corresponding ExternalReview
+            external_review = ExternalReview.objects.filter(
                 author=request.user.email,
-                timestamp=timezone.now(),
-                title=updated_review.title,
-                body=updated_review.comment,
-                source='internal',
-                is_imported=False
-            )
+                product=updated_review.product
+            ).first()
+            
+            if external_review:
+                external_review.rating = updated_review.rating
+                external_review.title = updated_review.title
+                external_review.body = updated_review.comment
+                external_review.timestamp = timezone.now()
+                external_review.verified_buyer = updated_review.is_verified_purchase
+                external_review.save()
+            else:
+                # Create new ExternalReview if doesn't exist
+                ExternalReview.objects.create(
+                    review_id=uuid.uuid4(),
+                    product=updated_review.product,
+                    verified_buyer=updated_review.is_verified_purchase,
+                    product_title=updated_review.product.name,
+                    product_url=f"/products/{updated_review.product.id}",
+                    rating=updated_review.rating,
+                    author=request.user.email,
+                    timestamp=timezone.now(),
+                    title=updated_review.title,
+                    body=updated_review.comment,
+                    source='internal',
+                    is_imported=False
+                )
+
+            # Update reviews summary
+            ReviewsSummary.refresh_summaries([updated_review.product_id])
         
         return Response({
             'success': True,
@@ -216,12 +225,10 @@ def update_review(request, review_id):
 def product_reviews_summary(request, product_id):
     product = get_object_or_404(Product, id=product_id, is_active=True)
     
-    # Get or create reviews summary
-    summary, created = ReviewsSummary.objects.get_or_create(product=product)
-    
-    # Update summary if it doesn't exist or if requested
-    if created or request.GET.get('refresh') == 'true':
-        summary.update_summary()
+    # Build the summary if it doesn't exist or if requested
+    summary = ReviewsSummary.objects.filter(product=product).first()
+    if summary is None or request.GET.get('refresh') == 'true':
+        summary = ReviewsSummary.refresh_summaries([product.id])[product.id]
     
     # Return summary data in the same format as your JSON
     return Response({
@@ -273,29 +273,11 @@ def create_product_from_json(json_data):
     
     print(f"✅ Created {created_reviews} external reviews")
     
-    # Create and update Reviews Summary
+    # Reviews Summary: the scraped totals also count reviews this import skipped
     reviews_summary_data = product_data.get('reviews_summary', {})
-    if reviews_summary_data:
-        summary, created = ReviewsSummary.objects.get_or_create(
-            product=product,
-            defaults={
-                'total_reviews': reviews_summary_data.get('total_reviews', 0),
-                'average_rating': Decimal(str(reviews_summary_data.get('average_rating', 0))),
-                'one_star_count': reviews_summary_data.get('rating_distribution', {}).get('1_star', 0),
-                'two_star_count': reviews_summary_data.get('rating_distribution', {}).get('2_star', 0),
-                'three_star_count': reviews_summary_data.get('rating_distribution', {}).get('3_star', 0),
-                'four_star_count': reviews_summary_data.get('rating_distribution', {}).get('4_star', 0),
-                'five_star_count': reviews_summary_data.get('rating_distribution', {}).get('5_star', 0),
-                'verified_buyers': reviews_summary_data.get('verified_buyers', 0),
-                'verified_buyer_percentage': Decimal(str(reviews_summary_data.get('verified_buyer_percentage', 0)))
-            }
-        )
-        
-        if not created:
-            # Update existing summary
-            summary.update_summary()
-        
-        print(f"📊 {'Created' if created else 'Updated'} reviews summary")
+    seeds = {product.id: ReviewsSummary.totals_from_export(reviews_summary_data)} if reviews_summary_data else None
+    ReviewsSummary.refresh_summaries([product.id], seeds=seeds)
+    print(f"📊 {'Seeded' if seeds else 'Updated'} reviews summary")
     
     # Print final summary
     print("🎉 Import completed successfully!")
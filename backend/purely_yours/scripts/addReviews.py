@@ -177,6 +177,7 @@ def fetch_and_upload_reviews():
     total_products = len(products_list)
     processed = 0
     total_reviews_created = 0
+    imported_product_ids = []
     
     for product_data in products_list:
         processed += 1
@@ -207,6 +208,7 @@ def fetch_and_upload_reviews():
         # Create reviews in database
         created_count = create_reviews_for_product(product, reviews_data)
         total_reviews_created += created_count
+        imported_product_ids.append(product.id)
         
         print(f"   ✅ Created {created_count} new reviews")
         
@@ -214,6 +216,10 @@ def fetch_and_upload_reviews():
         import time
         time.sleep(1)
     
+    # Recompute all touched summaries in one grouped query
+    summaries = ReviewsSummary.refresh_summaries(imported_product_ids)
+    print(f"\n📊 Updated {len(summaries)} reviews summaries")
+    
     print(f"\n🎉 Process completed!")
     print(f"   Products processed: {processed}")
     print(f"   Total reviews created: {total_reviews_created}")
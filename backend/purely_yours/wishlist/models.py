@@ -1,19 +1,73 @@
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
-from products.models import Product
+from products.models import Product, listing_prefetches
 
 User = get_user_model()
 
+PRODUCT_IDS_CACHE_PREFIX = 'wishlist:product_ids'
+OWNER_CACHE_PREFIX = 'wishlist:user_id'
+
+
+def product_ids_key(user_id):
+    return f'{PRODUCT_IDS_CACHE_PREFIX}:{user_id}'
+
+
+def wishlisted_product_ids(user_id):
+    """IDs of the products on the user's wishlist, cached until it changes when the cache is shared"""
+    timeout = settings.WISHLIST_CACHE_TIMEOUT
+    product_ids = cache.get(product_ids_key(user_id)) if timeout else None
+    if product_ids is None:
+        product_ids = sorted(
+            WishlistItem.objects.filter(wishlist__user_id=user_id).values_list('product_id', flat=True)
+        )
+        if timeout:
+            cache.set(product_ids_key(user_id), product_ids, timeout)
+    return product_ids
+
+
+def invalidate_product_ids(user_id):
+    if settings.WISHLIST_CACHE_TIMEOUT:
+        transaction.on_commit(lambda: cache.delete(product_ids_key(user_id)))
+
+
+def wishlist_user_id(wishlist_id):
+    """The owner of a wishlist, cached like the product IDs since it never changes"""
+    key = f'{OWNER_CACHE_PREFIX}:{wishlist_id}'
+    user_id = cache.get(key)
+    if user_id is None:
+        user_id = Wishlist.objects.filter(pk=wishlist_id).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            cache.set(key, user_id, settings.WISHLIST_CACHE_TIMEOUT)
+    return user_id
+
+class WishlistQuerySet(models.QuerySet):
+    def for_display(self):
+        """Wishlists with everything WishlistSerializer reads, in a fixed number of queries"""
+        return self.prefetch_related(
+            models.Prefetch(
+                'items',
+                queryset=WishlistItem.objects.select_related('product').prefetch_related(
+                    *listing_prefetches('product__')
+                )
+            )
+        )
+
 class Wishlist(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wishlist')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = WishlistQuerySet.as_manager()
+
     def __str__(self):
         return f"Wishlist for {self.user.email}"
 
     @property
     def total_items(self):
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return len(self.items.all())
         return self.items.count()
 
 class WishlistItem(models.Model):
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import WishlistItem, invalidate_product_ids, wishlist_user_id
+
+
+@receiver(post_save, sender=WishlistItem)
+@receiver(post_delete, sender=WishlistItem)
+def invalidate_wishlisted_product_ids(sender, instance, **kwargs):
+    if not settings.WISHLIST_CACHE_TIMEOUT:
+        return
+    # Items deleted by a cascade come without their wishlist; don't load it once per item
+    if WishlistItem.wishlist.is_cached(instance):
+        user_id = instance.wishlist.user_id
+    else:
+        user_id = wishlist_user_id(instance.wishlist_id)
+    if user_id is not None:
+        invalidate_product_ids(user_id)
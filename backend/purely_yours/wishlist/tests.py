@@ -1,3 +1,91 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from products.models import ProductImage
+from products.testing import make_product
+from .models import Wishlist, WishlistItem, wishlist_user_id, wishlisted_product_ids
+
+User = get_user_model()
+
+
+class WishlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.wishlist = Wishlist.objects.create(user=self.user)
+        self.products = []
+        for i in range(10):
+            product = make_product(f'product-{i}')
+            ProductImage.objects.create(product=product, image=f'products/product-{i}.webp', is_primary=True)
+            self.products.append(product)
+
+    def request(self, method, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_full_wishlist_query_count_is_constant(self):
+        WishlistItem.objects.create(wishlist=self.wishlist, product=self.products[0])
+        _, small = self.request('get', '/api/wishlist/')
+        for product in self.products[1:]:
+            WishlistItem.objects.create(wishlist=self.wishlist, product=product)
+        response, large = self.request('get', '/api/wishlist/')
+
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['total_items'], 10)
+        self.assertTrue(response.data['items'][0]['product']['primary_image'].endswith('.webp'))
+
+    @override_settings(WISHLIST_CACHE_TIMEOUT=3600)  # as with a shared cache backend
+    def test_product_ids_are_cached_until_the_wishlist_changes(self):
+        self.request('post', '/api/wishlist/add/', {'product_id': self.products[3].id})
+        response, _ = self.request('get', '/api/wishlist/ids/')
+        self.assertEqual(response.data['product_ids'], [self.products[3].id])
+        response, queries = self.request('get', '/api/wishlist/ids/')
+        self.assertEqual(queries, 0)
+
+        response, _ = self.request(
+            'post', '/api/wishlist/add/?response=compact', {'product_id': self.products[5].id}
+        )
+        self.assertEqual(response.data['item']['product_id'], self.products[5].id)
+        self.assertEqual(response.data['total_items'], 2)
+        self.assertNotIn('wishlist', response.data)
+
+        item = WishlistItem.objects.get(product=self.products[3])
+        response, _ = self.request('delete', f'/api/wishlist/remove/{item.id}/?response=compact')
+        self.assertEqual(response.data['removed_item_id'], item.id)
+        response, _ = self.request('get', '/api/wishlist/ids/')
+        self.assertEqual(response.data['product_ids'], [self.products[5].id])
+
+    @override_settings(WISHLIST_CACHE_TIMEOUT=3600)
+    def test_cascade_deletes_do_not_load_each_wishlist(self):
+        def delete_products(products):
+            WishlistItem.objects.bulk_create([WishlistItem(wishlist=self.wishlist, product=p) for p in products])
+            wishlisted_product_ids(self.user.pk)
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+                WishlistItem.objects.filter(product__in=products).delete()
+            self.assertEqual(wishlisted_product_ids(self.user.pk), [])
+            return len(ctx.captured_queries)
+
+        few = delete_products(self.products[:2])
+        self.assertLessEqual(delete_products(self.products[2:]), few)
+
+    def test_product_ids_are_not_cached_without_a_shared_cache(self):
+        wishlisted_product_ids(self.user.pk)
+        WishlistItem.objects.bulk_create([WishlistItem(wishlist=self.wishlist, product=self.products[0])])
+        self.assertEqual(wishlisted_product_ids(self.user.pk), [self.products[0].id])
+
+    @override_settings(WISHLIST_CACHE_TIMEOUT=3600)
+    def test_wishlist_owners_are_kept_in_the_cache(self):
+        self.assertEqual(wishlist_user_id(self.wishlist.pk), self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(wishlist_user_id(self.wishlist.pk), self.user.pk)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(wishlist_user_id(self.wishlist.pk), self.user.pk)
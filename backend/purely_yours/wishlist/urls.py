@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.WishlistView.as_view(), name='wishlist'),
+    path('ids/', views.wishlist_product_ids, name='wishlist_product_ids'),
     path('add/', views.add_to_wishlist, name='add_to_wishlist'),
     path('remove/<int:item_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
     path('clear/', views.clear_wishlist, name='clear_wishlist'),
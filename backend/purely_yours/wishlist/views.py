@@ -2,18 +2,50 @@ from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from .models import Wishlist, WishlistItem
+from .models import Wishlist, WishlistItem, wishlisted_product_ids
 from .serializers import WishlistSerializer, AddToWishlistSerializer
 from products.models import Product
 
+def wishlist_response(request, wishlist, message, item=None, removed_item_id=None):
+    """
+    The whole wishlist by default. With ?response=compact, only the changed
+    item (or the id of the removed one) and the new item count.
+    """
+    if request.query_params.get('response') == 'compact':
+        data = {
+            'success': True,
+            'message': message,
+            'item': {'id': item.id, 'product_id': item.product_id} if item is not None else None,
+            'total_items': wishlist.items.count(),
+        }
+        if removed_item_id is not None:
+            data['removed_item_id'] = removed_item_id
+        return Response(data)
+
+    wishlist = Wishlist.objects.for_display().get(pk=wishlist.pk)
+    return Response({
+        'success': True,
+        'message': message,
+        'wishlist': WishlistSerializer(wishlist, context={'request': request}).data
+    })
+
 class WishlistView(generics.RetrieveAPIView):
     serializer_class = WishlistSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        wishlist, created = Wishlist.objects.get_or_create(user=self.request.user)
+        wishlist, created = Wishlist.objects.for_display().get_or_create(user=self.request.user)
         return wishlist
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def wishlist_product_ids(request):
+    """IDs of the wishlisted products, for drawing hearts on product grids"""
+    return Response({
+        'success': True,
+        'product_ids': wishlisted_product_ids(request.user.pk)
+    })
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def add_to_wishlist(request):
@@ -34,11 +66,7 @@ def add_to_wishlist(request):
         else:
             message = 'Item already in wishlist'
 
-        return Response({
-            'success': True,
-            'message': message,
-            'wishlist': WishlistSerializer(wishlist, context={'request': request}).data
-        })
+        return wishlist_response(request, wishlist, message, item=wishlist_item)
     
     return Response({
         'success': False,
@@ -49,18 +77,15 @@ def add_to_wishlist(request):
 @permission_classes([permissions.IsAuthenticated])
 def remove_from_wishlist(request, item_id):
     try:
-        wishlist_item = WishlistItem.objects.get(
+        wishlist_item = WishlistItem.objects.select_related('wishlist').get(
             id=item_id,
             wishlist__user=request.user
         )
         wishlist_item.delete()
         
-        wishlist = Wishlist.objects.get(user=request.user)
-        return Response({
-            'success': True,
-            'message': 'Item removed from wishlist',
-            'wishlist': WishlistSerializer(wishlist, context={'request': request}).data
-        })
+        return wishlist_response(
+            request, wishlist_item.wishlist, 'Item removed from wishlist', removed_item_id=item_id
+        )
         
     except WishlistItem.DoesNotExist:
         return Response({
@@ -75,11 +100,7 @@ def clear_wishlist(request):
         wishlist = Wishlist.objects.get(user=request.user)
         wishlist.items.all().delete()
         
-        return Response({
-            'success': True,
-            'message': 'Wishlist cleared successfully',
-            'wishlist': WishlistSerializer(wishlist, context={'request': request}).data
-        })
+        return wishlist_response(request, wishlist, 'Wishlist cleared successfully')
         
     except Wishlist.DoesNotExist:
         return Response({